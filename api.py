@@ -0,0 +1,341 @@
+"""
+API HTTP (somente leitura) de consulta tributária, para integração com outros sistemas.
+
+Uso:
+    uvicorn api:app --port 8600
+    python api.py
+"""
+from contextlib import asynccontextmanager
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from config.settings import DATA_FILE, DATA_VERSIONS_DIR, RELOAD_CONFIG, SEARCH_CONFIG
+from services.async_service import (
+    FILTER_KEYS, AsyncSearchService, RequestTimeoutError, ServiceOverloadedError,
+)
+from services.code_graph import KINDS
+from services.dataset_registry import UnknownVersionError
+from services.export_service import EXPORT_FORMATS, ExportCache
+from services.hot_reload import HotReloader
+from services.index_cache import index_cache_path
+from services.nbs_hits import narrow_item
+from services.search_service import SearchServiceEnhanced
+from services.service_factory import build_services
+
+
+# Configurações da API
+API_CONFIG = {
+    "max_concurrent": 8,
+    "max_pending": 64,
+    "thread_workers": 4,
+    "process_workers": 2,
+    "timeout_s": 10.0,
+    "max_results": 500,
+    # Classificação em lote: descrições por requisição e itens por descrição
+    "max_batch": 5000,
+    "max_top": 10,
+    # Cache de exportações (por ETag)
+    "export_cache_bytes": 64 * 1024 * 1024,
+}
+
+SEARCH_TYPES = ('contains', 'tokens', 'nbs', 'phonetic', 'ngram', 'fuzzy', 'exact', 'regex', 'boolean')
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse({'erro': message}, status_code=status)
+
+
+def _item_payload(item):
+    return {
+        'item_lc116': item.get('item_lc116', ''),
+        'descricao_item': item.get('descricao_item', ''),
+        'filtro_principal': item.get('filtro_principal', ''),
+        'subcategoria': item.get('subcategoria', ''),
+        'nbs_entries': item.get('nbs_entries', []),
+    }
+
+
+def _hit_payload(item, nbs_index, score):
+    return {
+        'item_lc116': item.get('item_lc116', ''),
+        'descricao_item': item.get('descricao_item', ''),
+        'pontuacao': round(score, 2),
+        'nbs': item['nbs_entries'][nbs_index],
+    }
+
+
+async def _run_search(request: Request, timeout_s=None):
+    """
+    Executa a busca descrita nos parâmetros; devolve (versão, itens, busca interrompida pelo
+    prazo da regex) ou a resposta de erro. Com tipo=nbs, os itens são os acertos (item,
+    índice da entrada NBS, pontuação).
+    """
+    params = request.query_params
+    search_type = params.get('tipo', 'contains')
+    if search_type not in SEARCH_TYPES:
+        return _error(400, f"Tipo de busca inválido: {search_type}")
+    query = params.get('q', '')
+    if search_type == 'boolean' and len(query) >= SEARCH_CONFIG["min_search_length"]:
+        query_error = SearchServiceEnhanced.validate_boolean(query)
+        if query_error:
+            return _error(400, f"Consulta avançada inválida: {query_error}")
+
+    service: AsyncSearchService = request.app.state.search
+    try:
+        if search_type == 'nbs':
+            version, hits = await service.search_nbs(
+                params.get('q', ''),
+                version=params.get('versao'),
+                use_synonyms=params.get('sinonimos', '1') not in ('0', 'false'),
+                filters={key: params.get(key) for key in FILTER_KEYS},
+                timeout_s=timeout_s,
+            )
+            return version, hits, False
+        return await service.search(
+            params.get('q', ''),
+            search_type=search_type,
+            version=params.get('versao'),
+            use_synonyms=params.get('sinonimos', '1') not in ('0', 'false'),
+            filters={key: params.get(key) for key in FILTER_KEYS},
+            timeout_s=timeout_s,
+        )
+    except UnknownVersionError as e:
+        return _error(404, str(e))
+    except ServiceOverloadedError as e:
+        return _error(429, str(e))
+    except RequestTimeoutError as e:
+        return _error(504, str(e))
+
+
+async def search(request: Request) -> JSONResponse:
+    """GET /api/busca?q=...&tipo=contains&versao=...&sinonimos=1&limite=50&pagina=1&<filtros>"""
+    params = request.query_params
+    try:
+        limit = min(int(params.get('limite', 50)), API_CONFIG['max_results'])
+        page = max(int(params.get('pagina', 1)), 1)
+        timeout_s = float(params['timeout']) if 'timeout' in params else None
+    except ValueError:
+        return _error(400, "Parâmetros 'limite', 'pagina' e 'timeout' devem ser numéricos")
+
+    outcome = await _run_search(request, timeout_s)
+    if isinstance(outcome, Response):
+        return outcome
+    version, results, truncated = outcome
+
+    page_results = results[(page - 1) * limit:page * limit]
+    # truncado: a regex esgotou o orçamento de tempo antes de verificar toda a base
+    payload = {'versao': version, 'total': len(results), 'pagina': page, 'truncado': truncated}
+    if params.get('tipo') == 'nbs':
+        # Acertos por entrada NBS: cada um leva só a sua entrada
+        payload['entradas'] = [_hit_payload(*hit) for hit in page_results]
+    else:
+        payload['itens'] = [_item_payload(item) for item in page_results]
+    if not results and params.get('tipo', 'contains') not in ('regex', 'phonetic', 'ngram', 'boolean'):
+        # Consulta com erro de digitação: correção pelo dicionário da base (submilissegundo)
+        registry, search_service = request.app.state.reloader.current.services
+        correction = search_service.correct_query(registry.get(version).items, params.get('q', ''))
+        if correction:
+            payload['voce_quis_dizer'] = correction
+    return JSONResponse(payload)
+
+
+async def export(request: Request) -> Response:
+    """GET /api/exportar?formato=csv&<mesmos parâmetros de /api/busca>  (aceita If-None-Match)"""
+    export_format = request.query_params.get('formato', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return _error(400, f"Formato inválido: {export_format} (use {', '.join(EXPORT_FORMATS)})")
+    outcome = await _run_search(request)
+    if isinstance(outcome, Response):
+        return outcome
+    version, results, _ = outcome
+
+    registry, search_service = request.app.state.reloader.current.services
+    record_hashes = registry.get(version).record_hashes
+    if request.query_params.get('tipo') == 'nbs':
+        # Só as entradas encontradas; itens reduzidos não usam os hashes do pool de registros
+        results = [narrow_item(item, nbs) for item, nbs, _ in results]
+        record_hashes = None
+    cache: ExportCache = request.app.state.exports
+    etag = cache.etag(export_format, results, record_hashes)
+    headers = {'ETag': etag, 'X-Versao': version}
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+
+    fmt = EXPORT_FORMATS[export_format]
+    blocks = cache.stream(export_format, results, search_service, etag)
+    service: AsyncSearchService = request.app.state.search
+    try:
+        # Uma admissão para a exportação inteira; os blocos são gerados no pool de threads
+        body = await service.open_stream(blocks)
+    except ServiceOverloadedError as e:
+        return _error(429, str(e))
+    except RequestTimeoutError as e:
+        return _error(504, str(e))
+
+    headers['Content-Disposition'] = f'attachment; filename="consulta_tributaria{fmt.extension}"'
+    return StreamingResponse(body, media_type=fmt.mime, headers=headers)
+
+
+async def classify(request: Request) -> JSONResponse:
+    """POST /api/classificar  {"descricoes": [...], "top": 3, "versao": ...}"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "Corpo deve ser um JSON")
+    descriptions = body.get('descricoes') if isinstance(body, dict) else None
+    if not isinstance(descriptions, list) or not all(isinstance(text, str) for text in descriptions):
+        return _error(400, "Informe 'descricoes' como uma lista de textos")
+    if len(descriptions) > API_CONFIG['max_batch']:
+        return _error(400, f"Máximo de {API_CONFIG['max_batch']} descrições por requisição")
+    try:
+        top_k = min(int(body.get('top', 3)), API_CONFIG['max_top'])
+    except (TypeError, ValueError):
+        return _error(400, "Parâmetro 'top' deve ser numérico")
+
+    registry, search_service = request.app.state.reloader.current.services
+    version = body.get('versao') or registry.default_version
+    if version not in registry.versions:
+        return _error(404, f"Versão não carregada: {version}")
+    try:
+        ranked = await request.app.state.search.offload(
+            search_service.classify_descriptions, registry.get(version).items, descriptions, top_k
+        )
+    except ServiceOverloadedError as e:
+        return _error(429, str(e))
+    except RequestTimeoutError as e:
+        return _error(504, str(e))
+    return JSONResponse({
+        'versao': version,
+        'resultados': [
+            {
+                'descricao': text,
+                'itens': [{**_item_payload(item), 'similaridade': round(score, 4)} for item, score in matches],
+            }
+            for text, matches in zip(descriptions, ranked)
+        ],
+    })
+
+
+async def related(request: Request) -> JSONResponse:
+    """GET /api/relacionados?tipo=nbs&codigo=1.1502.10.00&versao=...  (tipos: lc116, nbs, cclass, indop)"""
+    params = request.query_params
+    kind = params.get('tipo', 'nbs')
+    if kind not in KINDS:
+        return _error(400, f"Tipo de código inválido: {kind} (use {', '.join(KINDS)})")
+    code = params.get('codigo', '')
+    registry, search_service = request.app.state.reloader.current.services
+    version = params.get('versao') or registry.default_version
+    if version not in registry.versions:
+        return _error(404, f"Versão não carregada: {version}")
+    # Consultas O(grau) no grafo de códigos: atendidas direto, sem ir ao pool
+    items = registry.get(version).items
+    return JSONResponse({
+        'versao': version,
+        'tipo': kind,
+        'codigo': code,
+        'relacionados': search_service.related_codes(items, kind, code),
+        'itens_lc116': [item.get('item_lc116', '') for item in search_service.items_with_code(items, kind, code)],
+    })
+
+
+async def versions(request: Request) -> JSONResponse:
+    """GET /api/versoes"""
+    registry, _ = request.app.state.reloader.current.services
+    return JSONResponse({
+        'padrao': registry.default_version,
+        'versoes': [
+            {'versao': version, **registry.get(version).source_info}
+            for version in registry.versions
+        ],
+    })
+
+
+async def diff(request: Request) -> JSONResponse:
+    """GET /api/diff?de=V1.00.00&para=V1.01.00&nbs=1.1501,1.1502"""
+    registry, _ = request.app.state.reloader.current.services
+    params = request.query_params
+    old_version = params.get('de')
+    new_version = params.get('para', registry.default_version)
+    if old_version not in registry.versions or new_version not in registry.versions:
+        return _error(404, "Versão não carregada")
+    try:
+        result = await request.app.state.search.offload(registry.diff, old_version, new_version)
+    except ServiceOverloadedError as e:
+        return _error(429, str(e))
+    except RequestTimeoutError as e:
+        return _error(504, str(e))
+    if params.get('nbs'):
+        result = result.for_nbs_codes(params['nbs'].split(','))
+    return JSONResponse({
+        'de': old_version,
+        'para': new_version,
+        'resumo': result.summary(),
+        'alteracoes': result.to_rows(),
+    })
+
+
+async def status(request: Request) -> JSONResponse:
+    """GET /api/status: métricas de recarga e de atendimento"""
+    reloader: HotReloader = request.app.state.reloader
+    snapshot = reloader.current
+    return JSONResponse({
+        'geracao': snapshot.generation,
+        'carregada_em': snapshot.loaded_at.isoformat(timespec='seconds'),
+        'recarga': reloader.metrics.as_dict(),
+        'requisicoes': request.app.state.search.stats,
+        'exportacoes': request.app.state.exports.stats,
+    })
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    build = partial(
+        build_services,
+        DATA_FILE,
+        DATA_VERSIONS_DIR,
+        fuzzy_threshold=SEARCH_CONFIG["fuzzy_threshold"],
+        regex_time_budget_ms=SEARCH_CONFIG["regex_time_budget_ms"],
+        parallel_workers=SEARCH_CONFIG["parallel_workers"],
+        backend=SEARCH_CONFIG["backend"],
+    )
+    reloader = HotReloader(
+        build,
+        watched_paths=[DATA_FILE, index_cache_path(DATA_FILE), DATA_VERSIONS_DIR],
+        poll_interval_s=RELOAD_CONFIG["poll_interval_s"],
+    ).start()
+    app.state.reloader = reloader
+    app.state.exports = ExportCache(max_bytes=API_CONFIG["export_cache_bytes"])
+    app.state.search = AsyncSearchService(
+        reloader,
+        max_concurrent=API_CONFIG["max_concurrent"],
+        max_pending=API_CONFIG["max_pending"],
+        thread_workers=API_CONFIG["thread_workers"],
+        process_workers=API_CONFIG["process_workers"],
+        default_timeout_s=API_CONFIG["timeout_s"],
+    )
+    yield
+    app.state.search.shutdown()
+    reloader.stop()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/busca', search),
+        Route('/api/exportar', export),
+        Route('/api/classificar', classify, methods=['POST']),
+        Route('/api/relacionados', related),
+        Route('/api/versoes', versions),
+        Route('/api/diff', diff),
+        Route('/api/status', status),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8600)
@@ -13,32 +13,34 @@ Melhorias implementadas:
 - Ordenação de resultados
 """
 
+import time
 import streamlit as st
-import pandas as pd
-from pathlib import Path
-from io import BytesIO
+from functools import partial
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.table import Table, TableStyleInfo
 
 # Importar serviços
-from services.data_service import DataService
+from config.settings import DATA_FILE, DATA_VERSIONS_DIR, RELOAD_CONFIG, SEARCH_CONFIG
+from services.export_service import EXPORT_FORMATS, ExportCache
+from services.hot_reload import HotReloader
+from services.index_cache import index_cache_path
+from services.nbs_hits import narrow_item
+from services.service_factory import build_services
 from services.search_service import SearchServiceEnhanced, GRUPOS_LC116
 
 # =============================================================================
 # CONFIGURAÇÕES
 # =============================================================================
 
-# Caminhos
-DATA_FILE = Path(__file__).parent / "data" / "anexoVIII_correlacao_categorizado.json"
+# Fragmentos com rerun próprio (chaves de @st.fragment). Cada interação reexecuta só os
+# fragmentos que dependem do estado que ela altera; cabeçalho, CSS e sidebar não são reenviados.
+FRAGMENT_SEARCH = "busca"
+FRAGMENT_CATEGORIES = "categorias"
+FRAGMENT_FILTERS = "filtros"
+FRAGMENT_RESULTS = "resultados"
 
-# Configurações de busca
-SEARCH_CONFIG = {
-    "fuzzy_threshold": 65,
-    "min_search_length": 2,
-    "max_autocomplete": 8,
+SEARCH_TYPE_MAP = {
+    "Contém": "contains", "Palavras": "tokens", "Por NBS": "nbs", "Fonética": "phonetic", "Similaridade": "ngram",
+    "Aproximada (Fuzzy)": "fuzzy", "Exata": "exact", "Expressão Regular": "regex", "Avançada": "boolean",
 }
 
 
@@ -347,6 +349,17 @@ def configure_page():
             background: rgba(201, 169, 97, 0.15);
         }
 
+        .stButton > button[data-testid="stBaseButton-tertiary"] {
+            background: transparent !important;
+            border: none !important;
+            min-height: auto !important;
+            padding: 4px 10px !important;
+            justify-content: flex-start !important;
+            text-align: left !important;
+            transform: none !important;
+            box-shadow: none !important;
+        }
+
         .autocomplete-type {
             font-size: 10px;
             color: #c9a961;
@@ -529,87 +542,18 @@ CATEGORY_ICONS = {
 # FUNÇÕES DE EXPORTAÇÃO
 # =============================================================================
 
-def export_to_excel(results, search_term=None):
-    """Exporta resultados para Excel com formatação profissional."""
-    export_data = []
-    for item in results:
-        for nbs in item.get('nbs_entries', []):
-            classificacoes = nbs.get('cclasstrib', [])
-
-            if classificacoes:
-                class_info = classificacoes[0]
-                cod_class = class_info.get('codigo', '')
-                nome_class = class_info.get('nome', '')
-                class_completa = f"{cod_class} - {nome_class}"
-            else:
-                class_completa = "-"
-
-            export_data.append({
-                'Código LC116': item.get('item_lc116', ''),
-                'Descrição do Serviço': item.get('descricao_item', ''),
-                'Código NBS': nbs.get('nbs_code', ''),
-                'Descrição NBS': nbs.get('descricao_nbs', ''),
-                'Prestação Onerosa': 'Sim' if nbs.get('ps_onerosa') == 'S' else 'Não' if nbs.get('ps_onerosa') == 'N' else '-',
-                'Aquisição Exterior': 'Sim' if nbs.get('adq_exterior') == 'S' else 'Não' if nbs.get('adq_exterior') == 'N' else '-',
-                'INDOP': nbs.get('indop', '-'),
-                'Local Incidência IBS': nbs.get('local_incidencia_ibs', '-'),
-                'Classificação Tributária': class_completa,
-            })
-
-    if not export_data:
-        return None
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Consulta Tributária"
-
-    headers = list(export_data[0].keys())
-    ws.append(headers)
-
-    for row_data in export_data:
-        ws.append(list(row_data.values()))
-
-    header_fill = PatternFill(start_color="C9A961", end_color="C9A961", fill_type="solid")
-    header_font = Font(name='Calibri', size=11, bold=True, color="1A2332")
-    header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-    data_font = Font(name='Calibri', size=10)
-    data_alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
-
-    thin_border = Border(
-        left=Side(style='thin', color='C9A961'),
-        right=Side(style='thin', color='C9A961'),
-        top=Side(style='thin', color='C9A961'),
-        bottom=Side(style='thin', color='C9A961')
-    )
-
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=len(headers)):
-        for cell in row:
-            cell.font = data_font
-            cell.alignment = data_alignment
-            cell.border = thin_border
-
-    column_widths = {'A': 15, 'B': 50, 'C': 18, 'D': 50, 'E': 18, 'F': 18, 'G': 15, 'H': 40, 'I': 60}
-    for col_letter, width in column_widths.items():
-        ws.column_dimensions[col_letter].width = width
-
-    tab = Table(displayName="TabelaTributaria", ref=f"A1:{get_column_letter(len(headers))}{len(export_data)+1}")
-    style = TableStyleInfo(name="TableStyleMedium2", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-    tab.tableStyleInfo = style
-    ws.add_table(tab)
-
-    ws.freeze_panes = "A2"
+def export_results(results, export_format, data_service, search_service):
+    """
+    Exporta os resultados (Excel, CSV, JSONL ou Parquet), reaproveitando exportações
+    idênticas já geradas. Chamada só quando o usuário clica em exportar.
+    """
+    return get_export_cache().export(export_format, results, search_service, data_service.record_hashes)
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
 
-    return output.getvalue()
+def export_hits(hits, export_format, search_service):
+    """Exporta só as entradas NBS encontradas (itens reduzidos às entradas de cada acerto)."""
+    # Sem os hashes do pool: o conteúdo de um item reduzido não é o do registro completo
+    return get_export_cache().export(export_format, [narrow_item(item, nbs) for item, nbs, _ in hits], search_service)
 
 
 # =============================================================================
@@ -640,47 +584,142 @@ def render_search_hero(search_service, items):
 
     col1, col2, col3 = st.columns([1, 3, 1])
     with col2:
-        search_term = st.text_input(
-            "Busca",
-            placeholder="Ex: desenvolvimento de software, 1.01, consultoria, TI...",
-            label_visibility="collapsed",
-            key="main_search"
-        )
-
-        # Exibir sugestões de autocompletar
-        if search_term and len(search_term) >= 2:
-            suggestions = search_service.get_autocomplete_suggestions(items, search_term, max_suggestions=6)
-            if suggestions:
-                with st.expander(f"💡 {len(suggestions)} sugestões encontradas", expanded=True):
-                    for sug in suggestions:
-                        tipo_badge = f"<span style='font-size:10px;color:#c9a961;'>[{sug['tipo']}]</span>"
-                        st.markdown(f"{tipo_badge} {sug['texto']}", unsafe_allow_html=True)
+        render_search_box(search_service, items)
 
         # Opções de busca
         col_opt1, col_opt2, col_opt3 = st.columns([1, 1, 1])
         with col_opt1:
-            search_type = st.selectbox(
+            st.selectbox(
                 "Tipo de Busca",
-                ["Contém", "Aproximada (Fuzzy)", "Exata"],
+                list(SEARCH_TYPE_MAP),
                 label_visibility="collapsed",
                 key="search_type",
-                help="Contém: busca parcial | Aproximada: tolera erros de digitação | Exata: match preciso"
+                help="Contém: busca parcial | Palavras: todas as palavras, em qualquer ordem (início de palavra) | "
+                     "Por NBS: cada entrada NBS é um resultado, com pontuação própria | "
+                     "Fonética: palavras escritas como se fala (ex.: asesoria, ijiene) | "
+                     "Similaridade: descrições parecidas, em qualquer ordem e com palavras incompletas | "
+                     "Aproximada: tolera erros de digitação | Exata: match preciso | "
+                     "Expressão Regular: padrões como ^consult|assessoria | "
+                     "Avançada: E/OU/NÃO, \"frases\", curingas e campos, ex.: nbs:1.1502* -locação "
+                     "(campos: lc116, nbs, indop, local, cclass, categoria, subcategoria; "
+                     "nbs, indop, local e cclass ligados por E valem para a mesma entrada NBS)",
+                on_change=rerun_fragments, args=(FRAGMENT_RESULTS,)
             )
         with col_opt2:
-            use_synonyms = st.checkbox("🔗 Usar sinônimos", value=True, key="use_synonyms",
-                                       help="Expande a busca incluindo termos relacionados")
+            st.checkbox("🔗 Usar sinônimos", value=True, key="use_synonyms",
+                        help="Expande a busca incluindo termos relacionados",
+                        on_change=rerun_fragments, args=(FRAGMENT_RESULTS,))
         with col_opt3:
-            sort_option = st.selectbox(
+            st.selectbox(
                 "Ordenar por",
                 ["Relevância", "Código LC116", "Código NBS"],
                 label_visibility="collapsed",
-                key="sort_option"
+                key="sort_option",
+                on_change=rerun_fragments, args=(FRAGMENT_RESULTS,)
             )
 
-    type_map = {"Contém": "contains", "Aproximada (Fuzzy)": "fuzzy", "Exata": "exact"}
-    return search_term, type_map.get(search_type, "contains"), use_synonyms, sort_option
 
+def search_options():
+    """Consulta confirmada e opções de busca, lidas do estado da sessão."""
+    state = st.session_state
+    return (
+        state.get("search_query", ""),
+        SEARCH_TYPE_MAP.get(state.get("search_type"), "contains"),
+        state.get("use_synonyms", True),
+        state.get("sort_option", "Relevância"),
+    )
+
+
+def rerun_fragments(*keys):
+    """Callback de widget: reexecuta apenas os fragmentos que dependem do estado alterado."""
+    st.rerun(list(keys))
+
+
+def commit_search(query=None):
+    """Aplica a consulta digitada (ou uma sugestão) à busca principal."""
+    if query is not None:
+        st.session_state.main_search = query
+    st.session_state.search_query = st.session_state.get("main_search", "")
+    st.session_state.search_draft_at = None
+    rerun_fragments(FRAGMENT_SEARCH, FRAGMENT_RESULTS)
+
+
+@st.fragment(key=FRAGMENT_SEARCH)
+def render_search_box(search_service, items):
+    """
+    Campo de busca com autocompletar. A digitação só reexecuta este fragmento (sugestões);
+    a busca principal roda ao confirmar (botão ou sugestão) ou quando a digitação para
+    (watch_search_settle, que só existe enquanto há uma consulta digitada pendente).
+    """
+    state = st.session_state
+    draft = st.text_input(
+        "Busca",
+        placeholder="Ex: desenvolvimento de software, 1.01, consultoria, TI...",
+        label_visibility="collapsed",
+        key="main_search",
+        live=SEARCH_CONFIG["autocomplete_debounce"],
+    )
+    if draft != state.get("search_draft", ""):
+        state.search_draft = draft
+        # Voltou à consulta já aplicada: nada pendente
+        state.search_draft_at = time.monotonic() if draft != state.get("search_query", "") else None
+
+    col_sug, col_btn = st.columns([4, 1])
+    with col_btn:
+        st.button("🔍 Buscar", key="search_submit", type="primary", use_container_width=True,
+                  on_click=commit_search)
+    with col_sug:
+        # Exibir sugestões de autocompletar
+        if draft and len(draft) >= SEARCH_CONFIG["min_search_length"] and draft != state.get("search_query", ""):
+            suggestions = search_service.get_autocomplete_suggestions(
+                items, draft, max_suggestions=SEARCH_CONFIG["max_autocomplete"]
+            )
+            if suggestions:
+                with st.expander(f"💡 {len(suggestions)} sugestões encontradas", expanded=True):
+                    for i, sug in enumerate(suggestions):
+                        st.button(f"[{sug['tipo']}] {sug['texto']}", key=f"suggestion_{i}", type="tertiary",
+                                  on_click=commit_search, args=(sug['codigo'],))
 
+    # Fragmento aninhado: o navegador só consulta o servidor periodicamente enquanto ele é
+    # renderizado; sem consulta pendente, a próxima execução deste fragmento o remove
+    if state.get("search_draft_at") is not None:
+        watch_search_settle()
+
+
+@st.fragment(run_every=SEARCH_CONFIG["search_settle_s"])
+def watch_search_settle():
+    """
+    Aplica a consulta quando a digitação fica parada por `search_settle_s` (chamado por
+    render_search_box só enquanto há consulta pendente). O rerun por chave só é aceito em
+    callbacks, por isso este caminho reexecuta o app inteiro.
+    """
+    state = st.session_state
+    changed_at = state.get("search_draft_at")
+    if changed_at is None or time.monotonic() - changed_at < SEARCH_CONFIG["search_settle_s"]:
+        return
+    state.search_draft_at = None
+    if state.get("main_search", "") != state.get("search_query", ""):
+        state.search_query = state.main_search
+        st.rerun(scope="app")
+
+
+def select_categoria(cat):
+    """Callback: seleciona (ou desmarca) a categoria; None limpa a seleção."""
+    state = st.session_state
+    state.selected_categoria = None if state.get('selected_categoria') == cat else cat
+    state.selected_subcategoria = None
+    # O filtro de grupo da sidebar depende da categoria selecionada
+    rerun_fragments(FRAGMENT_CATEGORIES, FRAGMENT_FILTERS, FRAGMENT_RESULTS)
+
+
+def select_subcategoria(sub):
+    """Callback: seleciona (ou desmarca) a subcategoria; None mostra todas."""
+    state = st.session_state
+    state.selected_subcategoria = None if state.get('selected_subcategoria') == sub else sub
+    rerun_fragments(FRAGMENT_CATEGORIES, FRAGMENT_RESULTS)
+
+
+@st.fragment(key=FRAGMENT_CATEGORIES)
 def render_category_grid(items, search_service):
     """Renderiza o grid de categorias clicáveis."""
     if 'selected_categoria' not in st.session_state:
@@ -700,10 +739,8 @@ def render_category_grid(items, search_service):
     if st.session_state.selected_categoria:
         col_clear = st.columns([1, 2, 1])[1]
         with col_clear:
-            if st.button("🔄 Limpar Seleção de Categoria", use_container_width=True, key="clear_cat"):
-                st.session_state.selected_categoria = None
-                st.session_state.selected_subcategoria = None
-                st.rerun()
+            st.button("🔄 Limpar Seleção de Categoria", use_container_width=True, key="clear_cat",
+                      on_click=select_categoria, args=(None,))
 
     categorias = sorted(CATEGORY_ICONS.keys())
     outros_key = "16. OUTROS SERVIÇOS"
@@ -724,17 +761,10 @@ def render_category_grid(items, search_service):
                 cat_name = cat.split(". ", 1)[1] if ". " in cat else cat
                 btn_label = f"{icon} {cat_name}\n({count} itens)"
 
-                if st.button(btn_label, key=f"cat_{cat}", use_container_width=True,
-                            type="primary" if is_selected else "secondary"):
-                    if st.session_state.selected_categoria == cat:
-                        st.session_state.selected_categoria = None
-                        st.session_state.selected_subcategoria = None
-                    else:
-                        st.session_state.selected_categoria = cat
-                        st.session_state.selected_subcategoria = None
-                    st.rerun()
-
-    selected_subcategoria = None
+                st.button(btn_label, key=f"cat_{cat}", use_container_width=True,
+                          type="primary" if is_selected else "secondary",
+                          on_click=select_categoria, args=(cat,))
+
     if st.session_state.selected_categoria:
         st.markdown("---")
         cat_display = st.session_state.selected_categoria.split(". ", 1)[1] if ". " in st.session_state.selected_categoria else st.session_state.selected_categoria
@@ -754,10 +784,9 @@ def render_category_grid(items, search_service):
             col_all = st.columns([1, 2, 1])[1]
             with col_all:
                 total = sum(sub_counts.values())
-                if st.button(f"📋 Todas as Subcategorias ({total})", key="sub_all", use_container_width=True,
-                            type="primary" if st.session_state.selected_subcategoria is None else "secondary"):
-                    st.session_state.selected_subcategoria = None
-                    st.rerun()
+                st.button(f"📋 Todas as Subcategorias ({total})", key="sub_all", use_container_width=True,
+                          type="primary" if st.session_state.selected_subcategoria is None else "secondary",
+                          on_click=select_subcategoria, args=(None,))
 
             num_sub_cols = 3
             sub_rows = [subcategorias[i:i+num_sub_cols] for i in range(0, len(subcategorias), num_sub_cols)]
@@ -768,17 +797,9 @@ def render_category_grid(items, search_service):
                     with sub_cols[idx]:
                         count = sub_counts.get(sub, 0)
                         is_sel = st.session_state.selected_subcategoria == sub
-                        if st.button(f"📂 {sub} ({count})", key=f"sub_{sub}", use_container_width=True,
-                                    type="primary" if is_sel else "secondary"):
-                            if st.session_state.selected_subcategoria == sub:
-                                st.session_state.selected_subcategoria = None
-                            else:
-                                st.session_state.selected_subcategoria = sub
-                            st.rerun()
-
-            selected_subcategoria = st.session_state.selected_subcategoria
-
-    return st.session_state.selected_categoria, selected_subcategoria
+                        st.button(f"📂 {sub} ({count})", key=f"sub_{sub}", use_container_width=True,
+                                  type="primary" if is_sel else "secondary",
+                                  on_click=select_subcategoria, args=(sub,))
 
 
 def render_tributacao_badge(codigo: str, search_service: SearchServiceEnhanced) -> str:
@@ -791,8 +812,39 @@ def render_tributacao_badge(codigo: str, search_service: SearchServiceEnhanced)
     """
 
 
-def render_detailed_view(results, search_service, search_term=None):
-    """Renderiza visualização detalhada com cards expandíveis e destaque de busca."""
+def render_related_codes(graph, lc116, nbs):
+    """Painel de códigos relacionados de uma entrada NBS (vizinhos no grafo de códigos)."""
+    nbs_code = nbs.get('nbs_code', '')
+    lines = []
+    outros_itens = [code for code in graph.neighbors('nbs', nbs_code, 'lc116') if code != lc116]
+    if outros_itens:
+        codes = ', '.join(f"<span class='code-mono'>{code}</span>" for code in outros_itens[:12])
+        extra = f" e mais {len(outros_itens) - 12}" if len(outros_itens) > 12 else ""
+        lines.append(f"NBS <span class='code-mono'>{nbs_code}</span> também em LC116 {codes}{extra}")
+    for class_info in nbs.get('cclasstrib', []):
+        codigo = class_info.get('codigo', '')
+        if codigo:
+            lines.append(
+                f"cClassTrib <span class='code-mono'>{codigo}</span>: "
+                f"{graph.degree('cclass', codigo, 'nbs')} NBS em {graph.degree('cclass', codigo, 'lc116')} itens LC116"
+            )
+    if indop := nbs.get('indop'):
+        lines.append(f"INDOP <span class='code-mono'>{indop}</span>: {graph.degree('indop', indop, 'nbs')} NBS")
+    if not lines:
+        return
+    st.markdown(f"""
+    <div style='margin-top: 10px; padding: 10px; background: rgba(26, 35, 50, 0.4); border-radius: 6px;'>
+        <div style='color: #c9a961; font-weight: 700; font-size: 13px; margin-bottom: 6px;'>🔗 Códigos relacionados</div>
+        <div style='color: #b0b8c1; font-size: 12px; line-height: 1.7;'>{'<br>'.join(lines)}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+def render_detailed_view(results, search_service, search_term=None, graph=None):
+    """
+    Renderiza visualização detalhada com cards expandíveis e destaque de busca.
+    Com o grafo de códigos da base, cada entrada NBS mostra os códigos relacionados.
+    """
     st.markdown("""
     <div class='info-box'>
         <div class='info-box-title'>📋 Visualização Detalhada</div>
@@ -814,15 +866,22 @@ def render_detailed_view(results, search_service, search_term=None):
     </div>
     """, unsafe_allow_html=True)
 
-    for item in results:
+    # Posições do termo em cada texto, pelo array de sufixos (None = procurar no texto)
+    matches = search_service.match_positions(results, search_term) if search_term else None
+
+    for i, item in enumerate(results):
         lc116 = item.get('item_lc116', '')
         desc_servico = item.get('descricao_item', '')
         nbs_entries = item.get('nbs_entries', [])
+        item_matches = matches[i] if matches is not None else None
 
         # Aplicar destaque de busca se houver termo
         desc_display = desc_servico
         if search_term:
-            desc_display = search_service.highlight_text(desc_servico, search_term, "#FFEB3B")
+            desc_display = search_service.highlight_text(
+                desc_servico, search_term, "#FFEB3B",
+                positions=item_matches.get(('descricao_item', -1), []) if item_matches is not None else None
+            )
 
         with st.expander(f"**{lc116}** - {desc_servico[:80]}...", expanded=False):
             st.markdown(f"""
@@ -845,7 +904,10 @@ def render_detailed_view(results, search_service, search_term=None):
                 
                 # Destaque na descrição NBS
                 if search_term:
-                    nbs_desc = search_service.highlight_text(nbs_desc, search_term, "#FFEB3B")
+                    nbs_desc = search_service.highlight_text(
+                        nbs_desc, search_term, "#FFEB3B",
+                        positions=item_matches.get(('descricao_nbs', idx - 1), []) if item_matches is not None else None
+                    )
 
                 # Badges de classificação
                 badges_html = ""
@@ -931,6 +993,9 @@ def render_detailed_view(results, search_service, search_term=None):
 
                     st.markdown("</div>", unsafe_allow_html=True)
 
+                if graph is not None:
+                    render_related_codes(graph, lc116, nbs)
+
                 st.markdown("</div>", unsafe_allow_html=True)
 
 
@@ -954,120 +1019,160 @@ def render_results_table(results, data_service, search_service, search_term=None
         st.markdown(f'<div class="results-info">{len(results)} serviços, {total_nbs} entradas NBS encontradas</div>', unsafe_allow_html=True)
 
     with col2:
-        excel_data = export_to_excel(results, search_term)
-        if excel_data:
-            filename = f"consulta_tributaria_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        if total_nbs:
+            export_format = st.selectbox(
+                "Formato de exportação",
+                options=list(EXPORT_FORMATS),
+                format_func=lambda key: EXPORT_FORMATS[key].label,
+                key="export_format",
+                label_visibility="collapsed",
+            )
+            fmt = EXPORT_FORMATS[export_format]
+            filename = f"consulta_tributaria_{datetime.now().strftime('%Y%m%d_%H%M%S')}{fmt.extension}"
+            # Geração adiada: o arquivo só é montado no clique, não a cada interação
             st.download_button(
-                label="📊 Exportar Excel",
-                data=excel_data,
+                label=f"📊 Exportar {fmt.label}",
+                data=partial(export_results, results, export_format, data_service, search_service),
                 file_name=filename,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                mime=fmt.mime,
                 use_container_width=True
             )
 
     st.markdown("<br>", unsafe_allow_html=True)
 
-    # Ordenação
-    if sort_option == "Código LC116":
-        results = sorted(results, key=lambda x: x.get('item_lc116', ''))
-    elif sort_option == "Código NBS":
-        results = sorted(results, key=lambda x: x.get('nbs_entries', [{}])[0].get('nbs_code', '') if x.get('nbs_entries') else '')
-
-    # Preparar dados para DataFrame
-    table_data = []
-    for item in results:
-        for nbs in item.get('nbs_entries', []):
-            classificacoes = nbs.get('cclasstrib', [])
-
-            if classificacoes:
-                class_info = classificacoes[0]
-                class_display = class_info.get('codigo', '')
-                class_nome = class_info.get('nome', '')
-                info_didatica = search_service.get_classificacao_didatica(class_display)
-                tipo_trib = f"{info_didatica['icone']} {info_didatica['categoria']}"
-            else:
-                class_display = "-"
-                class_nome = "-"
-                tipo_trib = "-"
-
-            desc_servico = item.get('descricao_item', '')
-            if len(desc_servico) > 50:
-                desc_servico = desc_servico[:50] + '...'
-
-            desc_nbs_text = nbs.get('descricao_nbs', '')
-            if len(desc_nbs_text) > 50:
-                desc_nbs_text = desc_nbs_text[:50] + '...'
-
-            prest_onerosa = nbs.get('ps_onerosa', '')
-            prest_onerosa_display = '✅' if prest_onerosa == 'S' else '❌' if prest_onerosa == 'N' else '➖'
-
-            aquis_ext = nbs.get('adq_exterior', '')
-            aquis_ext_display = '✅' if aquis_ext == 'S' else '❌' if aquis_ext == 'N' else '➖'
-
-            local_incid = nbs.get('local_incidencia_ibs', '')
-            if len(local_incid) > 35:
-                local_incid = local_incid[:35] + '...'
-
-            table_data.append({
-                'LC116': item.get("item_lc116", ""),
-                'Serviço': desc_servico,
-                'NBS': nbs.get("nbs_code", ""),
-                'Desc. NBS': desc_nbs_text,
-                'Onerosa': prest_onerosa_display,
-                'Exterior': aquis_ext_display,
-                'cClassTrib': class_display,
-                'Tipo Trib.': tipo_trib,
-                'Local IBS': local_incid,
-            })
-
-    if table_data:
-        df = pd.DataFrame(table_data)
-
-        # Tabs para visualização
-        tab1, tab2 = st.tabs(["📊 Tabela Completa", "📋 Visualização Detalhada"])
+    # Ordenação natural (chaves numéricas pré-calculadas: 2.01 antes de 10.01)
+    sort_by = {"Código LC116": "lc116", "Código NBS": "nbs"}.get(sort_option)
+    if sort_by:
+        results = data_service.nbs_table.sort_items(results, sort_by)
+
+    # Linhas pré-formatadas da tabela plana (take vetorizado por posição)
+    df = data_service.nbs_table.take_items(results)
+
+    if not df.empty:
+        # Tabs para visualização; só a aba aberta é montada (trocar de aba reexecuta o fragmento)
+        tab1, tab2 = st.tabs(["📊 Tabela Completa", "📋 Visualização Detalhada"], key="results_tab", on_change="rerun")
+
+        if tab1.open:
+            with tab1:
+                st.dataframe(
+                    df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "LC116": st.column_config.TextColumn("LC116", width="small"),
+                        "Serviço": st.column_config.TextColumn("Serviço", width="medium"),
+                        "NBS": st.column_config.TextColumn("NBS", width="medium"),
+                        "Desc. NBS": st.column_config.TextColumn("Desc. NBS", width="medium"),
+                        "Onerosa": st.column_config.TextColumn("Onerosa", width="small"),
+                        "Exterior": st.column_config.TextColumn("Exterior", width="small"),
+                        "cClassTrib": st.column_config.TextColumn("cClassTrib", width="small"),
+                        "Tipo Trib.": st.column_config.TextColumn("Tipo Trib.", width="medium"),
+                        "Local IBS": st.column_config.TextColumn("Local IBS", width="medium"),
+                    },
+                    height=600
+                )
+
+        if tab2.open:
+            with tab2:
+                render_detailed_view(results, search_service, search_term, search_service.code_graph(data_service.items))
+
+
+def render_hits_table(hits, data_service, search_service, search_term=None, sort_option="Relevância"):
+    """Renderiza os acertos por entrada NBS, uma página por vez."""
+    if not hits:
+        render_results_table([], data_service, search_service)
+        return
+
+    page_size = SEARCH_CONFIG["nbs_page_size"]
+    pages = (len(hits) + page_size - 1) // page_size
+    services_count = len({id(item) for item, _, _ in hits})
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.markdown('<div class="section-title">Resultados da Busca</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="results-info">{len(hits)} entradas NBS encontradas, em {services_count} serviços</div>', unsafe_allow_html=True)
+
+    with col2:
+        export_format = st.selectbox(
+            "Formato de exportação",
+            options=list(EXPORT_FORMATS),
+            format_func=lambda key: EXPORT_FORMATS[key].label,
+            key="export_format",
+            label_visibility="collapsed",
+        )
+        fmt = EXPORT_FORMATS[export_format]
+        filename = f"consulta_tributaria_nbs_{datetime.now().strftime('%Y%m%d_%H%M%S')}{fmt.extension}"
+        st.download_button(
+            label=f"📊 Exportar {fmt.label}",
+            data=partial(export_hits, hits, export_format, search_service),
+            file_name=filename,
+            mime=fmt.mime,
+            use_container_width=True
+        )
+
+    sort_by = {"Código LC116": "lc116", "Código NBS": "nbs"}.get(sort_option)
+    if sort_by:
+        hits = data_service.nbs_table.sort_hits(hits, sort_by)
+
+    # Página fora do intervalo (o resultado diminuiu): volta para a primeira
+    if not 1 <= st.session_state.get("nbs_page", 1) <= pages:
+        st.session_state.nbs_page = 1
+    page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, key="nbs_page")
+    page_hits = hits[(page - 1) * page_size:page * page_size]
 
+    tab1, tab2 = st.tabs(["📊 Tabela", "📋 Visualização Detalhada"], key="results_tab", on_change="rerun")
+    if tab1.open:
         with tab1:
-            st.dataframe(
-                df,
-                use_container_width=True,
-                hide_index=True,
-                column_config={
-                    "LC116": st.column_config.TextColumn("LC116", width="small"),
-                    "Serviço": st.column_config.TextColumn("Serviço", width="medium"),
-                    "NBS": st.column_config.TextColumn("NBS", width="medium"),
-                    "Desc. NBS": st.column_config.TextColumn("Desc. NBS", width="medium"),
-                    "Onerosa": st.column_config.TextColumn("Onerosa", width="small"),
-                    "Exterior": st.column_config.TextColumn("Exterior", width="small"),
-                    "cClassTrib": st.column_config.TextColumn("cClassTrib", width="small"),
-                    "Tipo Trib.": st.column_config.TextColumn("Tipo Trib.", width="medium"),
-                    "Local IBS": st.column_config.TextColumn("Local IBS", width="medium"),
-                },
-                height=600
-            )
+            df = data_service.nbs_table.take_hits(page_hits)
+            df.insert(0, "Relevância", [round(score) for _, _, score in page_hits])
+            st.dataframe(df, use_container_width=True, hide_index=True)
 
+    if tab2.open:
         with tab2:
-            render_detailed_view(results, search_service, search_term)
+            render_detailed_view(
+                [narrow_item(item, nbs) for item, nbs, _ in page_hits], search_service, search_term,
+                search_service.code_graph(data_service.items)
+            )
+
+
+def render_nbs_hits(search_service, data_service, query, search_term, use_synonyms, filters, sort_option):
+    """Busca por entrada NBS (filtros aplicados por entrada) e tabela paginada dos acertos."""
+    items = data_service.items
+    hits = search_service.search_nbs(items, query, use_synonyms, filters)
 
+    correction = search_service.correct_query(items, query) if query else None
+    if correction and not hits:
+        corrected_hits = search_service.search_nbs(items, correction, use_synonyms, filters)
+        if corrected_hits:
+            st.info(f"Nenhum resultado para '{search_term}'. Mostrando resultados para **{correction}**.")
+            hits, search_term = corrected_hits, correction
+    elif correction:
+        st.button(f"🔤 Você quis dizer: {correction}", key="search_correction", type="tertiary",
+                  on_click=commit_search, args=(correction,))
+    st.session_state.pop("search_refinement", None)
 
-def render_sidebar_filters(data_service, search_service, items, selected_categoria=None):
-    """Renderiza filtros avançados na sidebar com descrições didáticas."""
+    render_hits_table(hits, data_service, search_service, search_term, sort_option)
+
+
+@st.fragment(key=FRAGMENT_FILTERS)
+def render_sidebar_filters(data_service, search_service, items):
+    """Renderiza filtros avançados na sidebar com descrições didáticas (chamar dentro de `st.sidebar`)."""
     filters = data_service.filters
+    selected_categoria = st.session_state.get('selected_categoria')
+    # Cada filtro reexecuta este fragmento e o dos resultados
+    on_change = dict(on_change=rerun_fragments, args=(FRAGMENT_FILTERS, FRAGMENT_RESULTS))
 
-    st.sidebar.markdown("## ⚙️ Filtros Avançados")
+    st.markdown("## ⚙️ Filtros Avançados")
 
     # Botão limpar
-    if st.sidebar.button("🔄 Limpar Todos os Filtros", use_container_width=True):
-        for key in list(st.session_state.keys()):
-            if key.startswith('filtro_') or key.startswith('selected_'):
-                del st.session_state[key]
-        st.rerun()
+    st.button("🔄 Limpar Todos os Filtros", use_container_width=True, on_click=clear_filters)
 
-    st.sidebar.markdown("---")
+    st.markdown("---")
 
     # ========================================
     # FILTRO DIDÁTICO: Tipo de Tributação
     # ========================================
-    st.sidebar.markdown("""
+    st.markdown("""
     <div class="filter-card">
         <div class="filter-card-title">🏛️ Tipo de Tributação</div>
         <div class="filter-description">
@@ -1079,11 +1184,12 @@ def render_sidebar_filters(data_service, search_service, items, selected_categor
     tipos_trib = search_service.get_tipos_tributacao_disponiveis(items)
     opcoes_trib = ["Todos"] + [t['nome'] for t in tipos_trib]
     
-    tipo_trib_selected = st.sidebar.selectbox(
+    tipo_trib_selected = st.selectbox(
         "Tipo de Tributação",
         opcoes_trib,
         key="filtro_tipo_tributacao",
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        **on_change
     )
     selected_tipo_trib = None if tipo_trib_selected == "Todos" else tipo_trib_selected
 
@@ -1091,15 +1197,15 @@ def render_sidebar_filters(data_service, search_service, items, selected_categor
     if selected_tipo_trib:
         for t in tipos_trib:
             if t['nome'] == selected_tipo_trib:
-                st.sidebar.info(f"{t['icone']} {t['descricao']}")
+                st.info(f"{t['icone']} {t['descricao']}")
                 break
 
-    st.sidebar.markdown("---")
+    st.markdown("---")
 
     # ========================================
     # FILTRO: Grupo LC116
     # ========================================
-    st.sidebar.markdown("""
+    st.markdown("""
     <div class="filter-card">
         <div class="filter-card-title">📂 Grupo de Serviços (LC 116)</div>
         <div class="filter-description">
@@ -1110,98 +1216,96 @@ def render_sidebar_filters(data_service, search_service, items, selected_categor
 
     # Se uma categoria está selecionada, desabilitar este filtro para evitar conflitos
     if selected_categoria:
-        st.sidebar.info("⚠️ Filtro de grupo desabilitado quando uma categoria está selecionada.")
-        selected_grupo = None
+        st.info("⚠️ Filtro de grupo desabilitado quando uma categoria está selecionada.")
     else:
         grupos_lc116 = search_service.get_grupos_lc116_disponiveis(items)
         opcoes_grupos = ["Todos"] + [g['display'] for g in grupos_lc116]
         
-        grupo_selected = st.sidebar.selectbox(
+        st.selectbox(
             "Grupo LC116",
             opcoes_grupos,
             key="filtro_grupo_lc116",
-            label_visibility="collapsed"
+            label_visibility="collapsed",
+            **on_change
         )
-        selected_grupo = None if grupo_selected == "Todos" else grupo_selected.split(' - ')[0]
 
-    st.sidebar.markdown("---")
+    st.markdown("---")
 
     # ========================================
     # FILTRO: Prestação Onerosa
     # ========================================
-    with st.sidebar.expander("💰 Prestação Onerosa", expanded=False):
+    with st.expander("💰 Prestação Onerosa", expanded=False):
         st.markdown("""
         <div class="filter-description">
             Indica se o serviço é prestado mediante pagamento.
         </div>
         """, unsafe_allow_html=True)
-        onerosa = st.radio(
+        st.radio(
             "Selecione",
             ["Todas", "S", "N"],
             format_func=lambda x: {"Todas": "📋 Todas", "S": "✅ Sim (Onerosa)", "N": "❌ Não (Gratuita)"}.get(x, x),
             key="filtro_onerosa",
             horizontal=True,
-            label_visibility="collapsed"
+            label_visibility="collapsed",
+            **on_change
         )
-    selected_onerosa = None if onerosa == "Todas" else onerosa
 
     # ========================================
     # FILTRO: Aquisição Exterior
     # ========================================
-    with st.sidebar.expander("🌍 Aquisição Exterior", expanded=False):
+    with st.expander("🌍 Aquisição Exterior", expanded=False):
         st.markdown("""
         <div class="filter-description">
             Indica se o serviço pode envolver importação (aquisição do exterior).
         </div>
         """, unsafe_allow_html=True)
-        exterior = st.radio(
+        st.radio(
             "Selecione",
             ["Todas", "S", "N"],
             format_func=lambda x: {"Todas": "📋 Todas", "S": "✅ Sim (Importação)", "N": "❌ Não"}.get(x, x),
             key="filtro_exterior",
             horizontal=True,
-            label_visibility="collapsed"
+            label_visibility="collapsed",
+            **on_change
         )
-    selected_exterior = None if exterior == "Todas" else exterior
 
     # ========================================
     # FILTRO: Local de Incidência
     # ========================================
-    with st.sidebar.expander("📍 Local de Incidência do IBS", expanded=False):
+    with st.expander("📍 Local de Incidência do IBS", expanded=False):
         st.markdown("""
         <div class="filter-description">
             Define onde o imposto é devido: no destino (local do tomador) ou origem (local do prestador).
         </div>
         """, unsafe_allow_html=True)
         locais = ["Todos"] + filters.get('local_incidencia', [])
-        local = st.selectbox("Selecione", locais, key="filtro_local", label_visibility="collapsed")
-    selected_local = None if local == "Todos" else local
+        st.selectbox("Selecione", locais, key="filtro_local", label_visibility="collapsed", **on_change)
 
     # ========================================
     # FILTRO: Classificação Tributária Específica
     # ========================================
-    with st.sidebar.expander("🔢 Classificação Tributária (cClassTrib)", expanded=False):
+    with st.expander("🔢 Classificação Tributária (cClassTrib)", expanded=False):
         st.markdown("""
         <div class="filter-description">
             Filtre por código específico de classificação tributária.
         </div>
         """, unsafe_allow_html=True)
         classificacoes = ["Todas"] + filters.get('classificacoes_tributarias', [])
-        classificacao = st.selectbox("Selecione", classificacoes, key="filtro_classificacao", label_visibility="collapsed")
-    selected_classificacao = None if classificacao == "Todas" else classificacao
+        st.selectbox("Selecione", classificacoes, key="filtro_classificacao", label_visibility="collapsed",
+                     **on_change)
 
-    st.sidebar.markdown("---")
+    st.markdown("---")
 
     # Links úteis
-    st.sidebar.markdown("### 📚 Legislação e Documentação")
-    st.sidebar.markdown("""
+    st.markdown("### 📚 Legislação e Documentação")
+    st.markdown("""
     - [LC 116/2003](https://www.planalto.gov.br/ccivil_03/leis/lcp/lcp116.htm)
     - [Receita Federal](https://www.gov.br/receitafederal)
     - [Reforma Tributária](https://www.gov.br/fazenda/pt-br/assuntos/reforma-tributaria)
     """)
 
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("""
+    st.markdown("---")
+    st.markdown("""
     <div style="text-align: center; color: #8892a0; font-size: 11px;">
         <strong>Neto Contabilidade</strong><br>
         Fonte: AnexoVIII Correlação v1.00<br>
@@ -1209,77 +1313,267 @@ def render_sidebar_filters(data_service, search_service, items, selected_categor
     </div>
     """, unsafe_allow_html=True)
 
+
+def clear_filters():
+    """Callback: limpa os filtros da sidebar e a seleção de categoria."""
+    for key in list(st.session_state.keys()):
+        if key.startswith('filtro_') or key.startswith('selected_'):
+            del st.session_state[key]
+    rerun_fragments(FRAGMENT_FILTERS, FRAGMENT_CATEGORIES, FRAGMENT_RESULTS)
+
+
+def current_filters():
+    """Filtros ativos (categoria e sidebar), lidos do estado da sessão; "Todos/Todas" = sem filtro."""
+    state = st.session_state
+
+    def chosen(key, all_label):
+        value = state.get(key, all_label)
+        return None if value == all_label else value
+
+    categoria = state.get('selected_categoria')
+    # O filtro de grupo fica desabilitado quando uma categoria está selecionada
+    grupo = None if categoria else chosen('filtro_grupo_lc116', "Todos")
     return {
-        'ps_onerosa': selected_onerosa,
-        'adq_exterior': selected_exterior,
-        'local_incidencia': selected_local,
-        'cclasstrib_filter': selected_classificacao,
-        'tipo_tributacao': selected_tipo_trib,
-        'grupo_lc116': selected_grupo,
+        'filtro_principal': categoria,
+        'subcategoria': state.get('selected_subcategoria') if categoria else None,
+        'ps_onerosa': chosen('filtro_onerosa', "Todas"),
+        'adq_exterior': chosen('filtro_exterior', "Todas"),
+        'local_incidencia': chosen('filtro_local', "Todos"),
+        'cclasstrib_filter': chosen('filtro_classificacao', "Todas"),
+        'tipo_tributacao': chosen('filtro_tipo_tributacao', "Todos"),
+        'grupo_lc116': grupo.split(' - ')[0] if grupo else None,
     }
 
 
+
+
 # =============================================================================
 # FUNÇÃO PRINCIPAL
 # =============================================================================
 
+@st.cache_resource(show_spinner="Carregando base de dados e índices de busca...")
+def get_reloader():
+    """Snapshot de serviços do processo, recarregado em segundo plano quando os dados mudam."""
+    build = partial(
+        build_services,
+        DATA_FILE,
+        DATA_VERSIONS_DIR,
+        fuzzy_threshold=SEARCH_CONFIG["fuzzy_threshold"],
+        regex_time_budget_ms=SEARCH_CONFIG["regex_time_budget_ms"],
+        parallel_workers=SEARCH_CONFIG["parallel_workers"],
+        backend=SEARCH_CONFIG["backend"],
+    )
+    reloader = HotReloader(
+        build,
+        watched_paths=[DATA_FILE, index_cache_path(DATA_FILE), DATA_VERSIONS_DIR],
+        poll_interval_s=RELOAD_CONFIG["poll_interval_s"],
+    )
+    return reloader.start()
+
+
+@st.cache_resource
+def get_export_cache():
+    """Exportações recentes (por ETag), compartilhadas entre as sessões."""
+    return ExportCache()
+
+
+def render_reload_status(reloader):
+    """Informa na sidebar quando a base foi carregada e quanto durou a última recarga."""
+    snapshot = reloader.current
+    metrics = reloader.metrics.as_dict()
+    status = f"🕒 Base carregada em {snapshot.loaded_at:%d/%m/%Y %H:%M}"
+    if metrics['ultima_duracao_ms'] is not None:
+        status += f" ({metrics['ultima_duracao_ms']:.0f} ms)"
+    st.sidebar.caption(status)
+    if metrics['ultimo_erro']:
+        st.sidebar.warning(f"⚠️ Última recarga falhou; mantida a base anterior. {metrics['ultimo_erro']}")
+
+
+def render_version_selector(registry):
+    """Seletor da versão da base (exibido apenas com mais de uma versão carregada)."""
+    versions = registry.versions
+    if len(versions) < 2:
+        return registry.default_version
+
+    st.sidebar.markdown("## 🗂️ Versão da Base")
+    version = st.sidebar.selectbox(
+        "Versão da base",
+        versions,
+        index=versions.index(registry.default_version),
+        key="dataset_version",
+        label_visibility="collapsed",
+        help="Consulte versões diferentes do AnexoVIII durante períodos de transição"
+    )
+    st.sidebar.markdown("---")
+    return version
+
+
+def refinement_candidates(search_service, scope, query, search_type, use_synonyms):
+    """
+    Resultado anterior da sessão (posições) quando a consulta atual o refina:
+    mesmo contexto (base, tipo, sinônimos e filtros) e consulta estendida.
+    """
+    previous = st.session_state.get("search_refinement")
+    if not previous or previous["scope"] != scope:
+        return None
+    if not search_service.can_refine(previous["query"], query, search_type, use_synonyms):
+        return None
+    return previous["positions"]
+
+
+def remember_results(search_service, scope, query, items, results):
+    """Guarda na sessão as posições do resultado para refinamentos seguintes."""
+    index = search_service.get_index(items)
+    positions = index.positions_of(results) if index is not None and query else None
+    if positions is None:
+        st.session_state.pop("search_refinement", None)
+        return
+    st.session_state["search_refinement"] = {"scope": scope, "query": query, "positions": positions}
+
+
+@st.fragment(key=FRAGMENT_RESULTS)
+def render_results(snapshot, version):
+    """
+    Busca, filtros e resultados. Depende só da consulta confirmada, das opções de busca
+    e dos filtros no estado da sessão; é o único trecho recalculado quando um deles muda.
+    """
+    registry, search_service = snapshot.services
+    data_service = registry.get(version)
+    items = data_service.items
+    search_term, search_type, use_synonyms, sort_option = search_options()
+
+    # Busca e filtros: o planejador escolhe a ordem mais barata (mesmo resultado)
+    query = ""
+    if search_term and len(search_term) >= SEARCH_CONFIG["min_search_length"]:
+        query = search_term
+        if search_type == "regex":
+            regex_error = search_service.validate_regex(search_term)
+            if regex_error:
+                st.warning(f"⚠️ {regex_error} Buscando o texto literalmente.")
+        elif search_type == "boolean":
+            query_error = search_service.validate_boolean(search_term)
+            if query_error:
+                st.warning(f"⚠️ Consulta avançada inválida: {query_error}")
+
+    filters = current_filters()
+    if search_type == "nbs":
+        render_nbs_hits(search_service, data_service, query, search_term, use_synonyms, filters, sort_option)
+        return
+
+    # Mesmo contexto da consulta anterior: a refinada pode reaproveitar os resultados dela
+    refinement_scope = (snapshot.generation, version, search_type, use_synonyms, tuple(sorted(filters.items())))
+    plan = search_service.plan_query(
+        items,
+        query,
+        search_type=search_type,
+        use_synonyms=use_synonyms,
+        filters=filters,
+        candidates=refinement_candidates(search_service, refinement_scope, query, search_type, use_synonyms),
+    )
+    results = search_service.execute_plan(plan)
+    if plan.truncated:
+        st.warning("⏱️ A expressão regular excedeu o tempo de busca: os resultados podem estar incompletos. "
+                   "Use um padrão mais específico.")
+
+    # Erro de digitação: sem resultados, busca pela consulta corrigida; com resultados, só sugere
+    correction = None
+    if query and search_type not in ("regex", "phonetic", "ngram", "boolean"):
+        correction = search_service.correct_query(items, query)
+    if correction and not results:
+        corrected_plan = search_service.plan_query(
+            items, correction, search_type=search_type, use_synonyms=use_synonyms, filters=filters
+        )
+        corrected_results = search_service.execute_plan(corrected_plan)
+        if corrected_results:
+            st.info(f"Nenhum resultado para '{search_term}'. Mostrando resultados para **{correction}**.")
+            plan, results, query, search_term = corrected_plan, corrected_results, correction, correction
+    elif correction:
+        st.button(f"🔤 Você quis dizer: {correction}", key="search_correction", type="tertiary",
+                  on_click=commit_search, args=(correction,))
+    remember_results(search_service, refinement_scope, query, items, results)
+
+    # Depuração: ?explicar=1 na URL mostra o plano escolhido
+    if st.query_params.get("explicar"):
+        with st.expander("🧭 Plano da consulta"):
+            st.code(plan.explain(), language=None)
+
+    # Tabela de resultados
+    render_results_table(results, data_service, search_service, search_term, sort_option)
+
+
+@st.fragment
+def render_version_diff(registry, selected_version):
+    """Mostra o que mudou entre duas versões, opcionalmente só para alguns códigos NBS."""
+    versions = registry.versions
+    if len(versions) < 2:
+        return
+
+    with st.expander("🔄 Alterações entre versões", expanded=False):
+        col1, col2 = st.columns(2)
+        others = [v for v in versions if v != selected_version]
+        with col1:
+            old_version = st.selectbox("Versão anterior", others, key="diff_old_version")
+        with col2:
+            st.markdown(f"**Versão atual:** {selected_version}")
+        codes = st.text_input(
+            "Meus códigos NBS",
+            placeholder="Ex: 1.1501, 1.1502.10.00 (vazio = todas as alterações)",
+            key="diff_nbs_codes"
+        )
+
+        diff = registry.diff(old_version, selected_version)
+        if codes.strip():
+            diff = diff.for_nbs_codes(codes.split(','))
+
+        summary = diff.summary()
+        cols = st.columns(len(summary))
+        labels = ["NBS adicionadas", "NBS removidas", "NBS alteradas", "cClassTrib incluídos", "cClassTrib excluídos"]
+        for col, label, value in zip(cols, labels, summary.values()):
+            col.metric(label, value)
+
+        if diff.is_empty:
+            st.info("Nenhuma alteração encontrada.")
+        else:
+            st.dataframe(diff.to_rows(), use_container_width=True, hide_index=True)
+
+
 def main():
     """Função principal da aplicação."""
     configure_page()
     render_header()
 
-    # Inicializa serviços
-    data_service = DataService(DATA_FILE)
-    search_service = SearchServiceEnhanced(fuzzy_threshold=SEARCH_CONFIG["fuzzy_threshold"])
-
-    # Carrega dados
-    if not data_service.load_data():
+    # Inicializa serviços; o snapshot é lido uma vez: a execução inteira (e os reruns dos fragmentos,
+    # até o próximo rerun completo) usa a mesma base mesmo se houver recarga
+    try:
+        reloader = get_reloader()
+    except RuntimeError:
         st.error("❌ Falha ao carregar os dados. Verifique se o arquivo JSON está disponível.")
         st.stop()
+    snapshot = reloader.current
+    registry, search_service = snapshot.services
+    render_reload_status(reloader)
 
+    version = render_version_selector(registry)
+    data_service = registry.get(version)
     items = data_service.items
 
-    # Inicializar estado da categoria (para passar aos filtros da sidebar)
-    if 'selected_categoria' not in st.session_state:
-        st.session_state.selected_categoria = None
-
-    # Filtros na sidebar (passando a categoria selecionada para desabilitar filtro de grupo se necessário)
-    sidebar_filters = render_sidebar_filters(data_service, search_service, items, st.session_state.selected_categoria)
+    # Filtros na sidebar
+    with st.sidebar:
+        render_sidebar_filters(data_service, search_service, items)
 
     # Hero de busca com autocompletar
-    search_term, search_type, use_synonyms, sort_option = render_search_hero(search_service, items)
+    render_search_hero(search_service, items)
 
     # Grid de categorias
-    selected_categoria, selected_subcategoria = render_category_grid(items, search_service)
+    render_category_grid(items, search_service)
 
     st.markdown("---")
 
-    # Aplicar busca
-    results = items
-
-    if search_term and len(search_term) >= SEARCH_CONFIG["min_search_length"]:
-        results = search_service.search_items(
-            results,
-            search_term,
-            search_type=search_type,
-            use_synonyms=use_synonyms
-        )
+    # Busca, filtros e resultados
+    render_results(snapshot, version)
 
-    # Aplicar filtros
-    results = search_service.filter_items(
-        results,
-        filtro_principal=selected_categoria,
-        subcategoria=selected_subcategoria,
-        ps_onerosa=sidebar_filters.get('ps_onerosa'),
-        adq_exterior=sidebar_filters.get('adq_exterior'),
-        local_incidencia=sidebar_filters.get('local_incidencia'),
-        cclasstrib_filter=sidebar_filters.get('cclasstrib_filter'),
-        tipo_tributacao=sidebar_filters.get('tipo_tributacao'),
-        grupo_lc116=sidebar_filters.get('grupo_lc116'),
-    )
-
-    # Tabela de resultados
-    render_results_table(results, data_service, search_service, search_term, sort_option)
+    # Comparação entre versões da base
+    render_version_diff(registry, version)
 
 
 if __name__ == "__main__":
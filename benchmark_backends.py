@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Compara o backend SQLite (services/sqlite_backend.py) com os índices em memória:
+tempo de build_services com e sem o SQLite, latência das buscas e dos filtros e se os
+resultados coincidem.
+
+Uso:
+    python benchmark_backends.py
+    python benchmark_backends.py --data data/base.json --repeticoes 50
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from config.settings import DATA_FILE
+from services.search_service import SearchServiceEnhanced
+from services.service_factory import build_services
+from services.sqlite_backend import (
+    SQLITE_SEARCH_TYPES, build_sqlite_database, is_sqlite_database_current, sqlite_database_path,
+)
+
+
+QUERIES = [
+    "consultoria", "desenvolvimento de programas", "processamento de d", "saude",
+    "manutenção", "engenharia civil", "transporte", "ti", "01.05", "1.1502",
+]
+FILTERS = [
+    {"ps_onerosa": "S"},
+    {"grupo_lc116": "17"},
+    {"tipo_tributacao": "Tributação Integral", "ps_onerosa": "S"},
+    {"cclasstrib_filter": "000001"},
+]
+
+
+def timed(func, repeat: int):
+    """Executa `func` `repeat` vezes; devolve (último resultado, tempos em ms)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, times
+
+
+def summary(times) -> str:
+    ordered = sorted(times)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"média {statistics.mean(times):7.3f} ms | p95 {p95:7.3f} ms"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark: índices em memória x SQLite (FTS5)")
+    parser.add_argument("--data", type=Path, default=DATA_FILE, help="Arquivo de dados")
+    parser.add_argument("--repeticoes", type=int, default=20, help="Repetições de cada consulta")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registry, memory_service = build_services(args.data)
+    memory_startup = time.perf_counter() - start
+    items = registry.get().items
+
+    if not is_sqlite_database_current(args.data):
+        start = time.perf_counter()
+        build_sqlite_database(args.data, items, SearchServiceEnhanced())
+        print(f"Arquivo SQLite gerado em {time.perf_counter() - start:.2f} s")
+    start = time.perf_counter()
+    sqlite_registry, sqlite_service = build_services(args.data, backend="sqlite")
+    sqlite_startup = time.perf_counter() - start
+    backend = sqlite_service._backend
+    if backend is None:
+        print("Erro: arquivo SQLite indisponível", file=sys.stderr)
+        return 1
+    sqlite_items = sqlite_registry.get().items
+
+    size_mb = sqlite_database_path(args.data).stat().st_size / (1024 * 1024)
+    print(f"build_services: memória {memory_startup * 1000:.0f} ms | "
+          f"SQLite {sqlite_startup * 1000:.0f} ms (arquivo de {size_mb:.1f} MB, "
+          f"{len(sqlite_service._indexes)} índices em memória montados)")
+    print()
+
+    totals = {'memória': [], 'sqlite': []}
+    for search_type in SQLITE_SEARCH_TYPES:
+        print(f"Busca '{search_type}'")
+        for query in QUERIES:
+            expected, memory_times = timed(
+                lambda: memory_service.search_items(items, query, search_type), args.repeticoes
+            )
+            found, sqlite_times = timed(
+                lambda: sqlite_service.search_items(sqlite_items, query, search_type), args.repeticoes
+            )
+            totals['memória'] += memory_times
+            totals['sqlite'] += sqlite_times
+            expected_codes = [item['item_lc116'] for item in expected]
+            found_codes = [item['item_lc116'] for item in found]
+            if expected_codes == found_codes:
+                agreement = "iguais"
+            elif set(expected_codes) == set(found_codes):
+                agreement = "mesmos itens, outra ordem"
+            else:
+                agreement = f"{len(set(expected_codes) & set(found_codes))} em comum"
+            print(f"  {query!r:32} memória {statistics.mean(memory_times):7.3f} ms | "
+                  f"SQLite {statistics.mean(sqlite_times):7.3f} ms | "
+                  f"{len(expected)}/{len(found)} itens ({agreement})")
+        print()
+
+    print("Filtros")
+    for filters in FILTERS:
+        expected, memory_times = timed(lambda: memory_service.filter_items(items, **filters), args.repeticoes)
+        found, sqlite_times = timed(lambda: backend.filter_items(sqlite_items, **filters), args.repeticoes)
+        totals['memória'] += memory_times
+        totals['sqlite'] += sqlite_times
+        same = [i['item_lc116'] for i in expected] == [i['item_lc116'] for i in found]
+        print(f"  {filters} memória {statistics.mean(memory_times):7.3f} ms | "
+              f"SQLite {statistics.mean(sqlite_times):7.3f} ms | {len(found)} itens "
+              f"({'iguais' if same else 'DIFERENTES'})")
+    print()
+
+    # Tipo fora do SQLite: a primeira busca monta os índices em memória da base
+    start = time.perf_counter()
+    sqlite_service.search_items(sqlite_items, QUERIES[0], "tokens")
+    print(f"Primeira busca 'tokens' com o SQLite (monta os índices): "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    print()
+
+    for engine, times in totals.items():
+        print(f"Total {engine:8} {summary(times)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Gera a base JSON (e o cache de índice) a partir da planilha oficial do AnexoVIII.
+
+Uso:
+    python build_dataset.py AnexoVIII-CorrelacaoItemNBSIndOpCClassTrib_IBSCBS_V1.00.00.xlsx
+    python build_dataset.py planilha.xlsx --sheet "tabela geral" --output data/base.json --force
+    python build_dataset.py planilha.xlsx --sqlite
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+from config.settings import DATA_FILE
+from services.ingestion import AnexoIngestor, DEFAULT_CATEGORIES_FILE, DEFAULT_SHEET, IngestionError
+from services.sqlite_backend import is_sqlite_database_current
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Ingestão da planilha oficial do AnexoVIII")
+    parser.add_argument("xlsx", type=Path, help="Planilha oficial (.xlsx)")
+    parser.add_argument("--sheet", default=DEFAULT_SHEET, help="Aba com a tabela geral")
+    parser.add_argument("--output", type=Path, default=DATA_FILE, help="Arquivo JSON de saída")
+    parser.add_argument("--categorias", type=Path, default=DEFAULT_CATEGORIES_FILE,
+                        help="Mapeamento item LC116 -> categoria/subcategoria")
+    parser.add_argument("--force", action="store_true", help="Reconstrói todos os grupos")
+    parser.add_argument("--sqlite", action="store_true",
+                        help="Grava também o arquivo SQLite do backend alternativo (*.search.sqlite)")
+    args = parser.parse_args()
+
+    try:
+        ingestor = AnexoIngestor(args.xlsx, args.output, args.sheet, args.categorias)
+        summary = ingestor.run(force=args.force)
+        sqlite_path = None
+        if args.sqlite and (args.force or not is_sqlite_database_current(args.output)):
+            sqlite_path = ingestor.write_sqlite_database()
+    except (IngestionError, OSError, sqlite3.Error) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Grupos (itens LC116): {summary['grupos']}")
+    print(f"  reconstruídos: {summary['reconstruidos']}")
+    print(f"  reaproveitados: {summary['reaproveitados']}")
+    print("Base gravada." if summary['gravado'] else "Nenhuma alteração: base mantida.")
+    if summary['indice'] and not summary['gravado']:
+        print("Cache de índice regravado.")
+    if sqlite_path is not None:
+        print(f"Arquivo SQLite gravado: {sqlite_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,23 @@
 from config.settings import (
     APP_CONFIG, 
     SEARCH_CONFIG, 
+    RELOAD_CONFIG,
     DISPLAY_CONFIG, 
     CATEGORY_COLORS, 
     CATEGORY_ICONS,
     DATA_FILE,
+    DATA_VERSIONS_DIR,
     BASE_DIR
 )
 
 __all__ = [
     "APP_CONFIG",
     "SEARCH_CONFIG",
+    "RELOAD_CONFIG",
     "DISPLAY_CONFIG",
     "CATEGORY_COLORS",
     "CATEGORY_ICONS",
     "DATA_FILE",
+    "DATA_VERSIONS_DIR",
     "BASE_DIR",
 ]
@@ -16,12 +16,29 @@ APP_CONFIG = {
     "initial_sidebar_state": "expanded",
 }
 
-# Configurações de pesquisa
+# Configurações de pesquisa (interface e API)
 SEARCH_CONFIG = {
+    "fuzzy_threshold": 65,
     "min_search_length": 2,
     "max_results_per_page": 50,
-    "fuzzy_threshold": 60,
     "highlight_color": "#FFEB3B",
+    "max_autocomplete": 8,
+    "regex_time_budget_ms": 250,
+    # Processos da varredura paralela fuzzy/regex (bases pequenas continuam seriais)
+    "parallel_workers": 4,
+    # Autocompletar: pausa na digitação (no navegador) antes de atualizar só as sugestões
+    "autocomplete_debounce": "250ms",
+    # Sem digitação por este tempo (segundos), a consulta é aplicada à busca principal
+    "search_settle_s": 1.0,
+    # Busca por entrada NBS: acertos por página
+    "nbs_page_size": 100,
+    # Motor da busca contém/exata: "memory" ou "sqlite" (arquivo gerado por build_dataset.py --sqlite)
+    "backend": "memory",
+}
+
+# Recarga a quente da base (intervalo de verificação dos arquivos, em segundos)
+RELOAD_CONFIG = {
+    "poll_interval_s": 5.0,
 }
 
 # Configurações de exibição
@@ -72,3 +89,5 @@ CATEGORY_ICONS = {
 
 # Caminho do arquivo de dados
 DATA_FILE = BASE_DIR / "data" / "anexoVIII_correlacao_categorizado.json"
+# Versões adicionais da base (carregadas lado a lado com a principal)
+DATA_VERSIONS_DIR = BASE_DIR / "data" / "versoes"
@@ -0,0 +1,323 @@
+"""
+Camada assíncrona (asyncio) de atendimento de buscas para uso fora do Streamlit.
+O trabalho pesado sai do event loop: a busca fuzzy (rapidfuzz em C, libera o GIL)
+e as exportações vão para um pool de threads; as varreduras em Python puro (exata e
+regex) vão para um pool de processos que lê o corpus do próprio snapshot em memória
+compartilhada (ParallelScanExecutor), sem montar outra cópia da base. A busca
+"contém" responde pelo array de sufixos no próprio processo. Há controle de
+admissão, prazo por requisição e cancelamento.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from services.facet_index import FACET_KEYS
+from services.hot_reload import HotReloader
+from services.parallel_scan import ParallelScanExecutor
+
+
+# Tipos de busca com varredura em Python puro (enviada ao pool de processos)
+PROCESS_SEARCH_TYPES = ('exact', 'regex')
+
+# Filtros aceitos (mesmos argumentos de SearchServiceEnhanced.filter_items)
+FILTER_KEYS = FACET_KEYS
+
+DEFAULT_TIMEOUT_S = 10.0
+
+# Exportação em streaming: blocos gerados à frente do envio e tempo máximo sem o cliente ler
+STREAM_QUEUE_BLOCKS = 4
+STREAM_STALL_S = 60.0
+
+
+class ServiceOverloadedError(Exception):
+    """Fila de requisições cheia: a requisição foi recusada."""
+
+
+class RequestTimeoutError(Exception):
+    """A requisição excedeu o prazo."""
+
+
+def run_query(
+    services: Tuple,
+    version: Optional[str],
+    query: str,
+    search_type: str,
+    use_synonyms: bool,
+    filters: Dict[str, str],
+    cancel: Optional[threading.Event] = None,
+    scanner: Optional[ParallelScanExecutor] = None
+) -> Tuple[List[int], bool]:
+    """
+    Executa busca + filtros sobre uma versão da base (na ordem escolhida pelo planejador).
+    Com `scanner`, as varreduras exata e regex rodam nos processos dele.
+
+    Returns:
+        (posições dos itens resultantes na lista de itens da versão, em ordem de relevância;
+        True se a busca regex foi interrompida pelo orçamento de tempo)
+    """
+    registry, search_service = services
+    items = registry.get(version).items
+    plan = search_service.plan_query(items, query, search_type, use_synonyms, filters)
+    results = search_service.execute_plan(plan, cancel, scanner)
+    position_by_id = {id(item): pos for pos, item in enumerate(items)}
+    return [position_by_id[id(item)] for item in results], plan.truncated
+
+
+def run_nbs_query(
+    services: Tuple,
+    version: Optional[str],
+    query: str,
+    use_synonyms: bool,
+    filters: Dict[str, str]
+) -> List[Tuple[int, int, float]]:
+    """
+    Busca por entrada NBS sobre uma versão da base.
+
+    Returns:
+        (posição do item, índice da entrada NBS, pontuação) de cada acerto, por pontuação decrescente
+    """
+    registry, search_service = services
+    items = registry.get(version).items
+    hits = search_service.search_nbs(items, query, use_synonyms=use_synonyms, filters=filters)
+    position_by_id = {id(item): pos for pos, item in enumerate(items)}
+    return [(position_by_id[id(item)], nbs, score) for item, nbs, score in hits]
+
+
+class AsyncSearchService:
+    """Atende buscas de forma assíncrona sobre o snapshot atual do HotReloader."""
+
+    def __init__(
+        self,
+        reloader: HotReloader,
+        max_concurrent: int = 8,
+        max_pending: int = 64,
+        thread_workers: int = 4,
+        process_workers: int = 2,
+        default_timeout_s: float = DEFAULT_TIMEOUT_S
+    ):
+        """
+        Args:
+            reloader: Fonte do snapshot de serviços (lido uma vez por requisição)
+            max_concurrent: Requisições executando ao mesmo tempo
+            max_pending: Requisições admitidas (executando + aguardando); acima disso recusa
+            thread_workers: Threads para trabalho que libera o GIL (fuzzy, exportação)
+            process_workers: Processos para as varreduras exata e regex (0 = só threads)
+            default_timeout_s: Prazo padrão por requisição
+        """
+        self.reloader = reloader
+        self.max_pending = max_pending
+        self.process_workers = process_workers
+        self.default_timeout_s = default_timeout_s
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._pending = 0
+        self._threads = ThreadPoolExecutor(max_workers=thread_workers, thread_name_prefix="search")
+        # Sem carga mínima: toda varredura exata/regex sai do processo do event loop. O corpus
+        # compartilhado é o do índice de cada snapshot e é liberado junto com ele
+        self._scanner = ParallelScanExecutor(process_workers, min_texts=0) if process_workers > 0 else None
+        self.stats = {'admitidas': 0, 'recusadas': 0, 'expiradas': 0, 'canceladas': 0}
+
+    # ------------------------------------------------------------------
+    # Pools
+    # ------------------------------------------------------------------
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._scanner is not None:
+            self._scanner.shutdown()
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    async def _admit(self, timeout_s: float) -> Callable[[], None]:
+        """
+        Admite uma requisição e espera uma vaga de execução (a espera conta no prazo).
+
+        Returns:
+            Função que libera a admissão e a vaga (uma única chamada, quando o trabalho terminar)
+
+        Raises:
+            ServiceOverloadedError: Fila cheia
+            RequestTimeoutError: Sem vaga dentro do prazo
+        """
+        if self._pending >= self.max_pending:
+            self.stats['recusadas'] += 1
+            raise ServiceOverloadedError(f"Limite de {self.max_pending} requisições atingido")
+        self._pending += 1
+        self.stats['admitidas'] += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout_s)
+        except asyncio.TimeoutError as e:
+            self._pending -= 1
+            self.stats['expiradas'] += 1
+            raise RequestTimeoutError(f"Prazo de {timeout_s:g} s excedido") from e
+        except asyncio.CancelledError:
+            self._pending -= 1
+            self.stats['canceladas'] += 1
+            raise
+
+        def release():
+            self._pending -= 1
+            self._semaphore.release()
+
+        return release
+
+    async def _run(self, submit: Callable[[], Future], timeout_s: Optional[float],
+                   cancel: Optional[threading.Event] = None):
+        """
+        Admite a requisição, executa no pool e aplica prazo e cancelamento. A vaga (fila e
+        execução) só é liberada quando o trabalho termina de fato: uma busca que estourou o
+        prazo e continua rodando no pool segue contando no limite de admissão.
+        """
+        timeout_s = self.default_timeout_s if timeout_s is None else timeout_s
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_s
+        release = await self._admit(timeout_s)
+        future: Optional[Future] = None
+        try:
+            future = submit()
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0.0))
+        except asyncio.TimeoutError as e:
+            self.stats['expiradas'] += 1
+            raise RequestTimeoutError(f"Prazo de {timeout_s:g} s excedido") from e
+        except asyncio.CancelledError:
+            self.stats['canceladas'] += 1
+            raise
+        finally:
+            if future is not None and not future.done():
+                # Não iniciada: sai da fila; em execução: interrompe entre blocos (quando a busca
+                # consulta o evento) e libera a vaga ao terminar
+                future.cancel()
+                if cancel is not None:
+                    cancel.set()
+                future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+            else:
+                release()
+
+    async def search(
+        self,
+        query: str,
+        search_type: str = "contains",
+        version: Optional[str] = None,
+        use_synonyms: bool = True,
+        filters: Optional[Dict[str, str]] = None,
+        timeout_s: Optional[float] = None
+    ) -> Tuple[str, List[Dict], bool]:
+        """
+        Busca (e filtra) itens de uma versão da base.
+
+        Returns:
+            (versão consultada, itens em ordem de relevância, True se a busca regex foi
+            interrompida pelo orçamento de tempo e o resultado pode estar incompleto)
+
+        Raises:
+            UnknownVersionError: Versão não carregada
+            ServiceOverloadedError: Fila cheia
+            RequestTimeoutError: Prazo excedido
+        """
+        snapshot = self.reloader.current
+        registry, _ = snapshot.services
+        version = version or registry.default_version
+        items = registry.get(version).items
+        filters = {key: value for key, value in (filters or {}).items() if key in FILTER_KEYS and value}
+        scanner = self._scanner if search_type in PROCESS_SEARCH_TYPES else None
+        cancel = threading.Event()
+        # A thread só planeja, filtra e espera os processos; as posições são da própria lista
+        # de itens do snapshot, então não há como casar com outra versão dos arquivos
+        positions, truncated = await self._run(
+            lambda: self._threads.submit(
+                run_query, snapshot.services, version, query, search_type, use_synonyms, filters, cancel, scanner
+            ),
+            timeout_s, cancel
+        )
+        return version, [items[pos] for pos in positions], truncated
+
+    async def search_nbs(
+        self,
+        query: str,
+        version: Optional[str] = None,
+        use_synonyms: bool = True,
+        filters: Optional[Dict[str, str]] = None,
+        timeout_s: Optional[float] = None
+    ) -> Tuple[str, List[Tuple[Dict, int, float]]]:
+        """
+        Busca por entrada NBS (pontuação vetorizada: sempre no pool de threads).
+
+        Returns:
+            (versão consultada, acertos (item, índice da entrada NBS, pontuação))
+        """
+        snapshot = self.reloader.current
+        registry, _ = snapshot.services
+        version = version or registry.default_version
+        items = registry.get(version).items
+        filters = {key: value for key, value in (filters or {}).items() if key in FILTER_KEYS and value}
+        hits = await self._run(
+            lambda: self._threads.submit(run_nbs_query, snapshot.services, version, query, use_synonyms, filters),
+            timeout_s
+        )
+        return version, [(items[pos], nbs, score) for pos, nbs, score in hits]
+
+    async def offload(self, func: Callable, *args, timeout_s: Optional[float] = None) -> Any:
+        """Executa uma função pesada (ex.: exportação) no pool de threads, com admissão e prazo."""
+        return await self._run(lambda: self._threads.submit(func, *args), timeout_s)
+
+    async def open_stream(self, blocks: Iterator[bytes], timeout_s: Optional[float] = None) -> AsyncIterator[bytes]:
+        """
+        Admite uma exportação uma única vez e a gera no pool de threads, bloco a bloco, em uma
+        fila limitada. Recusa e prazo valem só para a admissão (antes da resposta começar):
+        uma vez aceita, a exportação não é interrompida por 429/504 no meio do envio. A vaga
+        fica ocupada até a geração terminar, o cliente desconectar ou parar de ler por
+        STREAM_STALL_S.
+
+        Raises:
+            ServiceOverloadedError: Fila cheia
+            RequestTimeoutError: Sem vaga dentro do prazo
+        """
+        timeout_s = self.default_timeout_s if timeout_s is None else timeout_s
+        release = await self._admit(timeout_s)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(STREAM_QUEUE_BLOCKS)
+        cancel = threading.Event()
+
+        def put(block: Optional[bytes]) -> bool:
+            """Entrega um bloco ao event loop (espera espaço na fila); False = consumidor sumiu."""
+            delivered = asyncio.run_coroutine_threadsafe(queue.put(block), loop)
+            try:
+                delivered.result(STREAM_STALL_S)
+                return True
+            except FutureTimeoutError:
+                delivered.cancel()
+                cancel.set()
+                return False
+
+        def produce():
+            try:
+                for block in blocks:
+                    if cancel.is_set() or not put(block):
+                        return
+            finally:
+                if not cancel.is_set():
+                    put(None)
+
+        try:
+            future = self._threads.submit(produce)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+
+        async def consume() -> AsyncIterator[bytes]:
+            try:
+                while (block := await queue.get()) is not None:
+                    yield block
+                # Erro na geração (depois do fim da fila)
+                await asyncio.wrap_future(future)
+            finally:
+                # Cliente desconectou: o produtor para no próximo bloco
+                cancel.set()
+                while not queue.empty():
+                    queue.get_nowait()
+
+        return consume()
@@ -0,0 +1,147 @@
+"""
+Grafo de referências cruzadas entre códigos: item LC116, NBS, cClassTrib e INDOP.
+Cada código distinto é um nó; dois códigos são vizinhos quando aparecem na mesma
+entrada NBS. As adjacências ficam em arrays inteiros no formato CSR (início de cada
+nó + vizinhos concatenados), assim como os itens em que cada código aparece: "quais
+itens LC116 usam a NBS 1.1502.10.00" ou "todas as NBS com cClassTrib 200029" custam
+O(grau) em vez de uma varredura da base.
+"""
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+# Tipos de código (mesmos nomes dos campos da consulta avançada)
+KINDS = ('lc116', 'nbs', 'cclass', 'indop')
+
+
+class CodeGraph:
+    """
+    Adjacências (CSR) entre os códigos de uma base.
+
+    Attributes:
+        node_kind: Tipo (índice em KINDS) de cada nó
+        node_code: Código de cada nó
+        indptr: Vizinhos do nó n: indices[indptr[n]:indptr[n + 1]] (por tipo e ordem de aparição)
+        item_indptr: Itens do nó n: item_indices[item_indptr[n]:item_indptr[n + 1]] (posições crescentes)
+    """
+
+    def __init__(self, items: List[Dict]):
+        self.items = items
+        self._ids: Dict[str, Dict[str, int]] = {kind: {} for kind in KINDS}
+        kinds: List[int] = []
+        codes: List[str] = []
+
+        def node(kind: str, code: str) -> int:
+            ids = self._ids[kind]
+            found = ids.get(code)
+            if found is None:
+                found = ids[code] = len(codes)
+                kinds.append(KINDS.index(kind))
+                codes.append(code)
+            return found
+
+        sources: List[int] = []
+        targets: List[int] = []
+        node_items: List[Tuple[int, int]] = []
+        for pos, item in enumerate(items):
+            lc116 = item.get('item_lc116', '')
+            item_node = node('lc116', lc116) if lc116 else None
+            if item_node is not None:
+                node_items.append((item_node, pos))
+            for nbs in item.get('nbs_entries', []):
+                # Códigos da entrada: todos vizinhos entre si
+                entry = [] if item_node is None else [item_node]
+                if nbs_code := nbs.get('nbs_code'):
+                    entry.append(node('nbs', nbs_code))
+                if indop := nbs.get('indop'):
+                    entry.append(node('indop', indop))
+                for cc in nbs.get('cclasstrib', []):
+                    if codigo := cc.get('codigo'):
+                        entry.append(node('cclass', codigo))
+                for i, source in enumerate(entry):
+                    node_items.append((source, pos))
+                    for target in entry[i + 1:]:
+                        if target != source:
+                            sources += (source, target)
+                            targets += (target, source)
+
+        self.node_kind = np.asarray(kinds, dtype=np.int8)
+        self.node_code = codes
+        self.indptr, self.indices = _csr(
+            len(codes), np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64),
+            order_key=self.node_kind.astype(np.int64) * max(len(codes), 1),
+        )
+        pairs = np.asarray(node_items, dtype=np.int64).reshape(-1, 2)
+        self.item_indptr, self.item_indices = _csr(len(codes), pairs[:, 0], pairs[:, 1])
+        # Menor e maior comprimento dos códigos de cada tipo
+        self.code_lengths: Dict[str, Tuple[int, int]] = {
+            kind: (min(map(len, ids), default=0), max(map(len, ids), default=0)) for kind, ids in self._ids.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.node_code)
+
+    def node(self, kind: str, code: str) -> Optional[int]:
+        """Nó de um código (None se o código não aparece na base)."""
+        return self._ids[kind].get(code)
+
+    def neighbors(self, kind: str, code: str, neighbor_kind: Optional[str] = None) -> List[str]:
+        """Códigos vizinhos (todos, ou só os de um tipo)."""
+        found = self.node(kind, code)
+        if found is None:
+            return []
+        neighbors = self.indices[self.indptr[found]:self.indptr[found + 1]]
+        if neighbor_kind is not None:
+            neighbors = neighbors[self.node_kind[neighbors] == KINDS.index(neighbor_kind)]
+        return [self.node_code[n] for n in neighbors.tolist()]
+
+    def related(self, kind: str, code: str) -> Dict[str, List[str]]:
+        """Códigos vizinhos agrupados por tipo (tipos sem vizinhos ficam de fora)."""
+        grouped: Dict[str, List[str]] = {}
+        found = self.node(kind, code)
+        if found is None:
+            return grouped
+        neighbors = self.indices[self.indptr[found]:self.indptr[found + 1]].tolist()
+        for n in neighbors:
+            grouped.setdefault(KINDS[self.node_kind[n]], []).append(self.node_code[n])
+        return grouped
+
+    def degree(self, kind: str, code: str, neighbor_kind: Optional[str] = None) -> int:
+        """Quantidade de vizinhos (todos, ou só os de um tipo)."""
+        found = self.node(kind, code)
+        if found is None:
+            return 0
+        if neighbor_kind is None:
+            return int(self.indptr[found + 1] - self.indptr[found])
+        neighbors = self.indices[self.indptr[found]:self.indptr[found + 1]]
+        return int(np.count_nonzero(self.node_kind[neighbors] == KINDS.index(neighbor_kind)))
+
+    def item_positions(self, kind: str, code: str) -> np.ndarray:
+        """Posições (crescentes) dos itens em que o código aparece."""
+        found = self.node(kind, code)
+        if found is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.item_indices[self.item_indptr[found]:self.item_indptr[found + 1]]
+
+
+def _csr(
+    size: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    order_key: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Arrays CSR (indptr, indices) dos pares origem -> destino, sem repetições. Os destinos
+    de cada origem ficam em ordem crescente de `order_key[destino] + destino` (ou do destino).
+    """
+    target_key = targets if order_key is None else order_key[targets] + targets
+    # Uma única ordenação por (origem, chave do destino); pares repetidos ficam adjacentes
+    key = sources * (int(target_key.max(initial=0)) + 1) + target_key
+    order = np.argsort(key, kind='stable')
+    key, sources, targets = key[order], sources[order], targets[order]
+    keep = np.ones(len(key), dtype=bool)
+    keep[1:] = key[1:] != key[:-1]
+    sources, targets = sources[keep], targets[keep]
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return indptr, targets
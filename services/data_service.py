@@ -1,35 +1,57 @@
 """
 Serviço de carregamento e gerenciamento de dados.
 """
-import json
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, TYPE_CHECKING
 import streamlit as st
 
+from services.index_cache import load_index_cache
+from services.loaders import get_loader
+from services.nbs_table import NbsTable
+from services.search_index import SearchIndex
+
+if TYPE_CHECKING:
+    from services.dataset_registry import RecordPool
+
 
 class DataService:
     """Classe para gerenciamento de dados do sistema."""
     
-    def __init__(self, data_file: Path):
+    def __init__(self, data_file: Path, record_pool: Optional['RecordPool'] = None):
         self.data_file = data_file
+        self._record_pool = record_pool
+        self._record_hashes: Dict[str, str] = {}
         self._data: Optional[Dict] = None
         self._items: List[Dict] = []
         self._filters: Dict[str, set] = {}
+        self._nbs_table: Optional[NbsTable] = None
+        self._cached_index: Optional[SearchIndex] = None
+        self.load_error: Optional[str] = None
         
-    @st.cache_data(ttl=3600)
-    def _load_json(_self, file_path: str) -> Dict:
-        """Carrega o arquivo JSON com cache."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    @staticmethod
+    def _load_source(file_path: Path) -> Dict:
+        """Carrega a base com o carregador adequado à extensão do arquivo."""
+        return get_loader(file_path).load(file_path)
     
     def load_data(self) -> bool:
-        """Carrega os dados do arquivo JSON."""
+        """Carrega os dados do arquivo (JSON, JSONL, Parquet ou Arrow)."""
         try:
-            self._data = self._load_json(str(self.data_file))
+            cache = load_index_cache(Path(self.data_file))
+            if cache is not None:
+                # Índice pré-compilado pela ingestão: os itens vêm junto com ele
+                self._cached_index = cache['index']
+                self._data = {'fonte': cache['fonte'], 'sheet': cache['sheet'], 'itens': cache['index'].items}
+            else:
+                self._data = self._load_source(Path(self.data_file))
             self._items = self._data.get('itens', [])
+            if self._record_pool is not None:
+                # Compartilha registros inalterados com as demais versões (antes de indexar)
+                self._record_hashes = self._record_pool.share(self._items)
             self._extract_filters()
+            self._nbs_table = NbsTable(self._items)
             return True
         except Exception as e:
+            self.load_error = str(e)
             st.error(f"Erro ao carregar dados: {e}")
             return False
     
@@ -69,6 +91,23 @@ class DataService:
         """Retorna a lista de itens."""
         return self._items
     
+    @property
+    def record_hashes(self) -> Dict[str, str]:
+        """Hash de conteúdo por item (preenchido quando há um pool de registros)."""
+        return self._record_hashes
+
+    @property
+    def cached_index(self) -> Optional[SearchIndex]:
+        """Índice de busca carregado do cache em disco (None se não havia cache válido)."""
+        return self._cached_index
+
+    @property
+    def nbs_table(self) -> NbsTable:
+        """Retorna a tabela plana de entradas NBS (construída no carregamento)."""
+        if self._nbs_table is None:
+            self._nbs_table = NbsTable(self._items)
+        return self._nbs_table
+
     @property
     def filters(self) -> Dict[str, List]:
         """Retorna os filtros disponíveis."""
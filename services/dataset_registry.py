@@ -0,0 +1,285 @@
+"""
+Registro de versões da base (AnexoVIII) carregadas lado a lado.
+Itens e entradas NBS idênticos entre versões são compartilhados (mesmo objeto em
+memória), e o diff compara hashes de conteúdo, descendo às entradas NBS apenas
+nos itens alterados.
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from services.data_service import DataService
+from services.loaders import SUPPORTED_EXTENSIONS, DatasetLoadError
+
+
+# Versão no nome do arquivo de origem (ex.: "..._IBSCBS_V1.00.00.xlsx")
+VERSION_PATTERN = re.compile(r'V\d+(?:\.\d+)+', re.IGNORECASE)
+
+# Atributos comparados em uma entrada NBS (além dos vínculos de cClassTrib)
+NBS_ATTRIBUTES = ('descricao_nbs', 'ps_onerosa', 'adq_exterior', 'local_incidencia_ibs')
+
+# Chave de uma entrada NBS no diff: (item LC116, código NBS, INDOP)
+NbsKey = Tuple[str, str, str]
+
+
+class UnknownVersionError(KeyError):
+    """Versão da base não carregada."""
+
+    def __str__(self) -> str:
+        return str(self.args[0]) if self.args else ''
+
+
+def record_hash(record: Dict) -> str:
+    """Hash do conteúdo de um registro (independe da ordem das chaves)."""
+    payload = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def item_key(item: Dict) -> str:
+    """Identificador estável de um item entre versões."""
+    return item.get('item_lc116') or f"desc:{item.get('descricao_item', '')}"
+
+
+def version_label(source_info: Dict[str, str], data_file: Path) -> str:
+    """Rótulo da versão: extraído do nome da fonte ou, na falta dele, do arquivo."""
+    match = VERSION_PATTERN.search(source_info.get('fonte', ''))
+    if match:
+        return match.group(0).upper()
+    return Path(data_file).stem
+
+
+class RecordPool:
+    """Compartilha itens e entradas NBS idênticos entre as versões carregadas."""
+
+    def __init__(self):
+        self._items: Dict[str, Dict] = {}
+        self._entries: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def share(self, items: List[Dict]) -> Dict[str, str]:
+        """
+        Substitui (no lugar) os registros já conhecidos pelos objetos do pool.
+
+        Returns:
+            Dict item_key -> hash do item, usado pelo diff
+        """
+        hashes: Dict[str, str] = {}
+        for pos, item in enumerate(items):
+            digest = record_hash(item)
+            shared = self._items.get(digest)
+            if shared is None:
+                # Item novo ou alterado: ainda pode reaproveitar entradas NBS inalteradas
+                item['nbs_entries'] = [self._share_entry(nbs) for nbs in item.get('nbs_entries', [])]
+                self._items[digest] = shared = item
+            items[pos] = shared
+            hashes[item_key(shared)] = digest
+        return hashes
+
+    def _share_entry(self, nbs: Dict) -> Dict:
+        digest = record_hash(nbs)
+        return self._entries.setdefault(digest, nbs)
+
+
+def _entry_index(item: Optional[Dict]) -> Dict[NbsKey, Dict]:
+    """Agrupa as entradas NBS de um item por (código NBS, INDOP)."""
+    entries: Dict[NbsKey, Dict] = {}
+    if item is None:
+        return entries
+    key_item = item_key(item)
+    for nbs in item.get('nbs_entries', []):
+        key = (key_item, nbs.get('nbs_code', ''), nbs.get('indop', ''))
+        entry = entries.get(key)
+        if entry is None:
+            # Linhas repetidas (mesmo NBS/INDOP) só diferem nos vínculos de cClassTrib
+            entry = {field: nbs.get(field, '') for field in NBS_ATTRIBUTES}
+            entry['cclasstrib'] = {}
+            entries[key] = entry
+        for cc in nbs.get('cclasstrib', []):
+            entry['cclasstrib'].setdefault(cc.get('codigo', ''), cc.get('nome', ''))
+    return entries
+
+
+def _key_dict(key: NbsKey) -> Dict[str, str]:
+    return {'item_lc116': key[0], 'nbs_code': key[1], 'indop': key[2]}
+
+
+class DatasetDiff:
+    """Diferenças entre duas versões no nível de entradas NBS e vínculos de cClassTrib."""
+
+    def __init__(self, old_version: str, new_version: str):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.nbs_added: List[Dict] = []
+        self.nbs_removed: List[Dict] = []
+        self.nbs_changed: List[Dict] = []
+        self.cclasstrib_added: List[Dict] = []
+        self.cclasstrib_removed: List[Dict] = []
+
+    def _compare_items(self, old_item: Optional[Dict], new_item: Optional[Dict]):
+        old_entries = _entry_index(old_item)
+        new_entries = _entry_index(new_item)
+
+        for key, entry in new_entries.items():
+            old_entry = old_entries.get(key)
+            if old_entry is None:
+                self.nbs_added.append({**_key_dict(key), 'descricao_nbs': entry['descricao_nbs']})
+                for codigo, nome in entry['cclasstrib'].items():
+                    self.cclasstrib_added.append({**_key_dict(key), 'codigo': codigo, 'nome': nome})
+                continue
+            campos = {
+                field: (old_entry[field], entry[field])
+                for field in NBS_ATTRIBUTES if old_entry[field] != entry[field]
+            }
+            if campos:
+                self.nbs_changed.append({**_key_dict(key), 'campos': campos})
+            for codigo, nome in entry['cclasstrib'].items():
+                if codigo not in old_entry['cclasstrib']:
+                    self.cclasstrib_added.append({**_key_dict(key), 'codigo': codigo, 'nome': nome})
+            for codigo, nome in old_entry['cclasstrib'].items():
+                if codigo not in entry['cclasstrib']:
+                    self.cclasstrib_removed.append({**_key_dict(key), 'codigo': codigo, 'nome': nome})
+
+        for key, entry in old_entries.items():
+            if key not in new_entries:
+                self.nbs_removed.append({**_key_dict(key), 'descricao_nbs': entry['descricao_nbs']})
+                for codigo, nome in entry['cclasstrib'].items():
+                    self.cclasstrib_removed.append({**_key_dict(key), 'codigo': codigo, 'nome': nome})
+
+    @property
+    def is_empty(self) -> bool:
+        return not any(self.summary().values())
+
+    def summary(self) -> Dict[str, int]:
+        """Quantidade de mudanças por tipo."""
+        return {
+            'nbs_adicionadas': len(self.nbs_added),
+            'nbs_removidas': len(self.nbs_removed),
+            'nbs_alteradas': len(self.nbs_changed),
+            'cclasstrib_adicionados': len(self.cclasstrib_added),
+            'cclasstrib_removidos': len(self.cclasstrib_removed),
+        }
+
+    def for_nbs_codes(self, codes: Iterable[str]) -> 'DatasetDiff':
+        """Restringe o diff às entradas cujos códigos NBS começam por um dos códigos dados."""
+        prefixes = tuple(code.strip() for code in codes if code.strip())
+        filtered = DatasetDiff(self.old_version, self.new_version)
+        for attr in ('nbs_added', 'nbs_removed', 'nbs_changed', 'cclasstrib_added', 'cclasstrib_removed'):
+            setattr(filtered, attr, [
+                change for change in getattr(self, attr) if change['nbs_code'].startswith(prefixes)
+            ])
+        return filtered
+
+    def to_rows(self) -> List[Dict[str, str]]:
+        """Linhas planas (uma por mudança) para exibição em tabela."""
+        rows = []
+        for change in self.nbs_added:
+            rows.append({**_row_key(change), 'Mudança': 'NBS adicionada', 'Detalhe': change['descricao_nbs']})
+        for change in self.nbs_removed:
+            rows.append({**_row_key(change), 'Mudança': 'NBS removida', 'Detalhe': change['descricao_nbs']})
+        for change in self.nbs_changed:
+            detalhe = '; '.join(f"{field}: {old} → {new}" for field, (old, new) in change['campos'].items())
+            rows.append({**_row_key(change), 'Mudança': 'NBS alterada', 'Detalhe': detalhe})
+        for change in self.cclasstrib_added:
+            rows.append({**_row_key(change), 'Mudança': 'cClassTrib incluído',
+                         'Detalhe': f"{change['codigo']} - {change['nome']}"})
+        for change in self.cclasstrib_removed:
+            rows.append({**_row_key(change), 'Mudança': 'cClassTrib excluído',
+                         'Detalhe': f"{change['codigo']} - {change['nome']}"})
+        return rows
+
+
+def _row_key(change: Dict) -> Dict[str, str]:
+    return {'LC116': change['item_lc116'], 'NBS': change['nbs_code'], 'INDOP': change['indop']}
+
+
+class DatasetRegistry:
+    """Mantém várias versões da base carregadas, compartilhando os registros inalterados."""
+
+    def __init__(self):
+        self.pool = RecordPool()
+        self._versions: Dict[str, DataService] = {}
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._diffs: Dict[Tuple[str, str], DatasetDiff] = {}
+        self.default_version: Optional[str] = None
+
+    def load(self, data_file: Path, version: Optional[str] = None) -> str:
+        """
+        Carrega uma versão da base e a registra.
+
+        Args:
+            data_file: Arquivo da base (qualquer formato suportado pelos carregadores)
+            version: Rótulo da versão (padrão: extraído da fonte ou do nome do arquivo)
+
+        Returns:
+            Rótulo com que a versão foi registrada
+
+        Raises:
+            DatasetLoadError: Falha ao carregar o arquivo
+        """
+        data_service = DataService(data_file, record_pool=self.pool)
+        if not data_service.load_data():
+            raise DatasetLoadError(data_service.load_error or f"{Path(data_file).name}: falha ao carregar a base")
+        label = version or version_label(data_service.source_info, data_file)
+        if label in self._versions and version is None:
+            label = f"{label} ({Path(data_file).stem})"
+        self._versions[label] = data_service
+        self._hashes[label] = data_service.record_hashes
+        self._diffs = {pair: diff for pair, diff in self._diffs.items() if label not in pair}
+        if self.default_version is None:
+            self.default_version = label
+        return label
+
+    def load_directory(self, directory: Path) -> List[str]:
+        """Carrega as bases de um diretório (ordem alfabética); arquivos inválidos são ignorados."""
+        directory = Path(directory)
+        if not directory.is_dir():
+            return []
+        labels = []
+        for path in sorted(directory.iterdir()):
+            # Manifestos e caches da ingestão ficam ao lado das bases
+            if path.suffix.lower() not in SUPPORTED_EXTENSIONS or '.manifest' in path.suffixes:
+                continue
+            try:
+                labels.append(self.load(path))
+            except DatasetLoadError:
+                continue
+        return labels
+
+    @property
+    def versions(self) -> List[str]:
+        """Rótulos das versões carregadas (na ordem de carregamento)."""
+        return list(self._versions)
+
+    def get(self, version: Optional[str] = None) -> DataService:
+        """Retorna a base de uma versão (padrão: a versão principal)."""
+        label = version or self.default_version
+        if label not in self._versions:
+            raise UnknownVersionError(f"Versão não carregada: {label}")
+        return self._versions[label]
+
+    def diff(self, old_version: str, new_version: str) -> DatasetDiff:
+        """
+        Compara duas versões: itens com o mesmo hash são ignorados sem inspeção,
+        e só os itens alterados são comparados entrada a entrada.
+        """
+        pair = (old_version, new_version)
+        if pair in self._diffs:
+            return self._diffs[pair]
+
+        old_hashes = self._hashes[old_version]
+        new_hashes = self._hashes[new_version]
+        old_items = {item_key(item): item for item in self.get(old_version).items}
+        new_items = {item_key(item): item for item in self.get(new_version).items}
+
+        result = DatasetDiff(old_version, new_version)
+        changed: Set[str] = {key for key, digest in new_hashes.items() if old_hashes.get(key) != digest}
+        changed.update(key for key in old_hashes if key not in new_hashes)
+        for key in sorted(changed):
+            result._compare_items(old_items.get(key), new_items.get(key))
+
+        self._diffs[pair] = result
+        return result
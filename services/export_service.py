@@ -0,0 +1,389 @@
+"""
+Exportação dos resultados de consulta (Excel, CSV, JSONL e Parquet).
+As linhas (uma por NBS x cClassTrib) são geradas em blocos a partir dos itens e
+gravadas em fluxo (Excel em modo write-only, direto para um arquivo temporário):
+a memória não cresce com o tamanho da exportação. As abas de resumo do Excel usam
+os contadores de facetas acumulados durante a mesma passada. Exportações
+recentes ficam em cache, indexadas pelo ETag da consulta.
+"""
+import csv
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import warnings
+from collections import OrderedDict
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+
+from services.dataset_registry import item_key, record_hash
+from services.search_service import SearchServiceEnhanced, GRUPOS_LC116
+
+
+# Linhas geradas por bloco
+DEFAULT_CHUNK_SIZE = 5000
+
+# Acima deste tamanho o arquivo temporário sai da memória para o disco
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# Bytes por bloco ao transmitir arquivos já gravados (XLSX, Parquet)
+STREAM_BLOCK_BYTES = 1024 * 1024
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Colunas exportadas (na ordem) e larguras na planilha
+EXPORT_COLUMNS = [
+    'Código LC116', 'Descrição do Serviço', 'Código NBS', 'Descrição NBS', 'Prestação Onerosa',
+    'Aquisição Exterior', 'INDOP', 'Local Incidência IBS', 'cClassTrib', 'Classificação Tributária',
+    'Tipo de Tributação',
+]
+COLUMN_WIDTHS = [15, 50, 18, 50, 18, 18, 15, 40, 14, 60, 30]
+
+FLAG_LABELS = {'S': 'Sim', 'N': 'Não'}
+
+# Estilo do cabeçalho (mesmas cores da interface)
+HEADER_FILL = PatternFill(start_color="C9A961", end_color="C9A961", fill_type="solid")
+HEADER_FONT = Font(name='Calibri', size=11, bold=True, color="1A2332")
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+# Campos dos formatos para sistemas (JSONL, Parquet): valores brutos, sem rótulos
+RECORD_FIELDS = [
+    'item_lc116', 'descricao_item', 'nbs_code', 'descricao_nbs', 'ps_onerosa', 'adq_exterior',
+    'indop', 'local_incidencia_ibs', 'cclasstrib_codigo', 'cclasstrib_nome', 'tipo_tributacao',
+]
+
+ExportRecord = Tuple[Optional[str], ...]
+ExportRow = Tuple[str, ...]
+
+
+def iter_export_records(
+    items: Iterable[Dict],
+    search_service: SearchServiceEnhanced,
+    counts: Optional[Dict[str, Dict]] = None
+) -> Iterator[ExportRecord]:
+    """
+    Gera um registro por NBS x cClassTrib, com os campos de RECORD_FIELDS (ausentes = None).
+    Entradas sem classificação geram um registro com a classificação vazia.
+
+    Args:
+        items: Itens na ordem de exportação
+        search_service: Resolve o tipo de tributação de cada classificação
+        counts: Contadores de facetas atualizados a cada item (opcional)
+    """
+    tipos: Dict[str, str] = {}
+    for item in items:
+        if counts is not None:
+            search_service.count_item(counts, item)
+        item_lc116 = item.get('item_lc116') or None
+        descricao_item = item.get('descricao_item') or None
+        for nbs in item.get('nbs_entries', []):
+            base = (
+                item_lc116,
+                descricao_item,
+                nbs.get('nbs_code') or None,
+                nbs.get('descricao_nbs') or None,
+                nbs.get('ps_onerosa') or None,
+                nbs.get('adq_exterior') or None,
+                nbs.get('indop') or None,
+                nbs.get('local_incidencia_ibs') or None,
+            )
+            classificacoes = nbs.get('cclasstrib', [])
+            if not classificacoes:
+                yield base + (None, None, None)
+                continue
+            for cc in classificacoes:
+                codigo = cc.get('codigo', '')
+                if codigo not in tipos:
+                    tipos[codigo] = search_service.get_classificacao_didatica(codigo)['categoria']
+                yield base + (codigo or None, cc.get('nome') or None, tipos[codigo])
+
+
+def iter_export_rows(
+    items: Iterable[Dict],
+    search_service: SearchServiceEnhanced,
+    counts: Optional[Dict[str, Dict]] = None
+) -> Iterator[ExportRow]:
+    """Linhas legíveis (colunas de EXPORT_COLUMNS) para Excel e CSV; vazios viram "-"."""
+    for (lc116, desc_item, nbs_code, desc_nbs, ps, adq, indop, local,
+         codigo, nome, tipo) in iter_export_records(items, search_service, counts):
+        yield (
+            lc116 or '',
+            desc_item or '',
+            nbs_code or '',
+            desc_nbs or '',
+            FLAG_LABELS.get(ps, '-'),
+            FLAG_LABELS.get(adq, '-'),
+            indop or '-',
+            local or '-',
+            codigo or '-',
+            f"{codigo} - {nome or ''}" if codigo else '-',
+            tipo or '-',
+        )
+
+
+def iter_row_chunks(rows: Iterator[ExportRow], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[ExportRow]]:
+    """Agrupa as linhas em blocos de até `chunk_size`."""
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _header_cells(ws, headers: List[str]) -> List[WriteOnlyCell]:
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        cells.append(cell)
+    return cells
+
+
+def _add_table(ws, name: str, headers: List[str], n_rows: int):
+    """Formata o intervalo gravado como tabela do Excel (linhas zebradas, filtros)."""
+    if n_rows == 0:
+        return
+    table = Table(displayName=name, ref=f"A1:{get_column_letter(len(headers))}{n_rows + 1}")
+    # Em modo write-only as colunas da tabela são declaradas explicitamente
+    table.tableColumns = [TableColumn(id=i, name=header) for i, header in enumerate(headers, start=1)]
+    table.tableStyleInfo = TableStyleInfo(
+        name="TableStyleMedium2", showFirstColumn=False, showLastColumn=False,
+        showRowStripes=True, showColumnStripes=False,
+    )
+    with warnings.catch_warnings():
+        # O aviso de colunas não declaradas não se aplica: tableColumns já está preenchido
+        warnings.simplefilter("ignore", UserWarning)
+        ws.add_table(table)
+
+
+def _write_summary(wb: Workbook, title: str, table_name: str, headers: List[str],
+                   widths: List[int], rows: List[Tuple]):
+    ws = wb.create_sheet(title)
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.freeze_panes = "A2"
+    ws.append(_header_cells(ws, headers))
+    for row in rows:
+        ws.append(row)
+    _add_table(ws, table_name, headers, len(rows))
+
+
+def _sorted_counts(counter: Dict[str, int]) -> List[Tuple[str, int]]:
+    return sorted(counter.items(), key=lambda kv: (-kv[1], kv[0]))
+
+
+def write_excel(
+    items: Iterable[Dict],
+    search_service: SearchServiceEnhanced,
+    output: BinaryIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """
+    Grava a planilha de resultados (aba de dados + abas de resumo) em `output`.
+
+    Returns:
+        Quantidade de linhas de dados gravadas
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Consulta Tributária")
+    for i, width in enumerate(COLUMN_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.freeze_panes = "A2"
+    ws.append(_header_cells(ws, EXPORT_COLUMNS))
+
+    counts = search_service.empty_filter_counts()
+    total_rows = 0
+    for chunk in iter_row_chunks(iter_export_rows(items, search_service, counts), chunk_size):
+        for row in chunk:
+            ws.append(row)
+        total_rows += len(chunk)
+    _add_table(ws, "TabelaTributaria", EXPORT_COLUMNS, total_rows)
+
+    _write_summary(
+        wb, "Resumo por Categoria", "ResumoCategoria", ['Categoria', 'Serviços'], [50, 12],
+        _sorted_counts(counts['filtros_principais']),
+    )
+    _write_summary(
+        wb, "Resumo por Tributação", "ResumoTributacao", ['Tipo de Tributação', 'Classificações'], [40, 16],
+        _sorted_counts(counts['tipos_tributacao']),
+    )
+    grupos = sorted(counts['grupos_lc116'].items(), key=lambda kv: int(kv[0]) if kv[0].isdigit() else 10 ** 9)
+    _write_summary(
+        wb, "Resumo por Grupo LC116", "ResumoGrupoLC116", ['Grupo', 'Descrição', 'Serviços'], [10, 60, 12],
+        # Códigos da base vêm com zero à esquerda ("01"); a tabela de grupos não
+        [(grupo, GRUPOS_LC116.get(grupo.lstrip('0'), f"Grupo {grupo}"), total) for grupo, total in grupos],
+    )
+
+    wb.save(output)
+    return total_rows
+
+
+# =============================================================================
+# FORMATOS PARA SISTEMAS (CSV, JSONL, PARQUET)
+# =============================================================================
+
+def iter_csv_chunks(items: Iterable[Dict], search_service: SearchServiceEnhanced,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """CSV em UTF-8 com BOM (o Excel reconhece a codificação), separado por ';'."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    writer.writerow(EXPORT_COLUMNS)
+    yield '\ufeff'.encode('utf-8') + buffer.getvalue().encode('utf-8')
+    for chunk in iter_row_chunks(iter_export_rows(items, search_service), chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_jsonl_chunks(items: Iterable[Dict], search_service: SearchServiceEnhanced,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Um objeto JSON por linha, com os campos de RECORD_FIELDS."""
+    for chunk in iter_row_chunks(iter_export_records(items, search_service), chunk_size):
+        lines = [json.dumps(dict(zip(RECORD_FIELDS, record)), ensure_ascii=False) for record in chunk]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def write_parquet(items: Iterable[Dict], search_service: SearchServiceEnhanced, output: BinaryIO,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Grava um Parquet com um row group por bloco. Retorna a quantidade de linhas."""
+    if pa is None:
+        raise ValueError("pyarrow não está instalado (necessário para Parquet)")
+    schema = pa.schema([(field, pa.string()) for field in RECORD_FIELDS])
+    total_rows = 0
+    with pq.ParquetWriter(output, schema, compression='zstd') as writer:
+        for chunk in iter_row_chunks(iter_export_records(items, search_service), chunk_size):
+            columns = [pa.array(values, type=pa.string()) for values in zip(*chunk)]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+            total_rows += len(chunk)
+    return total_rows
+
+
+def _iter_file_blocks(write: Callable[[BinaryIO], int]) -> Iterator[bytes]:
+    """Grava em arquivo temporário e o transmite em blocos (formatos com índice no fim do arquivo)."""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as output:
+        write(output)
+        output.seek(0)
+        while block := output.read(STREAM_BLOCK_BYTES):
+            yield block
+
+
+class ExportFormat:
+    """Formato de exportação: metadados do download e gerador de blocos de bytes."""
+
+    def __init__(self, key: str, label: str, extension: str, mime: str,
+                 chunks: Callable[[Iterable[Dict], SearchServiceEnhanced, int], Iterator[bytes]]):
+        self.key = key
+        self.label = label
+        self.extension = extension
+        self.mime = mime
+        self.chunks = chunks
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    fmt.key: fmt for fmt in (
+        ExportFormat(
+            'xlsx', "Excel", '.xlsx', XLSX_MIME,
+            lambda items, service, size: _iter_file_blocks(lambda out: write_excel(items, service, out, size)),
+        ),
+        ExportFormat('csv', "CSV", '.csv', "text/csv", iter_csv_chunks),
+        ExportFormat('jsonl', "JSONL", '.jsonl', "application/x-ndjson", iter_jsonl_chunks),
+        ExportFormat(
+            'parquet', "Parquet", '.parquet', "application/vnd.apache.parquet",
+            lambda items, service, size: _iter_file_blocks(lambda out: write_parquet(items, service, out, size)),
+        ),
+    )
+    if fmt.key != 'parquet' or pa is not None
+}
+
+
+# =============================================================================
+# CACHE DE EXPORTAÇÕES (ETAG POR CONSULTA)
+# =============================================================================
+
+class ExportCache:
+    """
+    Exportações recentes indexadas por ETag (LRU limitado em bytes).
+    O ETag deriva do formato e dos hashes de conteúdo dos itens do resultado, em
+    ordem: a mesma consulta sobre a mesma base não é regerada, mesmo após recargas.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 16 * 1024 * 1024,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.chunk_size = chunk_size
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {'acertos': 0, 'geradas': 0}
+
+    @staticmethod
+    def etag(fmt: str, items: List[Dict], record_hashes: Optional[Dict[str, str]] = None) -> str:
+        """ETag da exportação dos itens (hashes do pool de registros quando disponíveis)."""
+        record_hashes = record_hashes or {}
+        digest = hashlib.sha1(fmt.encode('utf-8'))
+        for item in items:
+            digest.update((record_hashes.get(item_key(item)) or record_hash(item)).encode('ascii'))
+        return f'"{fmt}-{digest.hexdigest()}"'
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(etag)
+            if data is not None:
+                self._entries.move_to_end(etag)
+                self.stats['acertos'] += 1
+            return data
+
+    def put(self, etag: str, data: bytes):
+        if len(data) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if etag in self._entries:
+                return
+            self._entries[etag] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stream(self, fmt: str, items: List[Dict], search_service: SearchServiceEnhanced,
+               etag: str) -> Iterator[bytes]:
+        """Blocos da exportação: do cache, ou gerados em blocos e guardados ao final."""
+        cached = self.get(etag)
+        if cached is not None:
+            yield cached
+            return
+        self.stats['geradas'] += 1
+        parts: Optional[List[bytes]] = []
+        size = 0
+        for block in EXPORT_FORMATS[fmt].chunks(items, search_service, self.chunk_size):
+            if parts is not None:
+                size += len(block)
+                # Acima do limite por entrada não guarda (evita acumular exportações enormes)
+                if size <= self.max_entry_bytes:
+                    parts.append(block)
+                else:
+                    parts = None
+            yield block
+        if parts is not None:
+            self.put(etag, b''.join(parts))
+
+    def export(self, fmt: str, items: List[Dict], search_service: SearchServiceEnhanced,
+               record_hashes: Optional[Dict[str, str]] = None) -> bytes:
+        """Exportação completa em bytes (usada pelo botão de download)."""
+        return b''.join(self.stream(fmt, items, search_service, self.etag(fmt, items, record_hashes)))
@@ -0,0 +1,162 @@
+"""
+Bitmaps de facetas (um vetor booleano por valor de filtro) construídos por base.
+Aplicar os filtros da sidebar vira uma sequência de operações `&` e `|` sobre
+vetores, e a cardinalidade de cada valor fica disponível para o planejador.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+
+# Facetas indexadas (mesmos argumentos de SearchServiceEnhanced.filter_items)
+FACET_KEYS = (
+    'filtro_principal', 'subcategoria', 'ps_onerosa', 'adq_exterior',
+    'local_incidencia', 'cclasstrib_filter', 'tipo_tributacao', 'grupo_lc116',
+)
+
+# Códigos indexados só para a consulta avançada (campos lc116:, nbs: e indop:)
+CODE_KEYS = ('item_lc116', 'nbs_code', 'indop')
+
+# Campos de cada entrada NBS: na consulta avançada, termos desses campos ligados por E
+# precisam casar com a mesma entrada
+ENTRY_KEYS = ('nbs_code', 'indop', 'local_incidencia', 'cclasstrib_filter')
+
+
+def cclasstrib_code(value: str) -> str:
+    """Código de um filtro de classificação ("200029 - Nome" -> "200029")."""
+    return value.split(' - ')[0] if ' - ' in value else value
+
+
+def grupo_number(value: str) -> str:
+    """Número de um filtro de grupo LC116 ("17 - Descrição" -> "17")."""
+    return value.split(' ')[0].replace('.', '') if ' ' in value else value
+
+
+class FacetIndex:
+    """Posições de cada valor de faceta de uma base, como bitmaps numpy."""
+
+    def __init__(self, items: List[Dict], classify: Callable[[str], Dict]):
+        """
+        Args:
+            items: Itens da base (as posições seguem esta lista)
+            classify: Resolve a categoria didática de um código cClassTrib
+        """
+        self.items = items
+        self.size = len(items)
+        positions: Dict[str, Dict[str, List[int]]] = {key: {} for key in FACET_KEYS + CODE_KEYS}
+
+        def add(key: str, value: str, pos: int):
+            posting = positions[key].setdefault(value, [])
+            # Vários valores iguais no mesmo item contam uma vez
+            if not posting or posting[-1] != pos:
+                posting.append(pos)
+
+        # Uma linha por entrada NBS, na ordem dos itens (entry_item diz de qual item é a linha)
+        entry_positions: Dict[str, Dict[str, List[int]]] = {key: {} for key in ENTRY_KEYS}
+        entry_item: List[int] = []
+
+        def add_entry(key: str, value: str, row: int):
+            rows = entry_positions[key].setdefault(value, [])
+            if not rows or rows[-1] != row:
+                rows.append(row)
+
+        categorias: Dict[str, str] = {}
+        for pos, item in enumerate(items):
+            if value := item.get('filtro_principal'):
+                add('filtro_principal', value, pos)
+            if value := item.get('subcategoria'):
+                add('subcategoria', value, pos)
+            if item_code := item.get('item_lc116', ''):
+                add('grupo_lc116', item_code.split('.')[0], pos)
+                add('item_lc116', item_code, pos)
+            for nbs in item.get('nbs_entries', []):
+                row = len(entry_item)
+                entry_item.append(pos)
+                for key in ('nbs_code', 'indop'):
+                    if value := nbs.get(key):
+                        add(key, value, pos)
+                        add_entry(key, value, row)
+                for key, field in (('ps_onerosa', 'ps_onerosa'), ('adq_exterior', 'adq_exterior'),
+                                   ('local_incidencia', 'local_incidencia_ibs')):
+                    if value := nbs.get(field):
+                        add(key, value, pos)
+                        if key in ENTRY_KEYS:
+                            add_entry(key, value, row)
+                for cc in nbs.get('cclasstrib', []):
+                    codigo = cc.get('codigo', '')
+                    if codigo:
+                        add('cclasstrib_filter', codigo, pos)
+                        add_entry('cclasstrib_filter', codigo, row)
+                    if codigo not in categorias:
+                        categorias[codigo] = classify(codigo)['categoria']
+                    add('tipo_tributacao', categorias[codigo], pos)
+
+        self._bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        self._normalized: Dict[str, List[Tuple[str, np.ndarray]]] = {}
+        for key, values in positions.items():
+            self._bitmaps[key] = {}
+            for value, posting in values.items():
+                bitmap = np.zeros(self.size, dtype=bool)
+                bitmap[posting] = True
+                self._bitmaps[key][value] = bitmap
+
+        self.entry_item = np.array(entry_item, dtype=np.int64)
+        self.entry_count = len(entry_item)
+        self._entry_rows: Dict[str, Dict[str, np.ndarray]] = {
+            key: {value: np.array(rows, dtype=np.int64) for value, rows in values.items()}
+            for key, values in entry_positions.items()
+        }
+        self._entry_normalized: Dict[str, List[Tuple[str, np.ndarray]]] = {}
+
+    def bitmap(self, key: str, value: str) -> np.ndarray:
+        """Itens que passam em um filtro (mesma semântica de filter_items)."""
+        values = self._bitmaps[key]
+        if key == 'cclasstrib_filter':
+            value = cclasstrib_code(value)
+        elif key == 'grupo_lc116':
+            value = grupo_number(value)
+        elif key == 'tipo_tributacao':
+            # O filtro de tipo casa por trecho do nome da categoria
+            tipo = value.lower()
+            result = np.zeros(self.size, dtype=bool)
+            for categoria, bitmap in values.items():
+                if tipo in categoria.lower():
+                    result |= bitmap
+            return result
+        found = values.get(value)
+        return found if found is not None else np.zeros(self.size, dtype=bool)
+
+    def normalized_values(self, key: str, normalize: Callable[[str], str]) -> List[Tuple[str, np.ndarray]]:
+        """Valores distintos de uma faceta, normalizados, com os bitmaps (calculados uma vez)."""
+        values = self._normalized.get(key)
+        if values is None:
+            values = [(normalize(value), bitmap) for value, bitmap in self._bitmaps[key].items()]
+            self._normalized[key] = values
+        return values
+
+    def normalized_entry_values(self, key: str, normalize: Callable[[str], str]) -> List[Tuple[str, np.ndarray]]:
+        """Como normalized_values, mas com as linhas das entradas NBS que têm cada valor."""
+        values = self._entry_normalized.get(key)
+        if values is None:
+            values = [(normalize(value), rows) for value, rows in self._entry_rows[key].items()]
+            self._entry_normalized[key] = values
+        return values
+
+    def entry_items(self, entries: np.ndarray) -> np.ndarray:
+        """Itens com alguma das entradas NBS marcadas no bitmap de entradas."""
+        result = np.zeros(self.size, dtype=bool)
+        result[self.entry_item[entries]] = True
+        return result
+
+    def cardinality(self, key: str, value: str) -> int:
+        return int(np.count_nonzero(self.bitmap(key, value)))
+
+    def combine(self, filters: Dict[str, Optional[str]]) -> Optional[np.ndarray]:
+        """Interseção dos filtros ativos (None se nenhum filtro estiver ativo)."""
+        result: Optional[np.ndarray] = None
+        for key in FACET_KEYS:
+            value = filters.get(key)
+            if not value:
+                continue
+            bitmap = self.bitmap(key, value)
+            result = bitmap.copy() if result is None else result & bitmap
+        return result
@@ -0,0 +1,98 @@
+"""
+Motor de busca aproximada (fuzzy) sobre o corpus normalizado do SearchIndex.
+As comparações são feitas em lote pelo rapidfuzz (`process.cdist`, código C que
+libera o GIL), em blocos, com a mesma pontuação da busca item a item.
+"""
+import threading
+from typing import List, Optional, Sequence, Set, Tuple
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from services.search_index import SearchIndex
+
+
+# Textos comparados por chamada ao cdist (entre blocos verifica-se o cancelamento)
+DEFAULT_CHUNK_SIZE = 2048
+
+# Peso das correspondências nas descrições NBS e bônus do termo original
+NBS_WEIGHT = 0.7
+ORIGINAL_TERM_BONUS = 10.0
+
+
+class SearchCancelledError(Exception):
+    """Busca interrompida porque a requisição foi cancelada ou expirou."""
+
+
+class FuzzyEngine:
+    """Pontua itens por `fuzz.partial_ratio` usando comparações vetorizadas."""
+
+    def __init__(self, index: SearchIndex, threshold: float, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.index = index
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+
+    def _ratios(self, terms: List[str], texts: Sequence[str], cancel: Optional[threading.Event]) -> np.ndarray:
+        """Matriz termos x textos de partial_ratio, calculada em blocos."""
+        ratios = np.zeros((len(terms), len(texts)), dtype=np.float64)
+        for start in range(0, len(texts), self.chunk_size):
+            if cancel is not None and cancel.is_set():
+                raise SearchCancelledError()
+            chunk = texts[start:start + self.chunk_size]
+            ratios[:, start:start + len(chunk)] = process.cdist(
+                terms, chunk, scorer=fuzz.partial_ratio, dtype=np.float64
+            )
+        return ratios
+
+    def search(
+        self,
+        search_terms: Set[str],
+        original_query: str,
+        search_fields: List[str],
+        positions: Optional[List[int]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Executa a busca aproximada.
+
+        Args:
+            search_terms: Termos normalizados (consulta e sinônimos)
+            original_query: Consulta normalizada (recebe bônus)
+            search_fields: Campos de item comparados (as descrições NBS sempre são)
+            positions: Restringe a busca a estas posições (None = toda a base)
+            cancel: Evento que interrompe a busca entre blocos
+
+        Returns:
+            Lista de (posição, score) com score > 0, em ordem decrescente de score
+            (empates mantêm a ordem das posições)
+
+        Raises:
+            SearchCancelledError: O evento de cancelamento foi acionado
+        """
+        if positions is None:
+            positions = list(range(len(self.index)))
+        positions = np.asarray(positions, dtype=np.int64)
+        terms = sorted(search_terms)
+        bonus = np.array([ORIGINAL_TERM_BONUS if term == original_query else 0.0 for term in terms])[:, None]
+        scores = np.zeros(len(positions), dtype=np.float64)
+
+        for field in search_fields:
+            values = self.index.field_values(field)
+            ratios = self._ratios(terms, [values[pos] for pos in positions], cancel)
+            field_scores = np.where(ratios >= self.threshold, ratios + bonus, 0.0)
+            np.maximum(scores, field_scores.max(axis=0, initial=0.0), out=scores)
+
+        # Descrições NBS achatadas, com o índice (na lista de posições) do item de cada uma
+        nbs_texts: List[str] = []
+        owners: List[int] = []
+        for i, pos in enumerate(positions):
+            descriptions = self.index.nbs_descriptions[pos]
+            nbs_texts.extend(descriptions)
+            owners.extend([i] * len(descriptions))
+        if nbs_texts:
+            ratios = self._ratios(terms, nbs_texts, cancel)
+            nbs_scores = np.where(ratios >= self.threshold, ratios * NBS_WEIGHT, 0.0).max(axis=0)
+            np.maximum.at(scores, np.asarray(owners, dtype=np.int64), nbs_scores)
+
+        matched = np.flatnonzero(scores > 0)
+        order = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(int(positions[i]), float(scores[i])) for i in order]
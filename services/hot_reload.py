@@ -0,0 +1,163 @@
+"""
+Recarga a quente da base sem reiniciar o processo.
+Uma thread em segundo plano observa os arquivos de dados; quando eles mudam, o
+novo conjunto de serviços (bases + índices) é construído fora do caminho das
+requisições e trocado atomicamente. Execuções em andamento terminam sobre o
+snapshot antigo, que continuam referenciando.
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Intervalo entre verificações dos arquivos observados
+DEFAULT_POLL_INTERVAL_S = 5.0
+
+# Quantidade de durações de recarga mantidas nas métricas
+METRICS_HISTORY = 20
+
+# (caminho, mtime em ns, tamanho) de cada arquivo observado
+FileSignature = Tuple[Tuple[str, int, int], ...]
+
+
+def files_signature(paths: Iterable[Path]) -> FileSignature:
+    """Assinatura dos arquivos (diretórios são expandidos um nível)."""
+    entries = []
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.iterdir()) if path.is_dir() else [path]
+        for file in files:
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            if file.is_file():
+                entries.append((str(file), stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+class ServiceSnapshot:
+    """Conjunto imutável de serviços servido às requisições."""
+
+    def __init__(self, services: Any, generation: int, signature: FileSignature):
+        self.services = services
+        self.generation = generation
+        self.signature = signature
+        self.loaded_at = datetime.now()
+
+
+class ReloadMetrics:
+    """Métricas das recargas (duração, quantidade e falhas)."""
+
+    def __init__(self):
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.durations_ms: deque = deque(maxlen=METRICS_HISTORY)
+
+    def record(self, duration_ms: float, error: Optional[str] = None):
+        if error is None:
+            self.reloads += 1
+            self.durations_ms.append(duration_ms)
+        else:
+            self.failures += 1
+        self.last_error = error
+
+    def as_dict(self) -> Dict[str, Any]:
+        durations = list(self.durations_ms)
+        return {
+            'recargas': self.reloads,
+            'falhas': self.failures,
+            'ultimo_erro': self.last_error,
+            'ultima_duracao_ms': durations[-1] if durations else None,
+            'duracao_media_ms': sum(durations) / len(durations) if durations else None,
+            'duracao_maxima_ms': max(durations) if durations else None,
+        }
+
+
+class HotReloader:
+    """Mantém o snapshot atual de serviços e o substitui quando os dados mudam."""
+
+    def __init__(
+        self,
+        build: Callable[[], Any],
+        watched_paths: List[Path],
+        poll_interval_s: float = DEFAULT_POLL_INTERVAL_S
+    ):
+        """
+        Args:
+            build: Constrói os serviços a partir dos arquivos (pode levantar exceção)
+            watched_paths: Arquivos/diretórios cujas alterações disparam a recarga
+            poll_interval_s: Intervalo entre verificações
+        """
+        self.build = build
+        self.watched_paths = [Path(p) for p in watched_paths]
+        self.poll_interval_s = poll_interval_s
+        self.metrics = ReloadMetrics()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot: Optional[ServiceSnapshot] = None
+        # Assinatura da última tentativa (com ou sem sucesso)
+        self._seen_signature: FileSignature = ()
+        self.reload()
+        if self._snapshot is None:
+            raise RuntimeError(f"Falha ao carregar os serviços: {self.metrics.last_error}")
+
+    @property
+    def current(self) -> ServiceSnapshot:
+        """Snapshot atual (leitura de uma única referência: não bloqueia)."""
+        return self._snapshot
+
+    def reload(self) -> bool:
+        """
+        Constrói um novo snapshot e o publica. Em caso de falha o atual é mantido.
+
+        Returns:
+            True se um novo snapshot foi publicado
+        """
+        with self._reload_lock:
+            # Em caso de falha, só tenta de novo quando os arquivos mudarem outra vez
+            signature = self._seen_signature = files_signature(self.watched_paths)
+            start = time.perf_counter()
+            try:
+                services = self.build()
+            except Exception as e:
+                self.metrics.record((time.perf_counter() - start) * 1000, error=str(e))
+                return False
+            generation = self._snapshot.generation + 1 if self._snapshot else 1
+            # Troca de ponteiro: novas requisições passam a usar o novo snapshot
+            self._snapshot = ServiceSnapshot(services, generation, signature)
+            self.metrics.record((time.perf_counter() - start) * 1000)
+            return True
+
+    def check(self) -> bool:
+        """Recarrega se os arquivos mudaram e pararam de mudar (evita ler cópias pela metade)."""
+        signature = files_signature(self.watched_paths)
+        if signature == self._seen_signature:
+            return False
+        if self._stop.wait(self.poll_interval_s / 2):
+            return False
+        if files_signature(self.watched_paths) != signature:
+            return False
+        return self.reload()
+
+    def start(self) -> 'HotReloader':
+        """Inicia a thread observadora (daemon)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="dataset-hot-reload", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval_s):
+            self.check()
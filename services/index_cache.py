@@ -0,0 +1,73 @@
+"""
+Cache em disco do índice de busca pré-compilado.
+O arquivo acompanha a base (ex.: base.json -> base.index.pkl) e guarda o hash do
+conteúdo da base; só é usado quando o hash confere.
+"""
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, Optional
+
+from services.search_index import SearchIndex
+
+
+INDEX_CACHE_SUFFIX = '.index.pkl'
+INDEX_CACHE_FORMAT = 1
+
+
+def index_cache_path(data_file: Path) -> Path:
+    """Caminho do cache de índice associado a um arquivo de dados."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + INDEX_CACHE_SUFFIX)
+
+
+def file_sha256(path: Path) -> str:
+    """Hash SHA-256 do conteúdo de um arquivo (lido em blocos)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_index_cache(data_file: Path, index: SearchIndex, metadata: Dict[str, str]) -> Path:
+    """Grava o índice (com os itens) vinculado ao hash atual do arquivo de dados."""
+    cache_path = index_cache_path(data_file)
+    payload = {
+        'format': INDEX_CACHE_FORMAT,
+        'source_sha256': file_sha256(data_file),
+        'fonte': metadata.get('fonte', 'N/A'),
+        'sheet': metadata.get('sheet', 'N/A'),
+        'index': index,
+    }
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def load_index_cache(data_file: Path) -> Optional[Dict]:
+    """
+    Carrega o cache de índice se ele corresponder ao conteúdo atual da base.
+
+    O arquivo é gerado localmente pelo pipeline de ingestão (pickle: use apenas
+    caches produzidos pelo próprio sistema).
+
+    Returns:
+        Dict com 'fonte', 'sheet' e 'index', ou None se ausente/desatualizado
+    """
+    cache_path = index_cache_path(data_file)
+    if not cache_path.exists() or not Path(data_file).exists():
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if payload.get('format') != INDEX_CACHE_FORMAT:
+        return None
+    if payload.get('source_sha256') != file_sha256(data_file):
+        return None
+    return payload
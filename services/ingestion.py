@@ -0,0 +1,302 @@
+"""
+Pipeline de ingestão da planilha oficial do AnexoVIII (XLSX) para a base JSON.
+Lê a planilha em modo streaming, agrupa as linhas em itens -> NBS -> cClassTrib,
+aplica o mapeamento de categorias e grava a base, seu manifesto de hashes e o
+cache de índice. Grupos (itens LC116) sem alteração de conteúdo são reaproveitados.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from openpyxl import load_workbook
+
+from config.settings import BASE_DIR
+from services.index_cache import load_index_cache, save_index_cache
+from services.loaders import DatasetLoadError, JsonLoader, get_loader
+from services.search_index import SearchIndex
+from services.search_service import SearchServiceEnhanced
+from services.sqlite_backend import build_sqlite_database
+
+
+DEFAULT_SHEET = "tabela geral"
+DEFAULT_CATEGORIES_FILE = BASE_DIR / "data" / "categorias_lc116.json"
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_FORMAT = 1
+
+# Linhas iniciais inspecionadas para localizar o cabeçalho
+HEADER_SCAN_ROWS = 20
+
+# Cabeçalhos aceitos para cada campo (comparados já normalizados)
+COLUMN_ALIASES = {
+    'item_lc116': ["item lc 116", "item lc116", "item da lista lc 116", "item lista servicos", "item"],
+    'descricao_item': ["descricao item lc 116", "descricao item lc116", "descricao do item", "descricao item"],
+    'nbs_code': ["nbs", "codigo nbs", "cod nbs"],
+    'descricao_nbs': ["descricao nbs", "descricao da nbs"],
+    'ps_onerosa': ["ps onerosa", "prestacao onerosa"],
+    'adq_exterior': ["adq exterior", "aquisicao exterior", "aquisicao do exterior"],
+    'indop': ["indop", "ind op", "indicador de operacao", "indicador da operacao"],
+    'local_incidencia_ibs': ["local incidencia ibs", "local de incidencia do ibs", "local de incidencia ibs"],
+    'cclasstrib_codigo': ["cclasstrib", "codigo cclasstrib", "cod cclasstrib", "classtrib"],
+    'cclasstrib_nome': ["nome cclasstrib", "descricao cclasstrib", "nome classtrib", "descricao classtrib"],
+}
+REQUIRED_COLUMNS = ('item_lc116', 'nbs_code', 'cclasstrib_codigo')
+
+ITEM_COLUMNS = ('item_lc116', 'descricao_item')
+NBS_COLUMNS = ('nbs_code', 'descricao_nbs', 'ps_onerosa', 'adq_exterior', 'indop', 'local_incidencia_ibs')
+
+normalize = SearchServiceEnhanced.normalize_text
+
+
+class IngestionError(Exception):
+    """Planilha ou mapeamento em formato inesperado."""
+
+
+def manifest_path(output_file: Path) -> Path:
+    """Caminho do manifesto de hashes associado à base gerada."""
+    return output_file.with_name(output_file.stem + MANIFEST_SUFFIX)
+
+
+def _clean_cell(field: str, value) -> str:
+    """Converte o valor de uma célula no texto usado pela base."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and field == 'item_lc116':
+        # Itens numéricos perdem o zero à esquerda no Excel (1.01 -> "01.01")
+        return f"{value:05.2f}"
+    if isinstance(value, (int, float)) and field == 'cclasstrib_codigo':
+        # cClassTrib sempre tem 6 dígitos ("000001")
+        return f"{int(value):06d}"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    text = ' '.join(str(value).split())
+    if field in ('ps_onerosa', 'adq_exterior') and text:
+        return text[0].upper()
+    return text
+
+
+def _match_header(row: Tuple) -> Optional[Dict[str, int]]:
+    """Mapeia campo -> índice de coluna se a linha for o cabeçalho."""
+    normalized = [normalize(str(cell)) if cell is not None else '' for cell in row]
+    columns: Dict[str, int] = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        # Preferência pelo alias mais específico (mais longo) que casa exatamente
+        for alias in sorted(aliases, key=len, reverse=True):
+            matches = [i for i, header in enumerate(normalized) if header == alias and i not in columns.values()]
+            if matches:
+                columns[field] = matches[0]
+                break
+    if all(field in columns for field in REQUIRED_COLUMNS):
+        return columns
+    return None
+
+
+def read_sheet_rows(xlsx_file: Path, sheet: str = DEFAULT_SHEET) -> Iterator[Dict[str, str]]:
+    """
+    Lê a planilha em modo read-only (streaming) e produz uma linha por NBS x cClassTrib.
+    Células mescladas/vazias de item e NBS herdam o valor da linha anterior.
+    """
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        if sheet not in workbook.sheetnames:
+            raise IngestionError(f"Aba '{sheet}' não encontrada em {xlsx_file.name}")
+        rows = workbook[sheet].iter_rows(values_only=True)
+
+        columns = None
+        for _ in range(HEADER_SCAN_ROWS):
+            row = next(rows, None)
+            if row is None:
+                break
+            columns = _match_header(row)
+            if columns:
+                break
+        if not columns:
+            raise IngestionError(f"Cabeçalho não reconhecido na aba '{sheet}'")
+
+        previous: Dict[str, str] = {}
+        for row in rows:
+            values = {
+                field: _clean_cell(field, row[index] if index < len(row) else None)
+                for field, index in columns.items()
+            }
+            if not any(values.values()):
+                continue
+            if not any(values.get(field) for field in ITEM_COLUMNS):
+                values.update({field: previous.get(field, '') for field in ITEM_COLUMNS})
+            if not values.get('nbs_code') and values.get('cclasstrib_codigo'):
+                values.update({field: previous.get(field, '') for field in NBS_COLUMNS})
+            for field in COLUMN_ALIASES:
+                values.setdefault(field, '')
+            previous = values
+            yield values
+    finally:
+        workbook.close()
+
+
+def group_rows(rows: Iterator[Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
+    """Agrupa as linhas por item LC116, preservando a ordem de aparição."""
+    groups: Dict[str, List[Dict[str, str]]] = {}
+    for row in rows:
+        key = row['item_lc116'] or f"desc:{normalize(row['descricao_item'])}"
+        groups.setdefault(key, []).append(row)
+    return groups
+
+
+class CategoryMapper:
+    """Aplica o mapeamento item LC116 -> (filtro principal, subcategoria)."""
+
+    def __init__(self, categories_file: Path = DEFAULT_CATEGORIES_FILE):
+        with open(categories_file, 'r', encoding='utf-8') as f:
+            mapping = json.load(f)
+        self.default = mapping['padrao']
+        self.by_code = mapping.get('itens', {})
+        self.by_description = mapping.get('descricoes', {})
+
+    def categorize(self, item_lc116: str, descricao_item: str) -> Dict[str, str]:
+        if item_lc116 in self.by_code:
+            return self.by_code[item_lc116]
+        return self.by_description.get(normalize(descricao_item), self.default)
+
+
+def build_item(rows: List[Dict[str, str]], category: Dict[str, str]) -> Dict:
+    """Monta o registro de um item (item -> NBS -> cClassTrib) a partir das suas linhas."""
+    first = rows[0]
+    nbs_entries: List[Dict] = []
+    entry_by_key: Dict[Tuple, Dict] = {}
+    for row in rows:
+        if not row['nbs_code']:
+            continue
+        key = tuple(row[field] for field in NBS_COLUMNS)
+        entry = entry_by_key.get(key)
+        if entry is None:
+            entry = {field: row[field] for field in NBS_COLUMNS}
+            entry['cclasstrib'] = []
+            entry_by_key[key] = entry
+            nbs_entries.append(entry)
+        if row['cclasstrib_codigo']:
+            cc = {'codigo': row['cclasstrib_codigo'], 'nome': row['cclasstrib_nome']}
+            if cc not in entry['cclasstrib']:
+                entry['cclasstrib'].append(cc)
+    return {
+        'item_lc116': first['item_lc116'],
+        'descricao_item': first['descricao_item'],
+        'filtro_principal': category['filtro_principal'],
+        'subcategoria': category['subcategoria'],
+        'nbs_entries': nbs_entries,
+    }
+
+
+def group_hash(rows: List[Dict[str, str]], category: Dict[str, str]) -> str:
+    """Hash do conteúdo de um grupo (linhas + categoria aplicada)."""
+    payload = json.dumps([rows, category], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class AnexoIngestor:
+    """Constrói a base JSON a partir da planilha oficial, com reconstrução incremental."""
+
+    def __init__(
+        self,
+        xlsx_file: Path,
+        output_file: Path,
+        sheet: str = DEFAULT_SHEET,
+        categories_file: Path = DEFAULT_CATEGORIES_FILE
+    ):
+        self.xlsx_file = Path(xlsx_file)
+        self.output_file = Path(output_file)
+        self.sheet = sheet
+        self.mapper = CategoryMapper(categories_file)
+
+    def _previous_state(self) -> Tuple[Dict[str, str], Dict[str, Dict], Optional[str]]:
+        """Hashes e itens da execução anterior (vazios se não houver base válida)."""
+        manifest_file = manifest_path(self.output_file)
+        if not manifest_file.exists() or not self.output_file.exists():
+            return {}, {}, None
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            previous = JsonLoader().load(self.output_file)
+        except (OSError, ValueError, DatasetLoadError):
+            return {}, {}, None
+        if manifest.get('format') != MANIFEST_FORMAT:
+            return {}, {}, None
+        keys = manifest.get('ordem', [])
+        if len(keys) != len(previous['itens']):
+            return {}, {}, None
+        return manifest.get('grupos', {}), dict(zip(keys, previous['itens'])), manifest.get('dataset_sha256')
+
+    def run(self, force: bool = False) -> Dict[str, int]:
+        """
+        Executa a ingestão.
+
+        Args:
+            force: Reconstrói todos os grupos e regrava a base mesmo sem alterações
+
+        Returns:
+            Resumo com total de grupos, reconstruídos, reaproveitados e se a base e o cache
+            de índice foram gravados
+        """
+        groups = group_rows(read_sheet_rows(self.xlsx_file, self.sheet))
+        previous_hashes, previous_items, previous_dataset_hash = ({}, {}, None) if force else self._previous_state()
+
+        items: List[Dict] = []
+        hashes: Dict[str, str] = {}
+        rebuilt = 0
+        for key, rows in groups.items():
+            category = self.mapper.categorize(rows[0]['item_lc116'], rows[0]['descricao_item'])
+            digest = group_hash(rows, category)
+            hashes[key] = digest
+            if previous_hashes.get(key) == digest and key in previous_items:
+                items.append(previous_items[key])
+            else:
+                items.append(build_item(rows, category))
+                rebuilt += 1
+
+        dataset_hash = hashlib.sha256(
+            json.dumps([self.xlsx_file.name, self.sheet, list(hashes.items())]).encode('utf-8')
+        ).hexdigest()
+        summary = {
+            'grupos': len(groups),
+            'reconstruidos': rebuilt,
+            'reaproveitados': len(groups) - rebuilt,
+            'gravado': 0,
+            'indice': 0,
+        }
+        if dataset_hash == previous_dataset_hash:
+            # Base mantida, mas o cache de índice pode ter sido apagado ou ficado desatualizado
+            if load_index_cache(self.output_file) is None:
+                self.write_index_cache()
+                summary['indice'] = 1
+            return summary
+
+        metadata = {'fonte': self.xlsx_file.name, 'sheet': self.sheet}
+        _write_json_atomic(self.output_file, {**metadata, 'itens': items})
+        _write_json_atomic(manifest_path(self.output_file), {
+            'format': MANIFEST_FORMAT,
+            'dataset_sha256': dataset_hash,
+            'ordem': list(hashes.keys()),
+            'grupos': hashes,
+        })
+        self.write_index_cache()
+        summary['gravado'] = 1
+        summary['indice'] = 1
+        return summary
+
+    def write_index_cache(self) -> Path:
+        """Pré-compila o índice de busca sobre a base exatamente como o app a carrega."""
+        dataset = get_loader(self.output_file).load(self.output_file)
+        index = SearchIndex(dataset['itens'], normalize)
+        return save_index_cache(self.output_file, index, dataset)
+
+    def write_sqlite_database(self) -> Path:
+        """Grava a base no arquivo SQLite do backend alternativo (ver services/sqlite_backend.py)."""
+        dataset = get_loader(self.output_file).load(self.output_file)
+        return build_sqlite_database(self.output_file, dataset['itens'], SearchServiceEnhanced())
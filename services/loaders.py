@@ -0,0 +1,373 @@
+"""
+Carregadores de bases de dados (JSON, JSON em streaming, JSONL e Parquet/Arrow).
+Todos produzem o mesmo modelo interno compacto: {'fonte', 'sheet', 'itens'}.
+"""
+import json
+import sys
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+
+
+# Arquivos JSON acima deste tamanho são lidos em streaming
+STREAMING_THRESHOLD_BYTES = 50 * 1024 * 1024
+
+# Tamanho do bloco lido a cada passo pelo parser em streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Colunas do formato plano (uma linha por NBS x cClassTrib) usado em Parquet/Arrow.
+# item_ordem/nbs_ordem identificam o item e a entrada NBS (códigos podem se repetir).
+FLAT_COLUMNS = [
+    'item_ordem', 'item_lc116', 'descricao_item', 'filtro_principal', 'subcategoria',
+    'nbs_ordem', 'nbs_code', 'descricao_nbs', 'ps_onerosa', 'adq_exterior', 'indop',
+    'local_incidencia_ibs', 'cclasstrib_codigo', 'cclasstrib_nome',
+]
+
+# Campos de item e de entrada NBS preservados no modelo interno
+ITEM_FIELDS = ('item_lc116', 'descricao_item', 'filtro_principal', 'subcategoria')
+NBS_FIELDS = ('nbs_code', 'descricao_nbs', 'ps_onerosa', 'adq_exterior', 'indop', 'local_incidencia_ibs')
+
+
+class DatasetLoadError(Exception):
+    """Falha ao ler uma base de dados."""
+
+
+class RecordCompactor:
+    """Interna textos repetidos e compartilha classificações idênticas entre entradas NBS."""
+
+    def __init__(self):
+        self._classificacoes: Dict[Tuple[str, str], Dict] = {}
+
+    @staticmethod
+    def _text(value) -> str:
+        if value is None:
+            return ''
+        return sys.intern(str(value))
+
+    def classificacao(self, codigo, nome) -> Dict:
+        key = (self._text(codigo), self._text(nome))
+        cc = self._classificacoes.get(key)
+        if cc is None:
+            cc = {'codigo': key[0], 'nome': key[1]}
+            self._classificacoes[key] = cc
+        return cc
+
+    def nbs_entry(self, nbs: Dict) -> Dict:
+        entry = {field: self._text(nbs.get(field, '')) for field in NBS_FIELDS}
+        entry['cclasstrib'] = [
+            self.classificacao(cc.get('codigo', ''), cc.get('nome', ''))
+            for cc in nbs.get('cclasstrib', []) or []
+        ]
+        return entry
+
+    def item(self, item: Dict) -> Dict:
+        record = {field: self._text(item.get(field, '')) for field in ITEM_FIELDS}
+        record['nbs_entries'] = [self.nbs_entry(nbs) for nbs in item.get('nbs_entries', []) or []]
+        return record
+
+
+class DatasetLoader(ABC):
+    """Interface dos carregadores: iteram itens compactos e leem metadados."""
+
+    extensions: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def iter_items(self, path: Path, compactor: RecordCompactor) -> Iterator[Dict]:
+        """Itens da base, um a um, já compactados."""
+
+    def read_metadata(self, path: Path) -> Dict[str, str]:
+        return {}
+
+    def load(self, path: Path) -> Dict:
+        """Carrega a base completa no modelo interno."""
+        compactor = RecordCompactor()
+        try:
+            items = list(self.iter_items(path, compactor))
+            metadata = self.read_metadata(path)
+        except (OSError, ValueError) as e:
+            raise DatasetLoadError(f"{path.name}: {e}") from e
+        return {
+            'fonte': metadata.get('fonte', 'N/A'),
+            'sheet': metadata.get('sheet', 'N/A'),
+            'itens': items,
+        }
+
+
+class JsonLoader(DatasetLoader):
+    """Lê o JSON inteiro com json.load (arquivos pequenos)."""
+
+    extensions = ('.json',)
+
+    def __init__(self):
+        self._metadata: Dict[str, str] = {}
+
+    def iter_items(self, path: Path, compactor: RecordCompactor) -> Iterator[Dict]:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self._metadata = {k: v for k, v in data.items() if k != 'itens'}
+        items = data.pop('itens', [])
+        for item in items:
+            yield compactor.item(item)
+
+    def read_metadata(self, path: Path) -> Dict[str, str]:
+        return self._metadata
+
+
+class StreamingJsonLoader(DatasetLoader):
+    """
+    Lê o JSON em blocos, decodificando um item de 'itens' por vez.
+    A árvore completa nunca fica em memória: cada item vira registro compacto assim que lido.
+    """
+
+    extensions = ('.json',)
+
+    def __init__(self, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._metadata: Dict[str, str] = {}
+
+    def iter_items(self, path: Path, compactor: RecordCompactor) -> Iterator[Dict]:
+        self._metadata = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            reader = _JsonStreamReader(f, self.chunk_size)
+            reader.expect('{')
+            if reader.peek() == '}':
+                return
+            while True:
+                key = reader.value()
+                if not isinstance(key, str):
+                    raise ValueError(f"esperada uma chave entre aspas, encontrado {key!r}")
+                reader.expect(':')
+                if key == 'itens':
+                    for item in reader.array():
+                        yield compactor.item(item)
+                else:
+                    self._metadata[key] = reader.value()
+                separator = reader.next_char()
+                if separator == '}':
+                    break
+                if separator != ',':
+                    raise ValueError(f"esperado ',' ou '}}', encontrado '{separator}'")
+            reader.expect_end()
+
+    def read_metadata(self, path: Path) -> Dict[str, str]:
+        return self._metadata
+
+
+class _JsonStreamReader:
+    """Leitor incremental mínimo: decodifica valores JSON completos de um buffer que cresce sob demanda."""
+
+    def __init__(self, file, chunk_size: int):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        # Descarta o que já foi consumido para manter o buffer pequeno
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _skip_whitespace(self) -> bool:
+        """Avança até o próximo caractere significativo; False no fim do arquivo."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return True
+            if not self._fill():
+                return False
+
+    def peek(self) -> str:
+        if not self._skip_whitespace():
+            raise ValueError("fim inesperado do arquivo JSON")
+        return self._buffer[self._pos]
+
+    def expect_end(self):
+        if self._skip_whitespace():
+            raise ValueError(f"conteúdo após o fim do JSON: '{self._buffer[self._pos]}'")
+
+    def next_char(self) -> str:
+        char = self.peek()
+        self._pos += 1
+        return char
+
+    def expect(self, char: str):
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f"esperado '{char}', encontrado '{found}'")
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # Um valor que termina no fim do buffer pode estar truncado (ex.: números)
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def array(self) -> Iterator:
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.next_char()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"esperado ',' ou ']', encontrado '{separator}'")
+
+
+class JsonlLoader(DatasetLoader):
+    """Lê um item por linha; uma linha com 'fonte' e sem 'item_lc116' traz os metadados."""
+
+    extensions = ('.jsonl', '.ndjson')
+
+    def __init__(self):
+        self._metadata: Dict[str, str] = {}
+
+    def iter_items(self, path: Path, compactor: RecordCompactor) -> Iterator[Dict]:
+        self._metadata = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"linha {line_number}: {e}") from e
+                if 'item_lc116' not in record and 'fonte' in record:
+                    self._metadata = record
+                    continue
+                yield compactor.item(record)
+
+    def read_metadata(self, path: Path) -> Dict[str, str]:
+        return self._metadata
+
+
+class ArrowLoader(DatasetLoader):
+    """
+    Lê o formato plano (FLAT_COLUMNS) em lotes e reagrupa as linhas em itens.
+    Metadados 'fonte' e 'sheet' vêm dos metadados do schema.
+    """
+
+    extensions = ('.parquet', '.arrow', '.feather')
+
+    def __init__(self, batch_size: int = 10_000):
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _require_pyarrow():
+        if pa is None:
+            raise ValueError("pyarrow não está instalado (necessário para Parquet/Arrow)")
+
+    def _iter_batches(self, path: Path):
+        self._require_pyarrow()
+        if path.suffix.lower() == '.parquet':
+            yield from pq.ParquetFile(path).iter_batches(batch_size=self.batch_size, columns=FLAT_COLUMNS)
+        else:
+            # Arrow IPC/Feather v2: lotes lidos sob demanda via memory map
+            with pa.memory_map(str(path)) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+
+    def iter_items(self, path: Path, compactor: RecordCompactor) -> Iterator[Dict]:
+        current: Optional[Dict] = None
+        current_nbs: Optional[Dict] = None
+        item_key = nbs_key = None
+
+        for batch in self._iter_batches(path):
+            columns = {name: batch.column(name).to_pylist() for name in FLAT_COLUMNS}
+            for row in range(batch.num_rows):
+                values = {name: columns[name][row] for name in FLAT_COLUMNS}
+                if current is None or values['item_ordem'] != item_key:
+                    if current is not None:
+                        yield current
+                    current = compactor.item({field: values[field] for field in ITEM_FIELDS})
+                    current_nbs = None
+                    item_key = values['item_ordem']
+                if values['nbs_ordem'] is None:
+                    continue
+                if current_nbs is None or values['nbs_ordem'] != nbs_key:
+                    current_nbs = compactor.nbs_entry({field: values[field] for field in NBS_FIELDS})
+                    current['nbs_entries'].append(current_nbs)
+                    nbs_key = values['nbs_ordem']
+                if values['cclasstrib_codigo'] is not None:
+                    current_nbs['cclasstrib'].append(
+                        compactor.classificacao(values['cclasstrib_codigo'], values['cclasstrib_nome'])
+                    )
+
+        if current is not None:
+            yield current
+
+    def read_metadata(self, path: Path) -> Dict[str, str]:
+        self._require_pyarrow()
+        if path.suffix.lower() == '.parquet':
+            schema = pq.read_schema(path)
+        else:
+            with pa.memory_map(str(path)) as source:
+                schema = pa.ipc.open_file(source).schema
+        metadata = schema.metadata or {}
+        return {
+            key.decode('utf-8'): value.decode('utf-8')
+            for key, value in metadata.items()
+            if key in (b'fonte', b'sheet')
+        }
+
+
+def flat_rows(items: List[Dict]) -> Iterator[Dict]:
+    """Achata itens no formato FLAT_COLUMNS (inverso do ArrowLoader)."""
+    for item_ordem, item in enumerate(items):
+        base = {'item_ordem': item_ordem, **{field: item.get(field, '') for field in ITEM_FIELDS}}
+        nbs_entries = item.get('nbs_entries', [])
+        if not nbs_entries:
+            yield {**base, 'nbs_ordem': None, **{field: None for field in NBS_FIELDS},
+                   'cclasstrib_codigo': None, 'cclasstrib_nome': None}
+            continue
+        for nbs_ordem, nbs in enumerate(nbs_entries):
+            row = {**base, 'nbs_ordem': nbs_ordem, **{field: nbs.get(field, '') for field in NBS_FIELDS}}
+            classificacoes = nbs.get('cclasstrib', [])
+            if not classificacoes:
+                yield {**row, 'cclasstrib_codigo': None, 'cclasstrib_nome': None}
+            for cc in classificacoes:
+                yield {**row, 'cclasstrib_codigo': cc.get('codigo', ''), 'cclasstrib_nome': cc.get('nome', '')}
+
+
+# Extensões aceitas por get_loader
+SUPPORTED_EXTENSIONS = JsonLoader.extensions + JsonlLoader.extensions + ArrowLoader.extensions
+
+
+def get_loader(path: Path) -> DatasetLoader:
+    """Escolhe o carregador pela extensão (e pelo tamanho, no caso de JSON)."""
+    suffix = path.suffix.lower()
+    if suffix == '.json':
+        if path.exists() and path.stat().st_size > STREAMING_THRESHOLD_BYTES:
+            return StreamingJsonLoader()
+        return JsonLoader()
+    for loader_class in (JsonlLoader, ArrowLoader):
+        if suffix in loader_class.extensions:
+            return loader_class()
+    raise DatasetLoadError(f"Formato de base não suportado: {path.suffix}")
@@ -0,0 +1,296 @@
+"""
+Busca na granularidade de entrada NBS: cada resultado é um par (item, entrada NBS),
+pontuado e ordenado por conta própria. As listas invertidas apontam para linhas (uma
+por entrada NBS, na mesma ordem da tabela plana de resultados); as palavras dos campos
+do item valem para todas as entradas dele, com peso menor, de modo que as entradas
+cuja própria descrição casa vêm primeiro. Os filtros de NBS (onerosa, exterior, local,
+cClassTrib, tipo) também são aplicados por entrada.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import re
+import numpy as np
+
+from services.facet_index import FacetIndex, cclasstrib_code
+from services.token_index import SYNONYM_WEIGHT, TokenClause, TokenIndex
+
+
+# Peso de cada origem na pontuação da entrada
+DESCRIPTION_WEIGHT = 1.0
+CODE_WEIGHT = 0.9
+ITEM_FIELD_WEIGHT = 0.5  # palavra só nos campos do item (vale para todas as entradas dele)
+
+# Pontuação da busca por código
+CODE_PREFIX_SCORE = 100.0
+CODE_CONTAINS_SCORE = 90.0
+ITEM_CODE_SCORE = 80.0
+
+# Filtros avaliados no item (os demais, por entrada NBS)
+ITEM_FILTER_KEYS = ('filtro_principal', 'subcategoria', 'grupo_lc116')
+# Filtro -> campo da entrada NBS
+ROW_FILTER_FIELDS = {
+    'ps_onerosa': 'ps_onerosa', 'adq_exterior': 'adq_exterior', 'local_incidencia': 'local_incidencia_ibs',
+}
+
+
+def narrow_item(item: Dict, nbs_index: int) -> Dict:
+    """Cópia rasa do item só com uma entrada NBS (para exibir e exportar um acerto)."""
+    return {**item, 'nbs_entries': [item['nbs_entries'][nbs_index]]}
+
+
+class NbsHitIndex:
+    """
+    Listas invertidas palavra -> linhas (entradas NBS) e bitmaps de facetas por linha.
+
+    Attributes:
+        item_row_start: Linhas do item i: item_row_start[i] .. item_row_start[i + 1]
+        row_item: Posição do item de cada linha
+        row_nbs: Índice da entrada NBS (no item) de cada linha
+    """
+
+    def __init__(self, tokens: TokenIndex, classify: Callable[[str], Dict]):
+        """
+        Args:
+            tokens: Índice de palavras da base (vocabulário e casamento por prefixo/radical)
+            classify: Resolve a categoria didática de um código cClassTrib
+        """
+        self.tokens = tokens
+        self.index = tokens.index
+        counts = np.fromiter(
+            (len(entries) for entries in self.index.nbs_descriptions), dtype=np.int64, count=len(self.index)
+        )
+        self.item_row_start = np.zeros(len(self.index) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.item_row_start[1:])
+        self.size = int(self.item_row_start[-1])
+        self.row_item = np.repeat(np.arange(len(self.index), dtype=np.int64), counts)
+        self.row_nbs = np.arange(self.size, dtype=np.int64) - self.item_row_start[self.row_item]
+
+        description_rows: Dict[str, List[int]] = {}
+        code_rows: Dict[str, List[int]] = {}
+        item_positions: Dict[str, List[int]] = {}
+        field_count = len(tokens.fields)
+        for pos, texts in enumerate(tokens.texts):
+            start, count = int(self.item_row_start[pos]), int(counts[pos])
+            for _, words in texts[:field_count]:
+                for word in words:
+                    _append_once(item_positions, word, pos)
+            for i in range(count):
+                for word in texts[field_count + i][1]:
+                    _append_once(description_rows, word, start + i)
+                for word in texts[field_count + count + i][1]:
+                    _append_once(code_rows, word, start + i)
+        self.description_rows = {word: np.asarray(rows, dtype=np.int64) for word, rows in description_rows.items()}
+        self.code_rows = {word: np.asarray(rows, dtype=np.int64) for word, rows in code_rows.items()}
+        self.item_positions = {word: np.asarray(items, dtype=np.int64) for word, items in item_positions.items()}
+        self._build_code_postings()
+        self._build_row_facets(classify)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _build_code_postings(self):
+        """
+        Códigos NBS distintos e LC116 dos itens, cada lista em um texto separado por quebras
+        de linha: a busca por código acha as ocorrências com uma varredura do texto e mapeia
+        os deslocamentos para os códigos por busca binária.
+        """
+        code_rows: Dict[str, List[int]] = {}
+        for pos, codes in enumerate(self.index.nbs_codes):
+            start = int(self.item_row_start[pos])
+            for i, nbs_code in enumerate(codes):
+                code_rows.setdefault(nbs_code, []).append(start + i)
+        codes = sorted(code_rows)
+        self._nbs_code_text, self._nbs_code_start = _joined(codes)
+        counts = np.fromiter((len(code_rows[code]) for code in codes), dtype=np.int64, count=len(codes))
+        self._nbs_code_row_start = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._nbs_code_row_start[1:])
+        self._nbs_code_rows = np.fromiter(
+            (row for code in codes for row in code_rows[code]), dtype=np.int64, count=int(counts.sum())
+        )
+        self._lc116_text, self._lc116_start = _joined(self.index.field_values('item_lc116'))
+
+    def _build_row_facets(self, classify: Callable[[str], Dict]):
+        """Bitmaps (por linha) dos filtros avaliados na entrada NBS."""
+        values: Dict[str, Dict[str, List[int]]] = {key: {} for key in ROW_FILTER_FIELDS}
+        values['cclasstrib_filter'] = {}
+        values['tipo_tributacao'] = {}
+        categorias: Dict[str, str] = {}
+        row = 0
+        for item in self.index.items:
+            for nbs in item.get('nbs_entries', []):
+                for key, field in ROW_FILTER_FIELDS.items():
+                    if value := nbs.get(field):
+                        _append_once(values[key], value, row)
+                for cc in nbs.get('cclasstrib', []):
+                    codigo = cc.get('codigo', '')
+                    if codigo:
+                        _append_once(values['cclasstrib_filter'], codigo, row)
+                    if codigo not in categorias:
+                        categorias[codigo] = classify(codigo)['categoria']
+                    _append_once(values['tipo_tributacao'], categorias[codigo], row)
+                row += 1
+
+        self._row_bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        for key, postings in values.items():
+            self._row_bitmaps[key] = {}
+            for value, rows in postings.items():
+                bitmap = np.zeros(self.size, dtype=bool)
+                bitmap[rows] = True
+                self._row_bitmaps[key][value] = bitmap
+
+    def rows_of(self, positions: np.ndarray) -> np.ndarray:
+        """Linhas (todas as entradas) dos itens, na ordem recebida."""
+        starts = self.item_row_start[positions]
+        counts = self.item_row_start[positions + 1] - starts
+        offsets = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(starts, counts) + offsets
+
+    # =========================================================================
+    # FILTROS
+    # =========================================================================
+
+    def row_bitmap(self, key: str, value: str, facets: FacetIndex) -> np.ndarray:
+        """Linhas que passam em um filtro (mesmos argumentos de filter_items)."""
+        if key in ITEM_FILTER_KEYS:
+            return facets.bitmap(key, value)[self.row_item]
+        values = self._row_bitmaps[key]
+        if key == 'tipo_tributacao':
+            tipo = value.lower()
+            result = np.zeros(self.size, dtype=bool)
+            for categoria, bitmap in values.items():
+                if tipo in categoria.lower():
+                    result |= bitmap
+            return result
+        if key == 'cclasstrib_filter':
+            value = cclasstrib_code(value)
+        found = values.get(value)
+        return found if found is not None else np.zeros(self.size, dtype=bool)
+
+    def filter_rows(self, filters: Dict[str, Optional[str]], facets: FacetIndex) -> Optional[np.ndarray]:
+        """Interseção dos filtros ativos, por linha (None se nenhum filtro estiver ativo)."""
+        result: Optional[np.ndarray] = None
+        for key, value in filters.items():
+            if not value:
+                continue
+            bitmap = self.row_bitmap(key, value, facets)
+            result = bitmap.copy() if result is None else result & bitmap
+        return result
+
+    # =========================================================================
+    # PONTUAÇÃO
+    # =========================================================================
+
+    def _word_weights(self, word: str, match_weight: float, weights: np.ndarray):
+        """Aplica (máximo) o peso de uma palavra do vocabulário às linhas em que ela aparece."""
+        for rows, origin_weight in ((self.description_rows.get(word), DESCRIPTION_WEIGHT),
+                                    (self.code_rows.get(word), CODE_WEIGHT)):
+            if rows is not None:
+                weights[rows] = np.maximum(weights[rows], match_weight * origin_weight)
+        positions = self.item_positions.get(word)
+        if positions is not None:
+            rows = self.rows_of(positions)
+            weights[rows] = np.maximum(weights[rows], match_weight * ITEM_FIELD_WEIGHT)
+
+    def term_weights(self, term: str, prefix: bool = True) -> np.ndarray:
+        """Peso de uma palavra da consulta em cada linha (0 = não casa)."""
+        weights = np.zeros(self.size)
+        for word, match_weight in self.tokens.matches(term, prefix).items():
+            self._word_weights(word, match_weight, weights)
+        return weights
+
+    def clause_weights(self, clause: TokenClause) -> np.ndarray:
+        """
+        Peso de uma parte da consulta em cada linha: a palavra de menor peso (todas
+        precisam casar) ou um sinônimo (palavras inteiras da frase na mesma entrada).
+        """
+        weights = np.full(self.size, np.inf)
+        for word in clause.required_words:
+            np.minimum(weights, self.term_weights(word, clause.is_prefix(word)), out=weights)
+        weights[np.isinf(weights)] = 0.0
+        for phrase in clause.synonyms:
+            phrase_weights = np.full(self.size, np.inf)
+            for word in phrase:
+                exact = np.zeros(self.size)
+                self._word_weights(word, 1.0, exact)
+                np.minimum(phrase_weights, exact, out=phrase_weights)
+            phrase_weights[np.isinf(phrase_weights)] = 0.0
+            np.maximum(weights, SYNONYM_WEIGHT * phrase_weights, out=weights)
+        return weights
+
+    def score_clauses(self, clauses: List[TokenClause]) -> np.ndarray:
+        """Média dos pesos das partes (0-100) em cada linha; 0 se alguma parte não casa."""
+        if not clauses:
+            return np.zeros(self.size)
+        weights = [self.clause_weights(clause) for clause in clauses]
+        scores = 100.0 * np.mean(weights, axis=0)
+        scores[np.min(weights, axis=0) <= 0] = 0.0
+        return scores
+
+    def score_code(self, code: str) -> np.ndarray:
+        """Pontuação por código: código NBS que começa com / contém o código, ou LC116 do item."""
+        scores = np.zeros(self.size)
+        items, _ = _occurrences(self._lc116_text, self._lc116_start, code)
+        scores[self.rows_of(items)] = ITEM_CODE_SCORE
+        codes, prefix = _occurrences(self._nbs_code_text, self._nbs_code_start, code)
+        # Prefixo depois de "contém": a pontuação maior prevalece
+        scores[_csr_values(self._nbs_code_row_start, self._nbs_code_rows, codes)] = CODE_CONTAINS_SCORE
+        scores[_csr_values(self._nbs_code_row_start, self._nbs_code_rows, codes[prefix])] = CODE_PREFIX_SCORE
+        return scores
+
+    def rank(
+        self,
+        scores: Optional[np.ndarray],
+        mask: Optional[np.ndarray] = None,
+        positions: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Linhas com pontuação positiva (todas, sem `scores`) dentro da máscara, por pontuação
+        decrescente; empates na ordem dos itens em `positions` (ou da base) e das entradas.
+        """
+        keep = np.ones(self.size, dtype=bool) if scores is None else scores > 0
+        if mask is not None:
+            keep &= mask
+        if positions is None:
+            item_rank = np.arange(len(self.index), dtype=np.int64)
+        else:
+            item_rank = np.full(len(self.index), -1, dtype=np.int64)
+            item_rank[np.asarray(positions, dtype=np.int64)] = np.arange(len(positions))
+            keep &= item_rank[self.row_item] >= 0
+        rows = np.flatnonzero(keep)
+        row_scores = np.zeros(len(rows)) if scores is None else scores[rows]
+        order = np.lexsort((self.row_nbs[rows], item_rank[self.row_item[rows]], -row_scores))
+        return [(int(row), float(score)) for row, score in zip(rows[order], row_scores[order])]
+
+
+def _joined(values: List[str]) -> Tuple[str, np.ndarray]:
+    """Valores separados por quebras de linha e o deslocamento de cada um no texto."""
+    lengths = np.fromiter((len(value) + 1 for value in values), dtype=np.int64, count=len(values))
+    starts = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    return '\n'.join(values), starts
+
+
+def _occurrences(text: str, starts: np.ndarray, code: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Valores de `_joined` que contêm o código e, para cada um, se começam por ele."""
+    offsets = np.fromiter((match.start() for match in re.finditer(re.escape(code), text)), dtype=np.int64)
+    if not len(offsets):
+        return offsets, np.zeros(0, dtype=bool)
+    values = np.searchsorted(starts, offsets, side='right') - 1
+    prefix = np.zeros(len(starts), dtype=bool)
+    prefix[values[offsets == starts[values]]] = True
+    values = np.unique(values)
+    return values, prefix[values]
+
+
+def _csr_values(indptr: np.ndarray, values: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Valores das listas `ids` de uma estrutura CSR (indptr, values), concatenados."""
+    starts = indptr[ids]
+    counts = indptr[ids + 1] - starts
+    offsets = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    return values[np.repeat(starts, counts) + offsets]
+
+
+def _append_once(postings: Dict[str, List[int]], key: str, value: int):
+    """Acrescenta a posição à lista da chave (posições crescentes: repetições contam uma vez)."""
+    posting = postings.setdefault(key, [])
+    if not posting or posting[-1] != value:
+        posting.append(value)
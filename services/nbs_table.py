@@ -0,0 +1,201 @@
+"""
+Tabela plana de entradas NBS (uma linha por entrada NBS) construída no carregamento.
+Os resultados de busca viram um `take` vetorizado sobre as linhas pré-formatadas.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from services.nbs_hits import narrow_item
+from services.search_service import SearchServiceEnhanced
+
+
+# Limites de truncamento das colunas de texto da tabela de resultados
+TRUNCATE_LIMITS = {
+    'Serviço': 50,
+    'Desc. NBS': 50,
+    'Local IBS': 35,
+}
+
+# Mapeamento S/N -> ícone
+FLAG_ICONS = {'S': '✅', 'N': '❌'}
+FLAG_DEFAULT = '➖'
+
+# Colunas exibidas na tabela de resultados (na ordem)
+DISPLAY_COLUMNS = [
+    'LC116', 'Serviço', 'NBS', 'Desc. NBS', 'Onerosa', 'Exterior', 'cClassTrib', 'Tipo Trib.', 'Local IBS',
+]
+
+
+# Chave usada para códigos sem parte numérica (ordenados ao final)
+_NO_NUMBER = 10 ** 9
+
+
+def natural_code_key(code: str) -> Tuple[int, ...]:
+    """Chave natural de um código segmentado: "2.01" < "10.01", "1.1502.10.00" < "1.1502.20.00"."""
+    segments = re.findall(r'\d+', code or '')
+    if not segments:
+        return (_NO_NUMBER,)
+    return tuple(int(segment) for segment in segments)
+
+
+def dense_ranks(keys: List[Tuple[int, ...]]) -> np.ndarray:
+    """Converte chaves comparáveis em inteiros densos que preservam a ordem."""
+    rank_of = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+    return np.fromiter((rank_of[key] for key in keys), dtype=np.int64, count=len(keys))
+
+
+def truncate_column(values: pd.Series, limit: int) -> pd.Series:
+    """Trunca textos acima do limite adicionando reticências (operação vetorizada)."""
+    return values.where(values.str.len() <= limit, values.str.slice(0, limit) + '...')
+
+
+def flag_column(values: pd.Series) -> pd.Series:
+    """Converte S/N em ícones (operação vetorizada)."""
+    return values.map(FLAG_ICONS).fillna(FLAG_DEFAULT)
+
+
+class NbsTable:
+    """Colunas da tabela de resultados pré-computadas para toda a base."""
+
+    def __init__(self, items: List[Dict]):
+        self.items = items
+        self._position_by_id = {id(item): pos for pos, item in enumerate(items)}
+
+        row_counts = np.fromiter(
+            (len(item.get('nbs_entries', [])) for item in items), dtype=np.int64, count=len(items)
+        )
+        # Linhas do item i: item_row_start[i] .. item_row_start[i + 1]
+        self.item_row_start = np.zeros(len(items) + 1, dtype=np.int64)
+        np.cumsum(row_counts, out=self.item_row_start[1:])
+        self.row_item = np.repeat(np.arange(len(items), dtype=np.int64), row_counts)
+
+        self.frame = self._build_frame(items)
+        self._build_sort_keys(items)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @staticmethod
+    def _build_frame(items: List[Dict]) -> pd.DataFrame:
+        """Achata os itens e aplica a formatação de exibição coluna a coluna."""
+        columns: Dict[str, List[str]] = {
+            'LC116': [], 'Serviço': [], 'NBS': [], 'Desc. NBS': [],
+            'Onerosa': [], 'Exterior': [], 'cClassTrib': [], 'Local IBS': [],
+        }
+        for item in items:
+            lc116 = item.get('item_lc116', '')
+            desc_servico = item.get('descricao_item', '')
+            for nbs in item.get('nbs_entries', []):
+                classificacoes = nbs.get('cclasstrib', [])
+                columns['LC116'].append(lc116)
+                columns['Serviço'].append(desc_servico)
+                columns['NBS'].append(nbs.get('nbs_code', ''))
+                columns['Desc. NBS'].append(nbs.get('descricao_nbs', ''))
+                columns['Onerosa'].append(nbs.get('ps_onerosa', ''))
+                columns['Exterior'].append(nbs.get('adq_exterior', ''))
+                columns['cClassTrib'].append(classificacoes[0].get('codigo', '') if classificacoes else '-')
+                columns['Local IBS'].append(nbs.get('local_incidencia_ibs', ''))
+
+        frame = pd.DataFrame({name: pd.Series(values, dtype=str) for name, values in columns.items()})
+        for column, limit in TRUNCATE_LIMITS.items():
+            frame[column] = truncate_column(frame[column], limit)
+        frame['Onerosa'] = flag_column(frame['Onerosa']).astype('category')
+        frame['Exterior'] = flag_column(frame['Exterior']).astype('category')
+
+        # Tipo de tributação resolvido uma vez por código distinto
+        tipos = {}
+        for codigo in frame['cClassTrib'].unique():
+            if codigo != '-':
+                info = SearchServiceEnhanced.get_classificacao_didatica(codigo)
+                tipos[codigo] = f"{info['icone']} {info['categoria']}"
+        frame['Tipo Trib.'] = frame['cClassTrib'].map(tipos).fillna('-').astype('category')
+        frame['Local IBS'] = frame['Local IBS'].astype('category')
+
+        return frame[DISPLAY_COLUMNS]
+
+    def _build_sort_keys(self, items: List[Dict]):
+        """Pré-calcula chaves inteiras de ordenação natural (LC116 e NBS)."""
+        # LC116: (grupo, item) -> inteiro denso
+        self.item_lc116_key = dense_ranks([natural_code_key(item.get('item_lc116', '')) for item in items])
+
+        # NBS: chave segmentada por linha; o item ordena pela sua primeira entrada NBS
+        self.row_nbs_key = dense_ranks([
+            natural_code_key(nbs.get('nbs_code', ''))
+            for item in items for nbs in item.get('nbs_entries', [])
+        ])
+        # Itens sem entradas NBS vêm primeiro (como a ordenação pelo código vazio)
+        self.item_nbs_key = np.full(len(items), -1, dtype=np.int64)
+        has_rows = self.item_row_start[1:] > self.item_row_start[:-1]
+        self.item_nbs_key[has_rows] = self.row_nbs_key[self.item_row_start[:-1][has_rows]]
+
+        self.sort_keys = {
+            'lc116': self.item_lc116_key,
+            'nbs': self.item_nbs_key,
+        }
+
+    def sort_positions(self, positions: np.ndarray, sort_by: str) -> np.ndarray:
+        """Ordena posições pela chave pré-calculada (estável: empates mantêm a relevância)."""
+        keys = self.sort_keys[sort_by][positions]
+        return positions[np.argsort(keys, kind='stable')]
+
+    def sort_items(self, items: List[Dict], sort_by: str) -> List[Dict]:
+        """Ordena itens desta base por 'lc116' ou 'nbs' usando as chaves pré-calculadas."""
+        positions = self.positions_of(items)
+        if positions is None:
+            return NbsTable(items).sort_items(items, sort_by)
+        return [self.items[pos] for pos in self.sort_positions(positions, sort_by)]
+
+    def positions_of(self, items: List[Dict]) -> Optional[np.ndarray]:
+        """Converte itens desta base em posições (None se algum item for desconhecido)."""
+        if items is self.items:
+            return np.arange(len(self.items), dtype=np.int64)
+        positions = np.empty(len(items), dtype=np.int64)
+        for i, item in enumerate(items):
+            pos = self._position_by_id.get(id(item))
+            if pos is None:
+                return None
+            positions[i] = pos
+        return positions
+
+    def rows_for_positions(self, positions: np.ndarray) -> np.ndarray:
+        """Concatena (vetorizado) as faixas de linhas dos itens, na ordem recebida."""
+        starts = self.item_row_start[positions]
+        counts = self.item_row_start[positions + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Deslocamento de cada linha dentro da sua faixa
+        offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(starts, counts) + offsets
+
+    def rows_for_hits(self, hits: List[Tuple[Dict, int, float]]) -> Optional[np.ndarray]:
+        """Linhas dos acertos por entrada NBS (None se algum item for desconhecido)."""
+        positions = self.positions_of([item for item, _, _ in hits])
+        if positions is None:
+            return None
+        return self.item_row_start[positions] + np.fromiter((nbs for _, nbs, _ in hits), dtype=np.int64, count=len(hits))
+
+    def sort_hits(self, hits: List[Tuple[Dict, int, float]], sort_by: str) -> List[Tuple[Dict, int, float]]:
+        """Ordena acertos por entrada NBS por 'lc116' ou 'nbs' (estável: empates mantêm a relevância)."""
+        rows = self.rows_for_hits(hits)
+        if rows is None:
+            return hits
+        keys = self.item_lc116_key[self.row_item[rows]] if sort_by == 'lc116' else self.row_nbs_key[rows]
+        return [hits[i] for i in np.argsort(keys, kind='stable')]
+
+    def take_hits(self, hits: List[Tuple[Dict, int, float]]) -> pd.DataFrame:
+        """Retorna uma linha de exibição por acerto (item, entrada NBS), na ordem dos acertos."""
+        rows = self.rows_for_hits(hits)
+        if rows is None:
+            return NbsTable([narrow_item(item, nbs) for item, nbs, _ in hits]).frame
+        return self.frame.take(rows).reset_index(drop=True)
+
+    def take_items(self, items: List[Dict]) -> pd.DataFrame:
+        """Retorna as linhas de exibição dos itens, na ordem dos itens."""
+        positions = self.positions_of(items)
+        if positions is None:
+            # Itens de fora desta base: monta a tabela apenas para eles
+            return NbsTable(items).frame
+        return self.frame.take(self.rows_for_positions(positions)).reset_index(drop=True)
@@ -0,0 +1,204 @@
+"""
+Busca por similaridade de n-gramas de caracteres (espaço vetorial TF-IDF).
+Cada texto da base (campos do item e cada descrição NBS) vira um vetor esparso de
+n-gramas de 3 a 5 caracteres, por palavra; a consulta é respondida com um único
+produto matriz esparsa x vetor (que continua esparso) e seleção dos k maiores. A mesma operação aceita
+várias consultas de uma vez (classificação em lote de descrições de notas fiscais).
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scipy import sparse
+
+from services.search_index import SearchIndex
+
+
+NGRAM_RANGE = (3, 5)
+# Peso da descrição NBS mais parecida na nota do item (os campos do item ficam com o restante):
+# descrições NBS curtas não passam à frente do texto do próprio item
+NBS_WEIGHT = 0.4
+# Similaridade mínima (cosseno) para um item entrar no resultado
+DEFAULT_MIN_SIMILARITY = 0.2
+# Consultas multiplicadas de uma vez na classificação em lote
+QUERY_CHUNK = 256
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> List[str]:
+    """N-gramas de caracteres de cada palavra (com um espaço de cada lado) de um texto normalizado."""
+    low, high = ngram_range
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        for n in range(low, high + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class NgramIndex:
+    """
+    Matriz TF-IDF (linhas = textos, colunas = n-gramas) com as linhas normalizadas (L2).
+
+    Attributes:
+        vocabulary: N-grama -> coluna
+        idf: Peso IDF de cada coluna
+        matrix: Matriz esparsa CSR textos x n-gramas
+        by_gram: A mesma matriz transposta (CSR n-gramas x textos), usada nos produtos
+        item_rows: Se cada linha é a dos campos do item (as demais são descrições NBS)
+        item_starts: Primeira linha de cada item (as linhas de um item são consecutivas)
+        row_items: Item de cada linha
+    """
+
+    def __init__(self, index: SearchIndex, fields: Sequence[str]):
+        self.index = index
+        self.fields = tuple(fields)
+        field_values = [index.field_values(field) for field in self.fields]
+
+        counts: List[Counter] = []
+        starts: List[int] = []
+        for pos in range(len(index)):
+            starts.append(len(counts))
+            counts.append(Counter(char_ngrams(" ".join(values[pos] for values in field_values))))
+            for text in index.nbs_descriptions[pos]:
+                counts.append(Counter(char_ngrams(text)))
+
+        self.vocabulary: Dict[str, int] = {}
+        indptr, indices, data = [0], [], []
+        for row in counts:
+            for gram, count in row.items():
+                indices.append(self.vocabulary.setdefault(gram, len(self.vocabulary)))
+                data.append(count)
+            indptr.append(len(indices))
+        tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(counts), len(self.vocabulary)),
+        )
+        # IDF suavizado e TF sublinear (1 + log tf)
+        df = np.bincount(tf.indices, minlength=len(self.vocabulary))
+        self.idf = np.log((1 + len(counts)) / (1 + df)) + 1.0
+        tf.data = (1.0 + np.log(tf.data)) * self.idf[tf.indices]
+        self.matrix = _normalize_rows(tf)
+        self.by_gram = self.matrix.T.tocsr()
+        self.item_starts = np.asarray(starts, dtype=np.int64)
+        self.item_rows = np.zeros(len(counts), dtype=bool)
+        self.item_rows[self.item_starts] = True
+        self.row_items = np.repeat(
+            np.arange(len(index), dtype=np.int64), np.diff(np.append(self.item_starts, len(counts)))
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def vectorize(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        """Vetores TF-IDF (normalizados) das consultas já normalizadas; n-gramas desconhecidos são ignorados."""
+        indptr, indices, data = [0], [], []
+        for query in queries:
+            for gram, count in Counter(char_ngrams(query)).items():
+                column = self.vocabulary.get(gram)
+                if column is not None:
+                    indices.append(column)
+                    data.append((1.0 + np.log(count)) * self.idf[column])
+            indptr.append(len(indices))
+        vectors = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(queries), len(self.vocabulary)),
+        )
+        return _normalize_rows(vectors)
+
+    def similarities(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        """
+        Matriz esparsa consultas x itens: para cada item, a similaridade (cosseno) com os
+        campos do item combinada com a da descrição NBS mais parecida. Itens sem n-grama em
+        comum com a consulta ficam de fora; lotes grandes são multiplicados em blocos de
+        QUERY_CHUNK consultas (a memória não cresce com consultas x textos).
+        """
+        blocks = [
+            self._item_similarities(self.vectorize(queries[start:start + QUERY_CHUNK]))[0]
+            for start in range(0, len(queries), QUERY_CHUNK)
+        ]
+        if not blocks:
+            return sparse.csr_matrix((0, len(self)))
+        return blocks[0] if len(blocks) == 1 else sparse.vstack(blocks, format='csr')
+
+    def _item_similarities(self, vectors: sparse.csr_matrix) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+        """
+        Similaridades por (consulta, item), sem passar por uma matriz densa: a combinada (média
+        ponderada entre a linha dos campos do item e a maior entre as linhas NBS, NBS_WEIGHT)
+        e a do texto mais parecido do item (qualquer linha), com a mesma estrutura.
+        """
+        products = (vectors @ self.by_gram).tocsr()
+        products.sort_indices()
+        query_rows = np.repeat(np.arange(products.shape[0], dtype=np.int64), np.diff(products.indptr))
+        items = self.row_items[products.indices]
+        item_row = self.item_rows[products.indices]
+        # As linhas de um item são consecutivas: os pares (consulta, item) já vêm agrupados
+        pairs = query_rows * len(self) + items
+        starts = np.flatnonzero(np.diff(pairs, prepend=-1))
+        own = np.add.reduceat(np.where(item_row, products.data, 0.0), starts)
+        nbs = np.maximum.reduceat(np.where(item_row, 0.0, products.data), starts)
+        scores = (1.0 - NBS_WEIGHT) * own + NBS_WEIGHT * nbs
+        indptr = np.searchsorted(query_rows[starts], np.arange(products.shape[0] + 1))
+        shape = (products.shape[0], len(self))
+        return (
+            sparse.csr_matrix((scores, items[starts], indptr), shape=shape),
+            sparse.csr_matrix((np.maximum(own, nbs), items[starts], indptr), shape=shape),
+        )
+
+    def search(
+        self,
+        query: str,
+        positions: Optional[Sequence[int]] = None,
+        min_similarity: float = DEFAULT_MIN_SIMILARITY
+    ) -> List[Tuple[int, float]]:
+        """
+        Itens com algum texto (campos do item ou descrição NBS) de similaridade mínima, por
+        similaridade combinada decrescente (empates na ordem de `positions`).
+        """
+        row, best = self._item_similarities(self.vectorize([query]))
+        scores = dict(zip(row.indices.tolist(), row.data.tolist()))
+        passing = {pos for pos, score in zip(best.indices.tolist(), best.data.tolist()) if score >= min_similarity}
+        order = sorted(scores) if positions is None else positions
+        matches = [(pos, scores[pos]) for pos in order if pos in passing]
+        matches.sort(key=lambda x: x[1], reverse=True)
+        return matches
+
+    def top_k(
+        self,
+        queries: Sequence[str],
+        k: int,
+        positions: Optional[Sequence[int]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Os k itens (entre `positions`, se informadas) mais parecidos com cada consulta,
+        com uma única multiplicação para o lote todo. Empates na ordem de `positions`.
+        """
+        if positions is None:
+            rank = np.arange(len(self), dtype=np.int64)
+        else:
+            rank = np.full(len(self), -1, dtype=np.int64)
+            rank[np.asarray(positions, dtype=np.int64)[::-1]] = np.arange(len(positions) - 1, -1, -1)
+        similarities = self.similarities(queries)
+        query_rows = np.repeat(np.arange(len(queries), dtype=np.int64), np.diff(similarities.indptr))
+        items, scores = similarities.indices.astype(np.int64), similarities.data
+        keep = (rank[items] >= 0) & (scores > 0)
+        query_rows, items, scores = query_rows[keep], items[keep], scores[keep]
+        # Ordem de cada consulta (similaridade decrescente, empates por `positions`) e as k primeiras
+        order = np.lexsort((rank[items], -scores, query_rows))
+        query_rows, items, scores = query_rows[order], items[order], scores[order]
+        starts = np.searchsorted(query_rows, np.arange(len(queries) + 1))
+        selected = np.arange(len(order)) - starts[query_rows] < max(k, 0)
+        counts = np.bincount(query_rows[selected], minlength=len(queries))
+        pairs = list(zip(items[selected].tolist(), scores[selected].tolist()))
+        results = []
+        offset = 0
+        for count in counts.tolist():
+            results.append(pairs[offset:offset + count])
+            offset += count
+        return results
+
+
+def _normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Divide (no lugar) cada linha pela sua norma L2; linhas vazias ficam vazias."""
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    norms = np.sqrt(np.bincount(rows, weights=matrix.data ** 2, minlength=matrix.shape[0]))
+    matrix.data /= norms[rows]
+    return matrix
@@ -0,0 +1,342 @@
+"""
+Varredura paralela (fuzzy, regex e exata) em um pool de processos.
+O corpus normalizado do SearchIndex é copiado uma única vez para memória
+compartilhada; cada tarefa recebe apenas o nome do bloco, o layout e a sua fatia
+de posições, pontua com os mesmos motores da busca serial e devolve o seu top-k,
+que é combinado com um heap. O resultado é idêntico ao da execução serial.
+"""
+import heapq
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+from services.fuzzy_engine import FuzzyEngine, SearchCancelledError
+from services.regex_engine import RegexEngine, compile_query
+from services.search_index import SearchIndex
+
+
+# Abaixo desta quantidade de textos a varredura continua serial
+DEFAULT_MIN_TEXTS = 20_000
+
+# Tarefas por processo (fatias menores equilibram melhor a carga)
+SHARDS_PER_WORKER = 2
+
+# Intervalo (segundos) de verificação do cancelamento enquanto as fatias rodam
+CANCEL_POLL_S = 0.05
+
+# Colunas do corpus: campos de item (um texto por item) e entradas NBS (vários por item)
+NBS_DESCRIPTIONS = 'nbs:descricao'
+NBS_CODES = 'nbs:codigo'
+
+# (score negativo, ordem na lista de posições, posição): ordenação natural = serial
+ScanHit = Tuple[float, int, int]
+
+
+def _pack_column(texts: List[str]) -> Tuple[np.ndarray, bytes]:
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+class SharedCorpus:
+    """Corpus normalizado de um índice em um bloco de memória compartilhada."""
+
+    def __init__(self, index: SearchIndex):
+        columns: Dict[str, List[str]] = {
+            f"campo:{field}": index.field_values(field) for field in index.trigram_fields
+        }
+        columns[NBS_DESCRIPTIONS] = [text for texts in index.nbs_descriptions for text in texts]
+        columns[NBS_CODES] = [text for texts in index.nbs_codes for text in texts]
+        nbs_start = np.zeros(len(index) + 1, dtype=np.int64)
+        np.cumsum([len(texts) for texts in index.nbs_descriptions], out=nbs_start[1:])
+
+        packed = {name: _pack_column(texts) for name, texts in columns.items()}
+        arrays = [('nbs_start', nbs_start)] + [(f"{name}#off", off) for name, (off, _) in packed.items()]
+        blobs = [(name, data) for name, (_, data) in packed.items()]
+        size = sum(a.nbytes for _, a in arrays) + sum(len(b) for _, b in blobs)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        # layout: nome -> (início, tamanho em bytes); arrays int64 e blocos de texto
+        self.layout: Dict[str, Tuple[int, int]] = {'__itens__': (len(index), 0)}
+        cursor = 0
+        for name, array in arrays:
+            self.shm.buf[cursor:cursor + array.nbytes] = array.tobytes()
+            self.layout[name] = (cursor, array.nbytes)
+            cursor += array.nbytes
+        for name, data in blobs:
+            self.shm.buf[cursor:cursor + len(data)] = data
+            self.layout[name] = (cursor, len(data))
+            cursor += len(data)
+        self._finalizer = weakref.finalize(self, SharedCorpus._release, self.shm)
+
+    @staticmethod
+    def _release(shm: shared_memory.SharedMemory):
+        shm.close()
+        shm.unlink()
+
+    def release(self):
+        self._finalizer()
+
+
+# =============================================================================
+# LADO DO PROCESSO DE TRABALHO
+# =============================================================================
+
+# Bloco anexado neste processo (nome -> SharedMemory; no máximo um)
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = _attached.get(name)
+    if shm is None:
+        # Bloco novo (outra base, ou o corpus foi recriado): solta o mapeamento anterior, que
+        # manteria viva a memória de um bloco já liberado pelo processo principal
+        for old in _attached.values():
+            old.close()
+        _attached.clear()
+        # Os processos do pool usam o resource tracker do processo principal, que libera o bloco
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+class _TextColumn:
+    """Acesso indexado (decodificação sob demanda) a uma coluna de textos."""
+
+    def __init__(self, buf, layout: Dict[str, Tuple[int, int]], name: str):
+        start, size = layout[f"{name}#off"]
+        self.offsets = np.frombuffer(buf, dtype=np.int64, count=size // 8, offset=start)
+        self.base = layout[name][0]
+        self.buf = buf
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.buf[self.base + start:self.base + end]).decode('utf-8')
+
+    def slice(self, start: int, end: int) -> List[str]:
+        return [self[i] for i in range(start, end)]
+
+
+class _NbsTexts:
+    """nbs_texts[pos] -> textos das entradas NBS do item (como no SearchIndex)."""
+
+    def __init__(self, column: _TextColumn, nbs_start: np.ndarray):
+        self.column = column
+        self.nbs_start = nbs_start
+
+    def __getitem__(self, pos: int) -> List[str]:
+        return self.column.slice(self.nbs_start[pos], self.nbs_start[pos + 1])
+
+
+class CorpusView:
+    """Visão somente leitura do SharedCorpus com a interface usada pelos motores de busca."""
+
+    def __init__(self, shm_name: str, layout: Dict[str, Tuple[int, int]], normalize: Callable[[str], str]):
+        buf = _attach(shm_name).buf
+        start, size = layout['nbs_start']
+        nbs_start = np.frombuffer(buf, dtype=np.int64, count=size // 8, offset=start)
+        self._length = layout['__itens__'][0]
+        self._fields = {
+            name.split(':', 1)[1]: _TextColumn(buf, layout, name)
+            for name in layout if name.startswith('campo:') and not name.endswith('#off')
+        }
+        self.nbs_descriptions = _NbsTexts(_TextColumn(buf, layout, NBS_DESCRIPTIONS), nbs_start)
+        self.nbs_codes = _NbsTexts(_TextColumn(buf, layout, NBS_CODES), nbs_start)
+        self.normalize = normalize
+        # Sem trigramas: o pré-filtro já foi aplicado pelo processo principal
+        self.trigram_fields = ()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def field_values(self, field: str) -> _TextColumn:
+        return self._fields[field]
+
+
+def _ranked(matches: List[Tuple[int, float]], rank_of: Dict[int, int], top_k: Optional[int]) -> List[ScanHit]:
+    hits = sorted((-score, rank_of[pos], pos) for pos, score in matches)
+    return hits if top_k is None else hits[:top_k]
+
+
+def _fuzzy_shard(shm_name, layout, normalize, shard, offset, search_terms, original_query,
+                 search_fields, threshold, top_k) -> List[ScanHit]:
+    view = CorpusView(shm_name, layout, normalize)
+    matches = FuzzyEngine(view, threshold).search(search_terms, original_query, search_fields, shard)
+    return _ranked(matches, {pos: offset + i for i, pos in enumerate(shard)}, top_k)
+
+
+def _exact_shard(shm_name, layout, normalize, shard, offset, search_terms, search_fields, top_k) -> List[ScanHit]:
+    view = CorpusView(shm_name, layout, normalize)
+    columns = [view.field_values(field) for field in search_fields]
+    # Mesma pontuação da busca exata serial: 100 quando algum campo é igual a algum termo
+    matches = [(pos, 100.0) for pos in shard if any(column[pos] in search_terms for column in columns)]
+    return _ranked(matches, {pos: offset + i for i, pos in enumerate(shard)}, top_k)
+
+
+def _regex_shard(shm_name, layout, normalize, shard, offset, pattern, search_fields,
+                 item_score, nbs_score, time_budget_ms, top_k) -> Tuple[List[ScanHit], bool]:
+    view = CorpusView(shm_name, layout, normalize)
+    engine = RegexEngine(view, time_budget_ms=time_budget_ms)
+    matches, truncated = engine.scan(compile_query(pattern), search_fields, shard, item_score, nbs_score)
+    return _ranked(matches, {pos: offset + i for i, pos in enumerate(shard)}, top_k), truncated
+
+
+# =============================================================================
+# LADO DO PROCESSO PRINCIPAL
+# =============================================================================
+
+class ParallelScanExecutor:
+    """Distribui varreduras grandes entre processos; cargas pequenas ficam seriais."""
+
+    def __init__(self, max_workers: int, min_texts: int = DEFAULT_MIN_TEXTS):
+        self.max_workers = max_workers
+        self.min_texts = min_texts
+        self._owner_pid = os.getpid()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._corpora: Dict[int, Tuple[weakref.ref, SharedCorpus]] = {}
+
+    def _corpus(self, index: SearchIndex) -> SharedCorpus:
+        # Descarta entradas de índices já coletados (o bloco foi liberado junto)
+        self._corpora = {key: entry for key, entry in self._corpora.items() if entry[0]() is not None}
+        entry = self._corpora.get(id(index))
+        if entry is None or entry[0]() is not index:
+            corpus = SharedCorpus(index)
+            # O bloco é liberado junto com o índice
+            weakref.finalize(index, corpus.release)
+            self._corpora[id(index)] = entry = (weakref.ref(index), corpus)
+        return entry[1]
+
+    def should_parallelize(self, index: SearchIndex, positions: Sequence[int], search_fields: List[str]) -> bool:
+        """Só paraleliza no processo dono do pool, com campos do corpus e carga acima do limite."""
+        if self.max_workers < 1 or not len(positions) or os.getpid() != self._owner_pid:
+            return False
+        if any(field not in index.trigram_fields for field in search_fields):
+            return False
+        nbs_count = sum(len(index.nbs_descriptions[pos]) for pos in positions)
+        return len(positions) * len(search_fields) + nbs_count >= self.min_texts
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: seguro mesmo com threads ativas (recarga, servidor); o corpus vem da memória compartilhada
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            weakref.finalize(self, self._pool.shutdown, wait=False, cancel_futures=True)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _shards(self, positions: Sequence[int]) -> List[Tuple[List[int], int]]:
+        positions = list(positions)
+        count = max(1, min(len(positions), self.max_workers * SHARDS_PER_WORKER))
+        size = -(-len(positions) // count)
+        return [(positions[start:start + size], start) for start in range(0, len(positions), size)]
+
+    @staticmethod
+    def _merge(partials: List[List[ScanHit]], top_k: Optional[int]) -> List[Tuple[int, float]]:
+        merged = heapq.merge(*partials)
+        if top_k is not None:
+            merged = (hit for _, hit in zip(range(top_k), merged))
+        return [(pos, -neg_score) for neg_score, _, pos in merged]
+
+    @staticmethod
+    def _results(futures: List[Future], cancel: Optional[threading.Event]) -> list:
+        """
+        Resultados das fatias, na ordem de envio. Com o cancelamento acionado, as fatias ainda
+        não iniciadas saem da fila (as em execução terminam no processo) e a busca é interrompida.
+        """
+        pending = set(futures)
+        while pending:
+            if cancel is not None and cancel.is_set():
+                for future in futures:
+                    future.cancel()
+                raise SearchCancelledError()
+            _, pending = wait(pending, timeout=CANCEL_POLL_S if cancel is not None else None)
+        return [future.result() for future in futures]
+
+    def fuzzy(
+        self,
+        index: SearchIndex,
+        search_terms: Set[str],
+        original_query: str,
+        search_fields: List[str],
+        threshold: float,
+        positions: Sequence[int],
+        top_k: Optional[int] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Equivalente paralelo de FuzzyEngine.search (mesma ordem de resultados).
+
+        Raises:
+            SearchCancelledError: O evento de cancelamento foi acionado
+        """
+        corpus = self._corpus(index)
+        pool = self._executor()
+        futures = [
+            pool.submit(_fuzzy_shard, corpus.shm.name, corpus.layout, index.normalize, shard, offset,
+                        search_terms, original_query, search_fields, threshold, top_k)
+            for shard, offset in self._shards(positions)
+        ]
+        return self._merge(self._results(futures, cancel), top_k)
+
+    def regex(
+        self,
+        index: SearchIndex,
+        pattern: str,
+        search_fields: List[str],
+        positions: Sequence[int],
+        item_score: float,
+        nbs_score: float,
+        time_budget_ms: int,
+        top_k: Optional[int] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        Equivalente paralelo de RegexEngine.scan, já ordenado por score (empates na
+        ordem das posições). Cada fatia respeita o orçamento de tempo; o indicador de
+        interrupção vale se alguma fatia foi interrompida.
+        """
+        corpus = self._corpus(index)
+        pool = self._executor()
+        futures = [
+            pool.submit(_regex_shard, corpus.shm.name, corpus.layout, index.normalize, shard, offset,
+                        pattern, search_fields, item_score, nbs_score, time_budget_ms, top_k)
+            for shard, offset in self._shards(positions)
+        ]
+        results = self._results(futures, cancel)
+        truncated = any(truncated for _, truncated in results)
+        return self._merge([hits for hits, _ in results], top_k), truncated
+
+    def exact(
+        self,
+        index: SearchIndex,
+        search_terms: Set[str],
+        search_fields: List[str],
+        positions: Sequence[int],
+        top_k: Optional[int] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Equivalente paralelo da busca exata sobre o índice (termos já normalizados e não
+        vazios), na ordem das posições.
+        """
+        corpus = self._corpus(index)
+        pool = self._executor()
+        futures = [
+            pool.submit(_exact_shard, corpus.shm.name, corpus.layout, index.normalize, shard, offset,
+                        search_terms, search_fields, top_k)
+            for shard, offset in self._shards(positions)
+        ]
+        return self._merge(self._results(futures, cancel), top_k)
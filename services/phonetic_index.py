@@ -0,0 +1,158 @@
+"""
+Índice fonético para a busca "como se fala" ("consertu", "asesoria", "ijiene"). Cada
+palavra das descrições recebe uma chave fonética do português (no estilo do
+Metaphone-PT/BuscaBR: "ss", "ç", "z" e "ce/ci" viram "s", "ge/gi" vira "j", "e"/"o"
+átonos viram "i"/"u"...) e as listas chave -> itens geram os candidatos; só as
+palavras desses candidatos são repontuadas pelo rapidfuzz.
+"""
+from bisect import bisect_left
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+from rapidfuzz import fuzz
+
+from services.search_index import SearchIndex
+from services.token_index import STOPWORDS, tokenize
+
+
+# Substituições, em ordem, sobre a palavra normalizada (minúsculas, sem acentos)
+PHONETIC_RULES: Tuple[Tuple[str, str], ...] = (
+    ('ph', 'f'), ('ch', 'x'), ('sh', 'x'), ('lh', 'l'), ('nh', 'n'),
+    (r'g(?=[ei])', 'j'), (r'qu(?=[ei])', 'k'), (r'gu(?=[ei])', 'g'), ('q', 'k'),
+    # "-cao"/"-coes" digitados sem cedilha ("manutencao") soam como "-ção"
+    (r'[sx]c(?=[ei])', 's'), (r'c(?=[ei])', 's'), (r'c(?=(ao|oes)$)', 's'), ('c', 'k'),
+    ('h', ''), ('z', 's'), ('w', 'v'), ('y', 'i'),
+    # "m" antes de consoante soa "n"; "l" antes de consoante ou no fim soa "u"
+    (r'm(?=[^aeiou]|$)', 'n'), (r'l(?=[^aeiou]|$)', 'u'),
+    ('e', 'i'), ('o', 'u'),
+    # Letras repetidas ("ss", "rr", "ii") contam uma vez
+    (r'(.)\1+', r'\1'),
+)
+_COMPILED_RULES = [(re.compile(pattern), replacement) for pattern, replacement in PHONETIC_RULES]
+
+# Chaves com pelo menos este tamanho também casam com chaves que começam com elas
+MIN_PREFIX_KEY = 4
+# Peso das palavras das descrições NBS (as dos campos do item valem 1.0)
+NBS_WEIGHT = 0.7
+
+
+def phonetic_key(word: str) -> str:
+    """Chave fonética de uma palavra normalizada (códigos e números ficam como estão)."""
+    if not word.isalpha():
+        return word
+    for pattern, replacement in _COMPILED_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def phonetic_words(text: str, normalize: Callable[[str], str]) -> List[str]:
+    """Palavras de um texto original para a chave fonética ("ç" soa "s" antes de perder o acento)."""
+    return tokenize(normalize(text.lower().replace('ç', 's')))
+
+
+def indexed_words(text: str, normalize: Callable[[str], str]) -> List[str]:
+    """
+    Palavras de um texto da base: as de `phonetic_words` e, se o texto tem cedilha, também
+    a grafia com "c" ("servico"), que é como a palavra chega digitada sem o acento.
+    """
+    words = phonetic_words(text, normalize)
+    if 'ç' in text.lower():
+        words += [word for word in tokenize(normalize(text)) if word not in words]
+    return words
+
+
+class PhoneticIndex:
+    """
+    Listas invertidas chave fonética -> itens, com as palavras de cada chave.
+
+    Attributes:
+        postings: Chave -> posições dos itens com alguma palavra dessa chave
+        key_words: Chave -> palavras do vocabulário com essa chave
+        word_weights: Palavra -> {posição: peso da origem (campo do item ou NBS)}
+    """
+
+    def __init__(self, index: SearchIndex, fields: Sequence[str]):
+        self.index = index
+        self.fields = tuple(fields)
+        self.postings: Dict[str, List[int]] = {}
+        self.key_words: Dict[str, List[str]] = {}
+        self.word_weights: Dict[str, Dict[int, float]] = {}
+
+        for pos, item in enumerate(index.items):
+            texts = [(str(item.get(field, '') or ''), 1.0) for field in self.fields]
+            texts += [(nbs.get('descricao_nbs', ''), NBS_WEIGHT) for nbs in item.get('nbs_entries', [])]
+            for text, weight in texts:
+                for word in indexed_words(text, index.normalize):
+                    weights = self.word_weights.get(word)
+                    if weights is None:
+                        weights = self.word_weights[word] = {}
+                        self.key_words.setdefault(phonetic_key(word), []).append(word)
+                    if weights.get(pos, 0.0) < weight:
+                        weights[pos] = weight
+        for key, words in self.key_words.items():
+            items: Set[int] = set()
+            for word in words:
+                items.update(self.word_weights[word])
+            self.postings[key] = sorted(items)
+        self.keys = sorted(self.postings)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def expand(self, key: str) -> List[str]:
+        """Chaves que casam com a chave da consulta (a própria ou, se longa, as que começam com ela)."""
+        if len(key) < MIN_PREFIX_KEY:
+            return [key] if key in self.postings else []
+        keys = []
+        for i in range(bisect_left(self.keys, key), len(self.keys)):
+            if not self.keys[i].startswith(key):
+                break
+            keys.append(self.keys[i])
+        return keys
+
+    def query_terms(self, query: str) -> List[str]:
+        """Palavras da consulta que restringem a busca (stopwords soltas não contam)."""
+        words = phonetic_words(query, self.index.normalize)
+        return [word for word in words if word not in STOPWORDS] or words
+
+    def candidates(self, terms: List[str]) -> Set[int]:
+        """Itens com alguma palavra de mesma chave para cada termo (da menor lista para a maior)."""
+        sets = []
+        for term in terms:
+            found: Set[int] = set()
+            for key in self.expand(phonetic_key(term)):
+                found.update(self.postings[key])
+            sets.append(found)
+        sets.sort(key=len)
+        if not sets:
+            return set()
+        result = sets[0]
+        for other in sets[1:]:
+            result = result & other
+            if not result:
+                break
+        return result
+
+    def search(self, terms: List[str], positions: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Candidatos fonéticos repontuados: média, entre os termos, da maior semelhança
+        (`fuzz.ratio`, ponderada pela origem) com uma palavra de mesma chave no item.
+        Ordem por pontuação decrescente (empates na ordem de `positions`, ou da base).
+        """
+        matched = self.candidates(terms)
+        if not matched:
+            return []
+        order = sorted(matched) if positions is None else [pos for pos in positions if pos in matched]
+        # Semelhança de cada termo com as palavras das suas chaves: calculada uma vez por palavra
+        ratios = [
+            [(self.word_weights[word], fuzz.ratio(term, word) / 100.0)
+             for key in self.expand(phonetic_key(term)) for word in self.key_words[key]]
+            for term in terms
+        ]
+        results = []
+        for pos in order:
+            total = 0.0
+            for term_ratios in ratios:
+                total += max(weights[pos] * ratio for weights, ratio in term_ratios if pos in weights)
+            results.append((pos, 100.0 * total / len(terms)))
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
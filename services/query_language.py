@@ -0,0 +1,317 @@
+"""
+Consulta avançada: operadores E/OU/NÃO, frases entre aspas, curingas (*) e campos
+(`nbs:1.1502* E local:"local da prestação" -locação`, `cclass:200* saúde`).
+
+A consulta é analisada uma vez em uma árvore de termos e operadores; cada termo vira
+um bitmap de itens (listas do índice de palavras ou bitmaps das facetas) e os
+operadores viram `&`, `|` e `~` sobre esses vetores, sem avaliar item a item.
+Um termo de campo casa com o item se casar com alguma das entradas NBS dele. Termos
+de campos da entrada NBS (nbs, indop, local e cclass) ligados por E precisam casar
+com a mesma entrada: `nbs:1.1502* E local:"local da prestação"` não traz um item em
+que só outra NBS tem esse local.
+"""
+import re
+from typing import Callable, List, Optional, Set
+import numpy as np
+from unidecode import unidecode
+
+from services.facet_index import ENTRY_KEYS, FacetIndex
+from services.token_index import STOPWORDS, TokenIndex, tokenize
+
+
+# Prefixos de campo aceitos -> chave da faceta no FacetIndex
+FIELD_ALIASES = {
+    'lc116': 'item_lc116', 'lc': 'item_lc116', 'item': 'item_lc116',
+    'nbs': 'nbs_code',
+    'indop': 'indop',
+    'local': 'local_incidencia',
+    'cclass': 'cclasstrib_filter', 'cclasstrib': 'cclasstrib_filter',
+    'categoria': 'filtro_principal', 'cat': 'filtro_principal',
+    'subcategoria': 'subcategoria', 'sub': 'subcategoria',
+}
+FIELD_LABELS = {key: alias for alias, key in reversed(list(FIELD_ALIASES.items()))}
+# Campos de código: o valor inteiro precisa casar (use * para prefixos)
+CODE_FIELDS = {'item_lc116', 'nbs_code', 'indop', 'cclasstrib_filter'}
+
+# Operadores (só em maiúsculas, para não confundir com palavras da busca)
+AND_WORDS = {'AND', 'E'}
+OR_WORDS = {'OR', 'OU'}
+NOT_WORDS = {'NOT', 'NAO', 'NÃO'}
+
+WILDCARD = '*'
+_WORD = re.compile(r'[^\s()"]+')
+_ALNUM = re.compile(r'[^\W_]')
+
+
+class QuerySyntaxError(ValueError):
+    """Consulta avançada malformada (campo desconhecido, parênteses, operador ou termo vazio)."""
+
+
+class QueryTerm:
+    """Termo da consulta: palavra (com curingas) ou frase, opcionalmente restrita a um campo."""
+
+    def __init__(self, text: str, field: Optional[str] = None, phrase: bool = False):
+        self.text = text
+        self.field = field
+        self.phrase = phrase
+
+    def describe(self) -> str:
+        text = f'"{self.text}"' if self.phrase else self.text
+        return f"{FIELD_LABELS[self.field]}:{text}" if self.field else text
+
+    def terms(self) -> List['QueryTerm']:
+        return [self]
+
+
+class QueryNode:
+    """Operador ('and', 'or' ou 'not') sobre termos e outros operadores."""
+
+    def __init__(self, op: str, children: List):
+        self.op = op
+        self.children = children
+
+    def describe(self) -> str:
+        if self.op == 'not':
+            return f"NÃO {self.children[0].describe()}"
+        joiner = ' E ' if self.op == 'and' else ' OU '
+        return '(' + joiner.join(child.describe() for child in self.children) + ')'
+
+    def terms(self) -> List[QueryTerm]:
+        found = []
+        for child in self.children:
+            found += child.terms()
+        return found
+
+
+# =============================================================================
+# ANÁLISE
+# =============================================================================
+
+def _term(text: str, field: Optional[str] = None, phrase: bool = False) -> tuple:
+    """Token de termo; QuerySyntaxError se não há letra nem número (casaria com todos os itens)."""
+    if not _ALNUM.search(text):
+        if phrase:
+            raise QuerySyntaxError("Frase vazia: escreva as palavras entre as aspas.")
+        raise QuerySyntaxError(f"Termo sem letras ou números: '{text}'.")
+    return ('term', QueryTerm(text, field, phrase))
+
+
+def _lex(query: str) -> List[tuple]:
+    """Divide a consulta em ('(',), (')',), ('and',), ('or',), ('not',) e ('term', QueryTerm)."""
+    tokens = []
+    i, size = 0, len(query)
+    while i < size:
+        char = query[i]
+        if char.isspace():
+            i += 1
+        elif char in '()':
+            tokens.append((char,))
+            i += 1
+        elif char == '-' and i + 1 < size and not query[i + 1].isspace():
+            tokens.append(('not',))
+            i += 1
+        elif char == '-':
+            raise QuerySyntaxError("Operador sem termo (E, OU, NÃO ou '-' precisam de uma palavra depois).")
+        elif char == '"':
+            end = query.find('"', i + 1)
+            end = size if end == -1 else end
+            tokens.append(_term(query[i + 1:end], phrase=True))
+            i = end + 1
+        else:
+            match = _WORD.match(query, i)
+            word = match.group()
+            i = match.end()
+            if word in AND_WORDS:
+                tokens.append(('and',))
+            elif word in OR_WORDS:
+                tokens.append(('or',))
+            elif word in NOT_WORDS:
+                tokens.append(('not',))
+            elif ':' in word and word[:1].isalpha():
+                prefix, value = word.split(':', 1)
+                field = FIELD_ALIASES.get(unidecode(prefix.lower()))
+                if field is None:
+                    raise QuerySyntaxError(
+                        f"Campo desconhecido: '{prefix}'. Use {', '.join(sorted(FIELD_ALIASES))}."
+                    )
+                if not value and i < size and query[i] == '"':
+                    end = query.find('"', i + 1)
+                    end = size if end == -1 else end
+                    tokens.append(_term(query[i + 1:end], field, phrase=True))
+                    i = end + 1
+                elif value:
+                    tokens.append(_term(value, field))
+                else:
+                    raise QuerySyntaxError(f"Campo '{prefix}:' sem valor.")
+            else:
+                tokens.append(_term(word))
+    return tokens
+
+
+class _Parser:
+    """Descida recursiva: OU < E (explícito ou por justaposição) < NÃO < parênteses."""
+
+    def __init__(self, tokens: List[tuple]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("Consulta vazia.")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QuerySyntaxError("Parêntese ')' sem '(' correspondente.")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.pos += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else QueryNode('or', children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() in ('and', 'not', 'term', '('):
+            if self.peek() == 'and':
+                self.pos += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else QueryNode('and', children)
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.pos += 1
+            return QueryNode('not', [self.parse_not()])
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind == 'term':
+            self.pos += 1
+            return self.tokens[self.pos - 1][1]
+        if kind == '(':
+            self.pos += 1
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise QuerySyntaxError("Parêntese '(' sem ')' correspondente.")
+            self.pos += 1
+            return node
+        raise QuerySyntaxError("Operador sem termo (E, OU, NÃO ou '-' precisam de uma palavra depois).")
+
+
+def parse_query(query: str):
+    """Árvore da consulta (QueryTerm ou QueryNode); QuerySyntaxError se malformada."""
+    return _Parser(_lex(query)).parse()
+
+
+# =============================================================================
+# EXECUÇÃO SOBRE OS ÍNDICES
+# =============================================================================
+
+def _entry_level(node) -> bool:
+    """Nó avaliável por entrada NBS: termo de campo da entrada, ou E/OU só desses termos."""
+    if isinstance(node, QueryTerm):
+        return node.field in ENTRY_KEYS
+    return node.op != 'not' and all(_entry_level(child) for child in node.children)
+
+
+class BooleanQueryEvaluator:
+    """Converte a árvore da consulta em um bitmap de itens da base."""
+
+    def __init__(self, tokens: TokenIndex, facets: FacetIndex, normalize: Callable[[str], str]):
+        self.tokens = tokens
+        self.facets = facets
+        self.normalize = normalize
+        self.size = len(tokens)
+
+    def bitmap(self, node) -> np.ndarray:
+        if isinstance(node, QueryTerm):
+            return self.term_bitmap(node)
+        children = node.children
+        bitmaps = []
+        if node.op == 'and':
+            entry = [child for child in children if _entry_level(child)]
+            if len(entry) > 1:
+                # Campos da entrada NBS ligados por E casam com a mesma entrada
+                bitmaps.append(self.facets.entry_items(self.entry_bitmap(QueryNode('and', entry))))
+                children = [child for child in children if not _entry_level(child)]
+        bitmaps += [self.bitmap(child) for child in children]
+        if node.op == 'not':
+            return ~bitmaps[0]
+        result = bitmaps[0].copy()
+        for other in bitmaps[1:]:
+            if node.op == 'and':
+                result &= other
+            else:
+                result |= other
+        return result
+
+    def entry_bitmap(self, node) -> np.ndarray:
+        """Bitmap das entradas NBS (linhas do FacetIndex) para um nó em que _entry_level vale."""
+        if isinstance(node, QueryTerm):
+            matches = self._field_matcher(node)
+            result = np.zeros(self.facets.entry_count, dtype=bool)
+            for value, rows in self.facets.normalized_entry_values(node.field, self.normalize):
+                if matches(value):
+                    result[rows] = True
+            return result
+        bitmaps = [self.entry_bitmap(child) for child in node.children]
+        combine = np.logical_and if node.op == 'and' else np.logical_or
+        return combine.reduce(bitmaps)
+
+    def _positions(self, positions: Set[int]) -> np.ndarray:
+        bitmap = np.zeros(self.size, dtype=bool)
+        if positions:
+            bitmap[list(positions)] = True
+        return bitmap
+
+    def _pattern(self, text: str) -> List[str]:
+        """Partes normalizadas entre os curingas ("Saú*de" -> ["sau", "de"])."""
+        return [self.normalize(part) for part in text.split(WILDCARD)]
+
+    def term_bitmap(self, term: QueryTerm) -> np.ndarray:
+        if term.field is not None:
+            return self._field_bitmap(term)
+        if term.phrase:
+            words = tokenize(self.normalize(term.text))
+            if not words:
+                return np.ones(self.size, dtype=bool)
+            return self._positions(self.tokens.items_with_phrase(words))
+        if WILDCARD in term.text:
+            parts = self._pattern(term.text)
+            # O trecho antes do primeiro curinga limita as palavras pelo vocabulário ordenado
+            words = self.tokens.expand(parts[0]) if parts[0] else self.tokens.vocabulary
+            if len(parts) > 2 or parts[-1]:
+                regex = re.compile('.*'.join(re.escape(part) for part in parts))
+                words = [word for word in words if regex.fullmatch(word)]
+            found: Set[int] = set()
+            for word in words:
+                found.update(self.tokens.postings[word])
+            return self._positions(found)
+        words = [word for word in tokenize(self.normalize(term.text)) if word not in STOPWORDS]
+        if not words:
+            # Stopword sozinha não restringe a busca
+            return np.ones(self.size, dtype=bool)
+        return self._positions(self.tokens.items_with_words(words))
+
+    def _field_matcher(self, term: QueryTerm) -> Callable:
+        """Função que diz se um valor normalizado do campo casa com o termo."""
+        parts = self._pattern(term.text)
+        body = '.*'.join(re.escape(part) for part in parts)
+        if term.field in CODE_FIELDS:
+            # Código inteiro; no LC116 o zero à esquerda é opcional ("1.01" = "01.01")
+            if term.field == 'item_lc116':
+                body = '0?' + body.lstrip('0')
+            return re.compile(body).fullmatch
+        return re.compile(body).search
+
+    def _field_bitmap(self, term: QueryTerm) -> np.ndarray:
+        matches = self._field_matcher(term)
+        result = np.zeros(self.size, dtype=bool)
+        for value, bitmap in self.facets.normalized_values(term.field, self.normalize):
+            if matches(value):
+                result |= bitmap
+        return result
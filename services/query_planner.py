@@ -0,0 +1,173 @@
+"""
+Planejador de consultas: decide a ordem mais barata entre busca textual e filtros.
+A seletividade de cada lado é estimada antes da execução — filtros pelas
+cardinalidades das facetas, texto pelo tamanho das listas de trigramas — e o plano
+escolhe entre buscar primeiro, filtrar primeiro ou intersectar candidatos do
+índice com o bitmap das facetas. Todas as estratégias devolvem o mesmo resultado
+(na mesma ordem) que `search_items` seguido de `filter_items`.
+"""
+from typing import Dict, List, Optional, Sequence, Set
+import numpy as np
+
+from services.facet_index import FACET_KEYS, FacetIndex
+from services.search_index import SearchIndex, extract_trigrams
+
+
+# Estratégias
+SEARCH_FIRST = 'busca-primeiro'
+FILTER_FIRST = 'filtro-primeiro'
+INTERSECTION = 'intersecao'
+FILTERS_ONLY = 'somente-filtros'
+REFINEMENT = 'refinamento'
+UNPLANNED = 'sem-indice'
+
+# Custo relativo de pontuar um item, por tipo de busca (e por termo, quando há sinônimos)
+SCORE_COST = {'contains': 1.0, 'exact': 0.6, 'code': 0.5, 'regex': 0.3, 'fuzzy': 0.4, 'tokens': 0.2,
+              'phonetic': 0.25, 'ngram': 0.05, 'nbs': 0.1, 'boolean': 0.05}
+TERM_COST = {'contains': 0.15, 'exact': 0.05, 'fuzzy': 0.3}
+# Custo de uma operação de bitmap por item e de um elemento de lista de trigramas
+BITMAP_COST = 0.002
+POSTING_COST = 0.01
+
+
+class QueryPlan:
+    """Plano escolhido, com as estimativas usadas; `explain()` descreve a decisão."""
+
+    def __init__(self, items: List[Dict], query: str, search_type: str, use_synonyms: bool,
+                 filters: Dict[str, str], search_fields: Optional[List[str]],
+                 candidates: Optional[Sequence[int]] = None):
+        self.items = items
+        self.query = query
+        self.search_type = search_type
+        self.use_synonyms = use_synonyms
+        self.filters = filters
+        self.search_fields = search_fields
+        # Superconjunto conhecido do resultado (ex.: resultado anterior de uma consulta refinada)
+        self.candidates = candidates
+        self.strategy = UNPLANNED
+        self.kind = search_type
+        self.terms: Set[str] = set()
+        self.literals: Optional[Set[str]] = None
+        self.planner: Optional['QueryPlanner'] = None
+        self.facet_bitmap: Optional[np.ndarray] = None
+        self.facet_counts: Dict[str, int] = {}
+        self.estimated_candidates: Optional[int] = None
+        self.costs: Dict[str, float] = {}
+        # Preenchidos na execução
+        self.scored: Optional[int] = None
+        self.result_count: Optional[int] = None
+        # Busca regex interrompida pelo orçamento de tempo (resultado possivelmente incompleto)
+        self.truncated = False
+
+    @property
+    def facet_size(self) -> Optional[int]:
+        return None if self.facet_bitmap is None else int(np.count_nonzero(self.facet_bitmap))
+
+    def explain(self) -> str:
+        lines = [f"Estratégia: {self.strategy}", f"Itens na base: {len(self.items)}"]
+        if self.query:
+            lines.append(f"Busca: '{self.query}' ({self.kind}, {len(self.terms) or 1} termo(s))")
+        for key, count in self.facet_counts.items():
+            lines.append(f"Filtro {key}={self.filters[key]!r}: {count} itens")
+        if self.facet_bitmap is not None:
+            lines.append(f"Interseção dos filtros (bitmap): {self.facet_size} itens")
+        if self.estimated_candidates is not None:
+            lines.append(f"Candidatos estimados pelos trigramas: {self.estimated_candidates}")
+        if self.candidates is not None:
+            lines.append(f"Candidatos da consulta anterior: {len(self.candidates)}")
+        if self.costs:
+            lines.append("Custos estimados: " + ", ".join(
+                f"{name}={cost:.1f}" for name, cost in sorted(self.costs.items(), key=lambda kv: kv[1])
+            ))
+        if self.scored is not None:
+            lines.append(f"Itens pontuados: {self.scored}; resultados: {self.result_count}")
+        return "\n".join(lines)
+
+
+class QueryPlanner:
+    """Monta planos sobre um SearchIndex e o FacetIndex da mesma base."""
+
+    def __init__(self, index: SearchIndex, facets: FacetIndex):
+        self.index = index
+        self.facets = facets
+
+    def estimate_candidates(self, literals: Set[str]) -> Optional[int]:
+        """
+        Limite superior dos itens que contêm algum dos literais: para cada literal,
+        o tamanho da menor lista de trigramas (None = algum literal não tem trigramas).
+        """
+        total = 0
+        for literal in literals:
+            grams = extract_trigrams(literal)
+            if not grams:
+                return None
+            total += min(len(self.index.trigrams.get(gram, ())) for gram in grams)
+        return min(total, len(self.index))
+
+    def posting_work(self, literals: Set[str]) -> int:
+        return sum(len(self.index.trigrams.get(gram, ())) for literal in literals
+                   for gram in extract_trigrams(literal))
+
+    def candidates(self, literals: Set[str]) -> Set[int]:
+        """Itens que podem conter algum dos literais (união das interseções de trigramas)."""
+        result: Set[int] = set()
+        for literal in literals:
+            result |= self.index.candidates_for_literal(literal)
+        return result
+
+    def plan(self, plan: QueryPlan, literals: Optional[Set[str]]) -> QueryPlan:
+        """
+        Escolhe a estratégia de menor custo estimado.
+
+        Args:
+            plan: Plano com a consulta, os termos e o tipo (`kind`) já resolvidos
+            literals: Textos que todo resultado contém em algum campo indexado
+                (None = a busca não pode usar as listas de trigramas)
+        """
+        plan.planner = self
+        plan.literals = literals
+        size = len(self.index)
+        active = {key: plan.filters[key] for key in FACET_KEYS if plan.filters.get(key)}
+        plan.facet_counts = {key: self.facets.cardinality(key, value) for key, value in active.items()}
+        plan.facet_bitmap = self.facets.combine(active)
+        facet_size = plan.facet_size
+
+        if not plan.query:
+            plan.strategy = FILTERS_ONLY
+            return plan
+
+        per_item = SCORE_COST[plan.kind] + TERM_COST.get(plan.kind, 0.0) * len(plan.terms)
+        facet_cost = BITMAP_COST * size * len(active)
+        costs = {SEARCH_FIRST: size * per_item + (facet_cost if active else 0.0)}
+        if facet_size is not None:
+            costs[FILTER_FIRST] = facet_cost + facet_size * per_item
+        if literals is not None:
+            plan.estimated_candidates = self.estimate_candidates(literals)
+        if plan.estimated_candidates is not None:
+            matched = plan.estimated_candidates
+            if facet_size is not None:
+                # Independência entre texto e facetas
+                matched = matched * facet_size / max(size, 1)
+            costs[INTERSECTION] = facet_cost + POSTING_COST * self.posting_work(literals) + matched * per_item
+        if plan.candidates is not None:
+            costs[REFINEMENT] = facet_cost + len(plan.candidates) * per_item
+
+        plan.costs = costs
+        plan.strategy = min(costs, key=costs.get)
+        return plan
+
+    def positions(self, plan: QueryPlan) -> Optional[List[int]]:
+        """Posições a pontuar, em ordem crescente (None = toda a base)."""
+        if plan.strategy == REFINEMENT:
+            candidates = sorted(plan.candidates)
+            if plan.facet_bitmap is not None:
+                return [pos for pos in candidates if plan.facet_bitmap[pos]]
+            return candidates
+        if plan.strategy == INTERSECTION:
+            candidates = self.candidates(plan.literals)
+            if plan.facet_bitmap is not None:
+                return [pos for pos in sorted(candidates) if plan.facet_bitmap[pos]]
+            return sorted(candidates)
+        if plan.strategy in (FILTER_FIRST, FILTERS_ONLY) and plan.facet_bitmap is not None:
+            return np.flatnonzero(plan.facet_bitmap).tolist()
+        return None
@@ -0,0 +1,268 @@
+"""
+Motor de busca por expressões regulares.
+Compila o padrão uma única vez por consulta, extrai os literais obrigatórios para
+pré-filtrar candidatos pelo índice de trigramas e só executa a regex nos candidatos.
+"""
+import re
+import time
+from functools import lru_cache
+from typing import List, Optional, Sequence, Set, Tuple
+from unidecode import unidecode
+
+try:  # Python 3.11+
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # pragma: no cover - Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from services.search_index import SearchIndex
+
+
+# Limites de proteção contra padrões patológicos
+MAX_PATTERN_LENGTH = 200
+MAX_UNBOUNDED_REPEATS = 2
+MAX_REPEAT_COUNT = 100
+DEFAULT_TIME_BUDGET_MS = 250
+
+# Scores (mesma escala da busca "contém")
+SCORE_ITEM_FIELD = 80.0
+SCORE_NBS_FIELD = 60.0
+SCORE_LITERAL_FALLBACK = 70.0
+
+_REPEAT_OPS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_POSSESSIVE_REPEAT = getattr(sre_constants, 'POSSESSIVE_REPEAT', None)
+if _POSSESSIVE_REPEAT is not None:
+    _REPEAT_OPS += (_POSSESSIVE_REPEAT,)
+
+
+class RegexQueryError(ValueError):
+    """Padrão inválido ou complexo demais para ser executado com segurança."""
+
+
+class RegexQuery:
+    """Expressão regular já compilada e seus literais obrigatórios."""
+
+    def __init__(self, pattern: str, compiled: re.Pattern, required: List[List[str]]):
+        self.pattern = pattern
+        self.compiled = compiled
+        # Lista E de grupos OU: cada grupo exige ao menos um dos literais
+        self.required = required
+
+
+def _is_unbounded(max_count: int) -> bool:
+    return max_count == sre_constants.MAXREPEAT
+
+
+def _check_complexity(parsed, inside_repeat: bool = False, counter: Optional[List[int]] = None):
+    """Rejeita construções com risco de backtracking catastrófico."""
+    if counter is None:
+        counter = [0]
+    for op, av in parsed:
+        if op == sre_constants.GROUPREF or op == sre_constants.GROUPREF_EXISTS:
+            raise RegexQueryError("Referências a grupos (\\1) não são suportadas.")
+        if op in _REPEAT_OPS:
+            min_count, max_count, sub = av
+            if _is_unbounded(max_count):
+                counter[0] += 1
+                if counter[0] > MAX_UNBOUNDED_REPEATS:
+                    raise RegexQueryError(
+                        f"Use no máximo {MAX_UNBOUNDED_REPEATS} quantificadores ilimitados (*, +)."
+                    )
+            elif max_count > MAX_REPEAT_COUNT:
+                raise RegexQueryError(f"Repetições limitadas a {MAX_REPEAT_COUNT} ocorrências.")
+            repeats = _is_unbounded(max_count) or max_count > 1
+            if inside_repeat and repeats:
+                raise RegexQueryError("Quantificadores aninhados, como (a+)+, não são permitidos.")
+            _check_complexity(sub, inside_repeat or repeats, counter)
+        elif op == sre_constants.BRANCH:
+            if inside_repeat:
+                raise RegexQueryError("Alternativas dentro de repetições, como (a|b)+, não são permitidas.")
+            for alternative in av[1]:
+                _check_complexity(alternative, inside_repeat, counter)
+        elif op == sre_constants.SUBPATTERN:
+            _check_complexity(av[-1], inside_repeat, counter)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_complexity(av[1], inside_repeat, counter)
+
+
+def _required_literals(parsed) -> List[List[str]]:
+    """
+    Extrai os literais que qualquer texto casado precisa conter.
+
+    Returns:
+        Lista de grupos; o texto precisa conter ao menos um literal de cada grupo.
+        Só literais com 3+ caracteres são úteis para o índice de trigramas.
+    """
+    clauses: List[List[str]] = []
+    run: List[str] = []
+
+    def flush():
+        if len(run) >= 3:
+            clauses.append([''.join(run)])
+        run.clear()
+
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            run.append(chr(av).lower())
+            continue
+        flush()
+        if op == sre_constants.SUBPATTERN:
+            clauses.extend(_required_literals(av[-1]))
+        elif op in _REPEAT_OPS:
+            min_count, _, sub = av
+            if min_count >= 1:
+                clauses.extend(_required_literals(sub))
+        elif op == sre_constants.BRANCH:
+            group: List[str] = []
+            for alternative in av[1]:
+                alt_clauses = _required_literals(alternative)
+                if not alt_clauses:
+                    group = []
+                    break
+                # O grupo mais seletivo da alternativa (menos literais, mais longos)
+                group.extend(min(alt_clauses, key=lambda c: (len(c), -min(map(len, c)))))
+            if group:
+                clauses.append(group)
+    flush()
+    return clauses
+
+
+@lru_cache(maxsize=128)
+def compile_query(pattern: str) -> RegexQuery:
+    """Valida e compila um padrão (cache por padrão, compartilhado entre consultas)."""
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise RegexQueryError(f"O padrão excede {MAX_PATTERN_LENGTH} caracteres.")
+    # Os campos indexados não têm acentos: remove-os também do padrão
+    folded = unidecode(pattern)
+    try:
+        parsed = sre_parse.parse(folded, re.IGNORECASE)
+        compiled = re.compile(folded, re.IGNORECASE)
+    except re.error as e:
+        raise RegexQueryError(f"Expressão regular inválida: {e}") from e
+    _check_complexity(parsed)
+    return RegexQuery(pattern, compiled, _required_literals(parsed))
+
+
+class RegexEngine:
+    """Executa buscas regex sobre um SearchIndex com pré-filtro por trigramas."""
+
+    def __init__(self, index: SearchIndex, time_budget_ms: int = DEFAULT_TIME_BUDGET_MS):
+        self.index = index
+        self.time_budget_ms = time_budget_ms
+
+    def candidate_positions(self, query: RegexQuery, search_fields: List[str]) -> Optional[Set[int]]:
+        """Posições candidatas segundo os trigramas (None = sem pré-filtro possível)."""
+        if not query.required:
+            return None
+        if any(field not in self.index.trigram_fields for field in search_fields):
+            return None
+        result: Optional[Set[int]] = None
+        for group in query.required:
+            group_positions: Set[int] = set()
+            for literal in group:
+                group_positions |= self.index.candidates_for_literal(literal)
+            result = group_positions if result is None else result & group_positions
+            if not result:
+                break
+        return result
+
+    def search(
+        self,
+        pattern: str,
+        search_fields: List[str],
+        positions: Optional[List[int]] = None
+    ) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        Executa a busca regex.
+
+        Args:
+            pattern: Expressão regular informada pelo usuário
+            search_fields: Campos de item a verificar (as entradas NBS são sempre verificadas)
+            positions: Restringe a busca a estas posições (None = toda a base)
+
+        Returns:
+            (lista de (posição, score) na ordem das posições, só com os itens casados;
+            True se o orçamento de tempo interrompeu a varredura)
+
+        Raises:
+            RegexQueryError: Padrão inválido ou complexo demais
+        """
+        query = compile_query(pattern)
+        planned = self.plan_positions(query, search_fields, positions)
+        return self.scan(query, search_fields, planned, SCORE_ITEM_FIELD, SCORE_NBS_FIELD)
+
+    def search_literal(
+        self,
+        text: str,
+        search_fields: List[str],
+        positions: Optional[List[int]] = None
+    ) -> Tuple[List[Tuple[int, float]], bool]:
+        """Busca o texto como literal (usado quando o padrão é rejeitado); mesmo retorno de `search`."""
+        query = self.literal_query(text)
+        planned = self.plan_positions(query, search_fields, positions)
+        return self.scan(query, search_fields, planned, SCORE_LITERAL_FALLBACK, SCORE_LITERAL_FALLBACK)
+
+    def literal_query(self, text: str) -> RegexQuery:
+        return compile_query(re.escape(self.index.normalize(text)))
+
+    def resolve(self, pattern: str) -> Tuple[RegexQuery, float, float]:
+        """
+        Compila o padrão; se for rejeitado, usa o texto como literal.
+
+        Returns:
+            (consulta, score de campo do item, score de entrada NBS)
+
+        Raises:
+            RegexQueryError: Nem o padrão nem o literal puderam ser compilados
+        """
+        try:
+            return compile_query(pattern), SCORE_ITEM_FIELD, SCORE_NBS_FIELD
+        except RegexQueryError:
+            return self.literal_query(pattern), SCORE_LITERAL_FALLBACK, SCORE_LITERAL_FALLBACK
+
+    def plan_positions(
+        self,
+        query: RegexQuery,
+        search_fields: List[str],
+        positions: Optional[List[int]]
+    ) -> Sequence[int]:
+        """Posições a verificar, já reduzidas pelo pré-filtro de trigramas."""
+        candidates = self.candidate_positions(query, search_fields)
+        if positions is None:
+            return range(len(self.index)) if candidates is None else sorted(candidates)
+        if candidates is not None:
+            return [pos for pos in positions if pos in candidates]
+        return positions
+
+    def scan(
+        self,
+        query: RegexQuery,
+        search_fields: List[str],
+        positions: Sequence[int],
+        item_score: float,
+        nbs_score: float
+    ) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        Executa a regex nas posições dadas, dentro do orçamento de tempo.
+
+        Returns:
+            (lista de (posição, score), True se o orçamento esgotou antes do fim das posições)
+        """
+        search = query.compiled.search
+        field_values = [self.index.field_values(field) for field in search_fields]
+        deadline = time.perf_counter() + self.time_budget_ms / 1000.0
+        truncated = False
+        results = []
+
+        for pos in positions:
+            if time.perf_counter() > deadline:
+                truncated = True
+                break
+            if any(search(values[pos]) for values in field_values):
+                results.append((pos, item_score))
+            elif any(search(text) for text in self.index.nbs_descriptions[pos]) or \
+                    any(search(text) for text in self.index.nbs_codes[pos]):
+                results.append((pos, nbs_score))
+
+        return results, truncated
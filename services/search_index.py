@@ -0,0 +1,104 @@
+"""
+Índice pré-computado sobre os itens para acelerar as buscas.
+Mantém os campos já normalizados e um índice invertido de trigramas.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+
+# Campos de item indexados por padrão (mesmos campos da busca padrão)
+DEFAULT_INDEXED_FIELDS = ('descricao_item', 'item_lc116')
+
+
+def extract_trigrams(text: str) -> Set[str]:
+    """Retorna o conjunto de trigramas de um texto já normalizado."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Corpus normalizado e índice de trigramas construídos uma única vez por base."""
+
+    def __init__(
+        self,
+        items: List[Dict],
+        normalize: Callable[[str], str],
+        fields: Iterable[str] = DEFAULT_INDEXED_FIELDS
+    ):
+        self.items = items
+        self.normalize = normalize
+        self._fields: Dict[str, List[str]] = {}
+        self.nbs_descriptions: List[List[str]] = []
+        self.nbs_codes: List[List[str]] = []
+        self.trigrams: Dict[str, Set[int]] = {}
+        self._position_by_id: Optional[Dict[int, int]] = None
+        # Campos cobertos pelo índice de trigramas (os demais são normalizados sob demanda)
+        self.trigram_fields = tuple(fields)
+
+        for field in self.trigram_fields:
+            self.field_values(field)
+
+        for item in items:
+            self.nbs_descriptions.append([
+                normalize(nbs.get('descricao_nbs', '')) for nbs in item.get('nbs_entries', [])
+            ])
+            self.nbs_codes.append([
+                normalize(nbs.get('nbs_code', '')) for nbs in item.get('nbs_entries', [])
+            ])
+
+        self._build_trigrams()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getstate__(self) -> Dict:
+        # O mapa por id() não sobrevive à serialização: é refeito sob demanda
+        state = self.__dict__.copy()
+        state['_position_by_id'] = None
+        return state
+
+    def field_values(self, field: str) -> List[str]:
+        """Retorna os valores normalizados de um campo de item (calculados sob demanda)."""
+        values = self._fields.get(field)
+        if values is None:
+            values = [self.normalize(str(item.get(field, '') or '')) for item in self.items]
+            self._fields[field] = values
+        return values
+
+    def _build_trigrams(self):
+        """Constrói o índice invertido trigrama -> posições dos itens."""
+        for pos in range(len(self.items)):
+            grams = set()
+            for field in self.trigram_fields:
+                grams |= extract_trigrams(self._fields[field][pos])
+            for text in self.nbs_descriptions[pos]:
+                grams |= extract_trigrams(text)
+            for text in self.nbs_codes[pos]:
+                grams |= extract_trigrams(text)
+            for gram in grams:
+                self.trigrams.setdefault(gram, set()).add(pos)
+
+    def candidates_for_literal(self, literal: str) -> Set[int]:
+        """Itens que contêm todos os trigramas de um literal (superconjunto dos que contêm o literal)."""
+        grams = extract_trigrams(literal)
+        if not grams:
+            return set(range(len(self.items)))
+        postings = sorted((self.trigrams.get(g, set()) for g in grams), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def positions_of(self, items: List[Dict]) -> Optional[List[int]]:
+        """Converte uma lista de itens desta base em posições (None se algum item for desconhecido)."""
+        if items is self.items:
+            return list(range(len(self.items)))
+        if self._position_by_id is None:
+            self._position_by_id = {id(item): pos for pos, item in enumerate(self.items)}
+        positions = []
+        for item in items:
+            pos = self._position_by_id.get(id(item))
+            if pos is None:
+                return None
+            positions.append(pos)
+        return positions
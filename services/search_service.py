@@ -3,10 +3,26 @@ Serviço de busca e filtragem de dados - VERSÃO APRIMORADA
 Implementa melhorias de busca: sinônimos, correspondência parcial, normalização de acentos,
 busca por código, autocompletar e destaque de termos.
 """
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Set
 from unidecode import unidecode
-from rapidfuzz import fuzz, process
 import re
+import threading
+import numpy as np
+
+from services.code_graph import CodeGraph
+from services.facet_index import FacetIndex, cclasstrib_code, grupo_number
+from services.fuzzy_engine import FuzzyEngine
+from services.nbs_hits import NbsHitIndex
+from services.ngram_index import DEFAULT_MIN_SIMILARITY, NgramIndex
+from services.parallel_scan import DEFAULT_MIN_TEXTS, ParallelScanExecutor
+from services.phonetic_index import PhoneticIndex
+from services.query_language import BooleanQueryEvaluator, QuerySyntaxError, parse_query
+from services.query_planner import FILTERS_ONLY, SEARCH_FIRST, UNPLANNED, QueryPlan, QueryPlanner
+from services.search_index import DEFAULT_INDEXED_FIELDS, SearchIndex
+from services.spelling import SpellingCorrector
+from services.suffix_array import NBS_CODE, NBS_DESCRIPTION, SuffixArrayIndex
+from services.token_index import STOPWORDS, TokenClause, TokenIndex, tokenize
+from services.regex_engine import RegexEngine, RegexQueryError, compile_query
 
 
 # =============================================================================
@@ -184,21 +200,174 @@ GRUPOS_LC116 = {
 class SearchServiceEnhanced:
     """Classe para operações de busca e filtragem aprimoradas."""
 
-    def __init__(self, fuzzy_threshold: int = 60):
+    # Quantidade máxima de índices avulsos mantidos (bases sem versão; as versões do
+    # registro ficam até serem substituídas)
+    MAX_CACHED_INDEXES = 4
+
+    def __init__(
+        self,
+        fuzzy_threshold: int = 60,
+        regex_time_budget_ms: int = 250,
+        parallel_workers: int = 0,
+        parallel_min_texts: int = DEFAULT_MIN_TEXTS,
+        ngram_min_similarity: float = DEFAULT_MIN_SIMILARITY
+    ):
         self.fuzzy_threshold = fuzzy_threshold
+        self.regex_time_budget_ms = regex_time_budget_ms
+        self.ngram_min_similarity = ngram_min_similarity
+        self._indexes: Dict[int, SearchIndex] = {}
+        # Versão -> chave (id da lista de itens) das bases do registro, que não são descartadas
+        self._versions: Dict[str, int] = {}
+        # Bases registradas sem índice (versão, itens): o SearchIndex é montado no primeiro uso
+        self._deferred: Dict[int, Tuple[str, List[Dict]]] = {}
+        # Índices auxiliares por base, como (SearchIndex, índice), montados no primeiro uso
+        self._facets: Dict[int, Tuple[SearchIndex, FacetIndex]] = {}
+        self._tokens: Dict[int, Tuple[SearchIndex, TokenIndex]] = {}
+        self._spelling: Dict[int, Tuple[SearchIndex, SpellingCorrector]] = {}
+        self._phonetic: Dict[int, Tuple[SearchIndex, PhoneticIndex]] = {}
+        self._ngrams: Dict[int, Tuple[SearchIndex, NgramIndex]] = {}
+        self._suffixes: Dict[int, Tuple[SearchIndex, SuffixArrayIndex]] = {}
+        self._nbs_hits: Dict[int, Tuple[SearchIndex, NbsHitIndex]] = {}
+        self._graphs: Dict[int, Tuple[SearchIndex, CodeGraph]] = {}
+        # Uma montagem por vez: buscas concorrentes não montam o mesmo índice duas vezes
+        self._build_lock = threading.RLock()
+        # Backend externo (ex.: SQLite) que responde parte dos tipos de busca da base principal
+        self._backend = None
+        # Varredura paralela (fuzzy/regex) para bases grandes; 0 ou 1 processo = sempre serial
+        self._parallel = ParallelScanExecutor(parallel_workers, parallel_min_texts) if parallel_workers > 1 else None
         self._build_keyword_index()
 
+    def build_index(self, items: List[Dict]) -> SearchIndex:
+        """Constrói (ou reaproveita) o índice de busca de uma base de itens."""
+        index = self.get_index(items)
+        if index is None:
+            index = self.register_index(SearchIndex(items, self.normalize_text))
+        return index
+
+    def register_index(self, index: SearchIndex, version: Optional[str] = None) -> SearchIndex:
+        """
+        Registra um índice já construído (ex.: carregado do cache em disco). Os índices
+        auxiliares (palavras, fonética, n-gramas, sufixos, grafo...) são montados no
+        primeiro uso de cada um.
+
+        Args:
+            version: Versão do registro dona da base; sem versão, o índice é avulso e os
+                mais antigos são descartados acima de MAX_CACHED_INDEXES
+        """
+        key = id(index.items)
+        with self._build_lock:
+            if version is not None:
+                previous = self._versions.get(version)
+                if previous is not None and previous != key:
+                    self._release(previous)
+                self._versions[version] = key
+            elif key not in self._indexes:
+                pinned = set(self._versions.values())
+                loose = [other for other in self._indexes if other not in pinned]
+                if len(loose) >= self.MAX_CACHED_INDEXES:
+                    self._release(loose[0])
+            self._indexes[key] = index
+            self._deferred.pop(key, None)
+        return index
+
+    def defer_index(self, items: List[Dict], version: str):
+        """Registra uma versão da base sem montar o índice (montado no primeiro uso)."""
+        key = id(items)
+        with self._build_lock:
+            previous = self._versions.get(version)
+            if previous is not None and previous != key:
+                self._release(previous)
+            self._versions[version] = key
+            if self.get_index(items) is None:
+                self._deferred[key] = (version, items)
+
+    def warm_up(self, items: List[Dict]):
+        """Monta de uma vez o índice e os índices auxiliares de uma base (sem espera no primeiro uso)."""
+        index = self.build_index(items)
+        fields = list(DEFAULT_INDEXED_FIELDS)
+        self._token_index(index, fields)
+        self._phonetic_index(index, fields)
+        self._ngram_index(index, fields)
+        self._suffix_index(index)
+        self._spelling_corrector(index)
+        self._facet_index(index)
+        self.code_graph(items)
+
+    def _release(self, key: int):
+        """Descarta o índice de uma base e os índices auxiliares dela."""
+        self._indexes.pop(key, None)
+        self._deferred.pop(key, None)
+        for cache in (self._facets, self._tokens, self._spelling, self._phonetic, self._ngrams,
+                      self._suffixes, self._nbs_hits, self._graphs):
+            cache.pop(key, None)
+
+    def _per_base(self, cache: Dict[int, Tuple[SearchIndex, Any]], index: SearchIndex, build: Callable[[], Any]):
+        """
+        Índice auxiliar da base do índice, montado no primeiro uso (uma vez, mesmo com buscas
+        concorrentes). Índices não registrados não são guardados.
+        """
+        key = id(index.items)
+        entry = cache.get(key)
+        if entry is not None and entry[0] is index:
+            return entry[1]
+        with self._build_lock:
+            entry = cache.get(key)
+            if entry is None or entry[0] is not index:
+                entry = (index, build())
+                if self._indexes.get(key) is index:
+                    cache[key] = entry
+        return entry[1]
+
+    def _is_registered(self, index: SearchIndex) -> bool:
+        return self._indexes.get(id(index.items)) is index
+
+    def attach_backend(self, backend):
+        """
+        Liga um backend de busca (ex.: SqliteSearchBackend): os tipos em `backend.search_types`
+        sobre os itens dele passam a ser respondidos por `backend.search_covered`.
+        """
+        self._backend = backend
+
+    def _backend_covers(self, items: List[Dict], search_type: str) -> bool:
+        """O backend ligado atende este tipo de busca sobre estes itens."""
+        return (self._backend is not None and search_type in self._backend.search_types
+                and self._backend.positions_of(items) is not None)
+
+    def get_index(self, items: List[Dict]) -> Optional[SearchIndex]:
+        """Retorna o índice desta lista de itens, se houver (bases adiadas são indexadas aqui)."""
+        index = self._indexes.get(id(items))
+        if index is not None and index.items is items:
+            return index
+        deferred = self._deferred.get(id(items))
+        if deferred is not None and deferred[1] is items:
+            with self._build_lock:
+                index = self._indexes.get(id(items))
+                if index is None or index.items is not items:
+                    index = self.register_index(SearchIndex(items, self.normalize_text), deferred[0])
+            return index
+        return None
+
     def _build_keyword_index(self):
         """Constrói índice invertido de sinônimos para busca rápida."""
         self.keyword_index = {}
+        # Grupos já normalizados: (termo principal, sinônimos), na ordem do dicionário
+        self._synonym_groups: List[Tuple[str, List[str]]] = []
+        self._group_terms: Dict[str, Set[str]] = {}
+        # Busca por palavras: frase de sinônimo (palavras) -> termos principais dos grupos
+        self._synonym_phrases: Dict[Tuple[str, ...], Set[str]] = {}
         for termo_principal, sinonimos in SINONIMOS_SERVICOS.items():
             # Indexar termo principal
             normalized_principal = self.normalize_text(termo_principal)
             self.keyword_index[normalized_principal] = termo_principal
             # Indexar sinônimos
-            for sinonimo in sinonimos:
-                normalized_sin = self.normalize_text(sinonimo)
+            normalized_sins = [self.normalize_text(sinonimo) for sinonimo in sinonimos]
+            for normalized_sin in normalized_sins:
                 self.keyword_index[normalized_sin] = termo_principal
+            self._synonym_groups.append((normalized_principal, normalized_sins))
+            self._group_terms[termo_principal] = {normalized_principal, *normalized_sins}
+            for term in (normalized_principal, *normalized_sins):
+                self._synonym_phrases.setdefault(tuple(tokenize(term)), set()).add(termo_principal)
+        self._max_phrase_words = max(len(phrase) for phrase in self._synonym_phrases)
 
     @staticmethod
     def normalize_text(text: str) -> str:
@@ -222,21 +391,17 @@ class SearchServiceEnhanced:
         for key, principal in self.keyword_index.items():
             if normalized_query in key or key in normalized_query:
                 # Adicionar termo principal e todos os sinônimos
-                terms.add(self.normalize_text(principal))
-                for sin in SINONIMOS_SERVICOS.get(principal, []):
-                    terms.add(self.normalize_text(sin))
+                terms |= self._group_terms[principal]
         
         # Verificar match parcial em sinônimos
-        for termo_principal, sinonimos in SINONIMOS_SERVICOS.items():
-            normalized_principal = self.normalize_text(termo_principal)
+        for normalized_principal, normalized_sins in self._synonym_groups:
             if normalized_query in normalized_principal:
                 terms.add(normalized_principal)
-                for sin in sinonimos:
-                    terms.add(self.normalize_text(sin))
-            for sin in sinonimos:
-                if normalized_query in self.normalize_text(sin):
+                terms.update(normalized_sins)
+            for normalized_sin in normalized_sins:
+                if normalized_query in normalized_sin:
                     terms.add(normalized_principal)
-                    terms.add(self.normalize_text(sin))
+                    terms.add(normalized_sin)
         
         return terms
 
@@ -266,7 +431,9 @@ class SearchServiceEnhanced:
         query: str,
         search_type: str = "contains",
         search_fields: List[str] = None,
-        use_synonyms: bool = True
+        use_synonyms: bool = True,
+        cancel: Optional[threading.Event] = None,
+        scanner: Optional[ParallelScanExecutor] = None
     ) -> List[Dict]:
         """
         Pesquisa itens baseado na query com suporte aprimorado.
@@ -274,9 +441,12 @@ class SearchServiceEnhanced:
         Args:
             items: Lista de itens para pesquisar
             query: Termo de busca
-            search_type: Tipo de busca ('contains', 'exact', 'fuzzy', 'regex')
+            search_type: Tipo de busca ('contains', 'exact', 'fuzzy', 'regex', 'tokens', 'phonetic',
+                'ngram', 'nbs', 'boolean')
             search_fields: Campos para pesquisar
             use_synonyms: Se deve usar expansão por sinônimos
+            cancel: Evento que interrompe a busca fuzzy (SearchCancelledError)
+            scanner: Pool de processos para as varreduras exata e regex (no lugar do da instância)
 
         Returns:
             Lista de itens que correspondem à busca, ordenados por relevância
@@ -287,12 +457,38 @@ class SearchServiceEnhanced:
         if search_fields is None:
             search_fields = ['descricao_item', 'item_lc116']
 
+        if self._backend is not None and search_type in self._backend.search_types:
+            results = self._backend.search_covered(items, query, search_type, search_fields, use_synonyms)
+            if results is not None:
+                return results
+
+        # Regex: o padrão não passa pela normalização nem pela busca por código
+        if search_type == "regex":
+            return self.search_regex(items, query, search_fields, scanner, cancel)[0]
+
+        # Consulta avançada: tem seus próprios campos (nbs:, lc116:...), sem busca por código
+        if search_type == "boolean":
+            return self._search_boolean(items, query, search_fields)
+
+        # Por entrada NBS: os itens na ordem da sua entrada mais bem pontuada
+        if search_type == "nbs":
+            return list({id(item): item for item, _, _ in self.search_nbs(items, query, use_synonyms)}.values())
+
         # Verificar se é busca por código
         is_code, code_type = self.is_code_query(query)
         
         if is_code:
             return self._search_by_code(items, query, code_type)
 
+        if search_type == "tokens":
+            return self._search_tokens(items, query, search_fields, use_synonyms)
+
+        if search_type == "phonetic":
+            return self._search_phonetic(items, query, search_fields)
+
+        if search_type == "ngram":
+            return self._search_ngram(items, query, search_fields)
+
         # Busca normal com possível expansão por sinônimos
         normalized_query = self.normalize_text(query)
         
@@ -301,23 +497,632 @@ class SearchServiceEnhanced:
         if use_synonyms and search_type != "exact":
             search_terms = self.expand_query_with_synonyms(query)
 
-        results_with_scores = []
-
-        for item in items:
-            match_score = self._calculate_match_score(
-                item, search_terms, search_type, search_fields, normalized_query
-            )
-            if match_score > 0:
-                results_with_scores.append((item, match_score))
+        if search_type == "fuzzy":
+            return self._search_fuzzy(items, search_terms, normalized_query, search_fields, cancel)
+
+        indexed = self._known_index(items)
+        if indexed is not None:
+            # Corpus já normalizado: sem normalizar os campos a cada busca
+            index, positions = indexed
+            results_with_scores = None
+            if search_type == "contains":
+                results_with_scores = self._score_suffix_array(
+                    index, positions, search_terms, search_fields, normalized_query
+                )
+            elif search_type == "exact":
+                results_with_scores = self._scan_exact(index, positions, search_terms, search_fields, scanner, cancel)
+            if results_with_scores is None:
+                results_with_scores = self._score_indexed(
+                    index, positions, search_terms, search_type, search_fields, normalized_query
+                )
+        else:
+            results_with_scores = []
+            for item in items:
+                match_score = self._calculate_match_score(
+                    item, search_terms, search_type, search_fields, normalized_query
+                )
+                if match_score > 0:
+                    results_with_scores.append((item, match_score))
 
         # Ordenar por relevância (score) decrescente
         results_with_scores.sort(key=lambda x: x[1], reverse=True)
         
         return [item for item, score in results_with_scores]
 
+    def _known_index(self, items: List[Dict]) -> Optional[Tuple[SearchIndex, Optional[List[int]]]]:
+        """Índice registrado que cobre os itens e as posições deles nele (None = nenhum)."""
+        index = self.get_index(items)
+        if index is not None:
+            return index, None
+        # Subconjunto de uma base indexada: reaproveita o índice da base completa
+        for candidate in list(self._indexes.values()):
+            positions = candidate.positions_of(items)
+            if positions is not None:
+                return candidate, positions
+        # Subconjunto de uma base adiada: indexa a base (uma vez) e reaproveita o índice
+        if items:
+            for _, base in list(self._deferred.values()):
+                if any(item is items[0] for item in base):
+                    candidate = self.get_index(base)
+                    positions = candidate.positions_of(items)
+                    if positions is not None:
+                        return candidate, positions
+        return None
+
+    def _index_for(self, items: List[Dict]) -> Tuple[SearchIndex, Optional[List[int]]]:
+        """Índice que cobre os itens e as posições deles nele (None = o índice inteiro)."""
+        indexed = self._known_index(items)
+        if indexed is not None:
+            return indexed
+        return SearchIndex(items, self.normalize_text), None
+
+    def _scan_exact(
+        self,
+        index: SearchIndex,
+        positions: Optional[List[int]],
+        search_terms: Set[str],
+        search_fields: List[str],
+        scanner: Optional[ParallelScanExecutor],
+        cancel: Optional[threading.Event]
+    ) -> Optional[List[Tuple[Dict, float]]]:
+        """Busca exata no pool de processos (mesmo resultado de _score_indexed); None = serial."""
+        parallel = scanner or self._parallel
+        if positions is None:
+            positions = range(len(index))
+        if (parallel is None or not all(search_terms)
+                or not parallel.should_parallelize(index, positions, search_fields)):
+            return None
+        matches = parallel.exact(index, search_terms, search_fields, positions, cancel=cancel)
+        return [(index.items[pos], score) for pos, score in matches]
+
+    @staticmethod
+    def _score_indexed(
+        index: SearchIndex,
+        positions: Optional[List[int]],
+        search_terms: Set[str],
+        search_type: str,
+        search_fields: List[str],
+        original_query: str
+    ) -> List[Tuple[Dict, float]]:
+        """Mesma pontuação de _calculate_match_score, sobre os textos normalizados do índice."""
+        if positions is None:
+            positions = range(len(index))
+        field_values = [(field, index.field_values(field)) for field in search_fields]
+        contains = search_type == "contains"
+        results = []
+
+        for pos in positions:
+            item = index.items[pos]
+            max_score = 0.0
+            for field, values in field_values:
+                if not item.get(field, ''):
+                    continue
+                normalized_value = values[pos]
+                for term in search_terms:
+                    score = 0.0
+                    if contains:
+                        if term in normalized_value:
+                            score = 100.0 if normalized_value.startswith(term) else 80.0
+                            if term == original_query:
+                                score += 20.0
+                    elif search_type == "exact":
+                        if term == normalized_value:
+                            score = 100.0
+                    max_score = max(max_score, score)
+
+            if contains:
+                for nbs_desc, nbs_code in zip(index.nbs_descriptions[pos], index.nbs_codes[pos]):
+                    for term in search_terms:
+                        if term in nbs_desc:
+                            max_score = max(max_score, 70.0 if term == original_query else 60.0)
+                        if term in nbs_code:
+                            max_score = max(max_score, 90.0)
+
+            if max_score > 0:
+                results.append((item, max_score))
+        return results
+
+    def _score_suffix_array(
+        self,
+        index: SearchIndex,
+        positions: Optional[List[int]],
+        search_terms: Set[str],
+        search_fields: List[str],
+        original_query: str
+    ) -> Optional[List[Tuple[Dict, float]]]:
+        """
+        Pontuação da busca "contém" pelas ocorrências no array de sufixos (mesmo resultado
+        de _score_indexed). None se a base não tem array de sufixos para esses campos.
+        """
+        if not self._is_registered(index) or not all(search_terms):
+            return None
+        suffixes = self._suffix_index(index)
+        if any(field not in suffixes.fields for field in search_fields):
+            return None
+        best = np.zeros(len(index))
+        for term in search_terms:
+            segments, starts = suffixes.occurrences(term)
+            fields = suffixes.segment_fields[segments]
+            is_original = term == original_query
+            scores = np.zeros(len(segments))
+            in_item = np.isin(fields, search_fields)
+            scores[in_item] = np.where(starts[in_item] == 0, 100.0, 80.0) + (20.0 if is_original else 0.0)
+            scores[fields == NBS_DESCRIPTION] = 70.0 if is_original else 60.0
+            scores[fields == NBS_CODE] = 90.0
+            np.maximum.at(best, suffixes.segment_items[segments], scores)
+        order = np.flatnonzero(best).tolist() if positions is None else positions
+        return [(index.items[pos], float(best[pos])) for pos in order if best[pos] > 0]
+
+    def match_positions(self, items: List[Dict], query: str) -> Optional[List[Dict[Tuple[str, int], List[int]]]]:
+        """
+        Posições da consulta normalizada nos textos normalizados de cada item, pelo array de
+        sufixos: {(campo, índice NBS ou -1): [posições]}. None se os itens não são de uma base indexada.
+        """
+        indexed = self._known_index(items)
+        if indexed is None:
+            return None
+        index, positions = indexed
+        if not self._is_registered(index):
+            return None
+        found = self._suffix_index(index).match_positions(self.normalize_text(query))
+        return [found.get(pos, {}) for pos in (range(len(index)) if positions is None else positions)]
+
+    def _suffix_index(self, index: SearchIndex) -> SuffixArrayIndex:
+        """Array de sufixos da base (montado no primeiro uso)."""
+        return self._per_base(self._suffixes, index, lambda: SuffixArrayIndex(index, DEFAULT_INDEXED_FIELDS))
+
+    def token_clauses(self, query: str, use_synonyms: bool = True) -> Tuple[List[TokenClause], List[str]]:
+        """
+        Divide a consulta em partes para a busca por palavras; devolve (partes, palavras).
+        Com sinônimos, um trecho da consulta igual a um termo do dicionário (palavras
+        inteiras, ex.: "ti" ou "help desk") também casa com os demais termos do grupo.
+        """
+        words = tokenize(self.normalize_text(query))
+        clauses = []
+        i = 0
+        while i < len(words):
+            span = 1
+            principals: Set[str] = set()
+            if use_synonyms:
+                for size in range(min(self._max_phrase_words, len(words) - i), 0, -1):
+                    principals = self._synonym_phrases.get(tuple(words[i:i + size]), set())
+                    if principals:
+                        span = size
+                        break
+            literal = words[i:i + span]
+            synonyms = {
+                tuple(tokenize(term))
+                for principal in principals for term in self._group_terms[principal]
+            }
+            synonyms.discard(tuple(literal))
+            # Só a última palavra digitada pode estar incompleta; termos de sinônimo casam inteiros
+            clauses.append(TokenClause(literal, sorted(synonyms), prefix=i + span == len(words) and not principals))
+            i += span
+        # Stopwords soltas não restringem a busca (a não ser que a consulta só tenha stopwords)
+        restrictive = [c for c in clauses if c.synonyms or any(w not in STOPWORDS for w in c.words)]
+        return restrictive or clauses, words
+
+    def _token_index(self, index: SearchIndex, fields: List[str]) -> TokenIndex:
+        """Índice de palavras da base (montado no primeiro uso; outros campos não são guardados)."""
+        if tuple(fields) != DEFAULT_INDEXED_FIELDS:
+            return TokenIndex(index, fields)
+        return self._per_base(self._tokens, index, lambda: TokenIndex(index, DEFAULT_INDEXED_FIELDS))
+
+    def _search_tokens(
+        self,
+        items: List[Dict],
+        query: str,
+        search_fields: List[str],
+        use_synonyms: bool
+    ) -> List[Dict]:
+        """Busca por palavras: todas as partes da consulta, por palavra inteira ou início de palavra."""
+        clauses, words = self.token_clauses(query, use_synonyms)
+        if not clauses:
+            return []
+        index, positions = self._index_for(items)
+        matches = self._token_index(index, search_fields).search(clauses, words, positions)
+        return [index.items[pos] for pos, score in matches]
+
+    def _nbs_hit_index(self, index: SearchIndex) -> NbsHitIndex:
+        """Listas invertidas por entrada NBS da base (construídas no primeiro uso)."""
+        return self._per_base(self._nbs_hits, index, lambda: NbsHitIndex(
+            self._token_index(index, list(DEFAULT_INDEXED_FIELDS)), self.get_classificacao_didatica
+        ))
+
+    def search_nbs(
+        self,
+        items: List[Dict],
+        query: str,
+        use_synonyms: bool = True,
+        filters: Optional[Dict[str, Optional[str]]] = None
+    ) -> List[Tuple[Dict, int, float]]:
+        """
+        Busca por entrada NBS: cada acerto é uma entrada, pontuada e ordenada por conta própria
+        (palavras como na busca por palavras; códigos pelo código NBS ou LC116). Os filtros
+        de NBS valem para a própria entrada, não para o item.
+
+        Returns:
+            Lista de (item, índice da entrada NBS no item, pontuação) por pontuação decrescente;
+            sem consulta, todas as entradas que passam nos filtros, na ordem da base
+        """
+        index, positions = self._index_for(items)
+        hits = self._nbs_hit_index(index)
+        scores = None
+        if query and len(query) >= 2:
+            is_code, _ = self.is_code_query(query)
+            if is_code:
+                scores = hits.score_code(self.normalize_text(query))
+            else:
+                clauses, _ = self.token_clauses(query, use_synonyms)
+                scores = hits.score_clauses(clauses)
+        mask = hits.filter_rows(filters or {}, self._facet_index(index))
+        return [
+            (index.items[hits.row_item[row]], int(hits.row_nbs[row]), score)
+            for row, score in hits.rank(scores, mask, positions)
+        ]
+
+    def _search_boolean(self, items: List[Dict], query: str, search_fields: List[str]) -> List[Dict]:
+        """Consulta avançada (E/OU/NÃO, frases, curingas e campos) por operações de bitmap."""
+        try:
+            tree = parse_query(query)
+        except QuerySyntaxError:
+            return []
+        index, positions = self._index_for(items)
+        evaluator = BooleanQueryEvaluator(
+            self._token_index(index, search_fields), self._facet_index(index), self.normalize_text
+        )
+        bitmap = evaluator.bitmap(tree)
+        # Sem pontuação: os itens ficam na ordem da base (ou da lista recebida)
+        if positions is None:
+            return [index.items[pos] for pos in np.flatnonzero(bitmap)]
+        return [index.items[pos] for pos in positions if bitmap[pos]]
+
+    @staticmethod
+    def validate_boolean(query: str) -> Optional[str]:
+        """Retorna a mensagem de erro de uma consulta avançada, ou None se for válida."""
+        try:
+            parse_query(query)
+        except QuerySyntaxError as e:
+            return str(e)
+        return None
+
+    def _phonetic_index(self, index: SearchIndex, fields: List[str]) -> PhoneticIndex:
+        """Índice fonético da base (montado no primeiro uso; outros campos não são guardados)."""
+        if tuple(fields) != DEFAULT_INDEXED_FIELDS:
+            return PhoneticIndex(index, fields)
+        return self._per_base(self._phonetic, index, lambda: PhoneticIndex(index, DEFAULT_INDEXED_FIELDS))
+
+    def _search_phonetic(self, items: List[Dict], query: str, search_fields: List[str]) -> List[Dict]:
+        """Busca fonética: candidatos pelas chaves das palavras, repontuados pelo rapidfuzz."""
+        index, positions = self._index_for(items)
+        phonetic = self._phonetic_index(index, search_fields)
+        terms = phonetic.query_terms(query)
+        if not terms:
+            return []
+        return [index.items[pos] for pos, score in phonetic.search(terms, positions)]
+
+    def _ngram_index(self, index: SearchIndex, fields: List[str]) -> NgramIndex:
+        """Matriz de n-gramas da base (montada no primeiro uso; outros campos não são guardados)."""
+        if tuple(fields) != DEFAULT_INDEXED_FIELDS:
+            return NgramIndex(index, fields)
+        return self._per_base(self._ngrams, index, lambda: NgramIndex(index, DEFAULT_INDEXED_FIELDS))
+
+    def _search_ngram(self, items: List[Dict], query: str, search_fields: List[str]) -> List[Dict]:
+        """Busca por similaridade: cosseno entre os vetores de n-gramas da consulta e dos itens."""
+        index, positions = self._index_for(items)
+        ngrams = self._ngram_index(index, search_fields)
+        matches = ngrams.search(self.normalize_text(query), positions, self.ngram_min_similarity)
+        return [index.items[pos] for pos, score in matches]
+
+    def classify_descriptions(
+        self,
+        items: List[Dict],
+        descriptions: Sequence[str],
+        top_k: int = 3
+    ) -> List[List[Tuple[Dict, float]]]:
+        """
+        Classificação em lote: os `top_k` itens mais parecidos com cada descrição (ex.: as
+        descrições das notas fiscais de um arquivo), com uma única multiplicação de matrizes.
+
+        Returns:
+            Para cada descrição, lista de (item, similaridade entre 0 e 1) em ordem decrescente
+        """
+        index, positions = self._index_for(items)
+        ngrams = self._ngram_index(index, DEFAULT_INDEXED_FIELDS)
+        queries = [self.normalize_text(text or '') for text in descriptions]
+        ranked = ngrams.top_k(queries, top_k, positions)
+        return [[(index.items[pos], score) for pos, score in matches] for matches in ranked]
+
+    def _build_spelling(self, index: SearchIndex) -> SpellingCorrector:
+        """Dicionário de correção com as palavras das descrições da base e dos sinônimos."""
+        words: List[str] = []
+        for text in index.field_values('descricao_item'):
+            words += tokenize(text)
+        for texts in index.nbs_descriptions:
+            for text in texts:
+                words += tokenize(text)
+        for terms in self._group_terms.values():
+            for term in terms:
+                words += tokenize(term)
+        return SpellingCorrector(words)
+
+    def _spelling_corrector(self, index: SearchIndex) -> SpellingCorrector:
+        """Dicionário de correção da base (montado no primeiro uso)."""
+        return self._per_base(self._spelling, index, lambda: self._build_spelling(index))
+
+    def correct_query(self, items: List[Dict], query: str, partial: bool = False) -> Optional[str]:
+        """
+        Consulta com as palavras desconhecidas corrigidas ("Você quis dizer…"), normalizada;
+        None se não houver o que corrigir. Com `partial`, a última palavra pode estar
+        incompleta (autocompletar) e, com erro, é completada.
+        """
+        if not query or len(query) < 2 or self.is_code_query(query)[0]:
+            return None
+        indexed = self._known_index(items)
+        if indexed is None or not self._is_registered(indexed[0]):
+            return None
+        corrector = self._spelling_corrector(indexed[0])
+        words = tokenize(self.normalize_text(query))
+        corrected = [
+            corrector.correct(word, prefix=partial and i == len(words) - 1)
+            for i, word in enumerate(words)
+        ]
+        return " ".join(corrected) if corrected != words else None
+
+    def _facet_index(self, index: SearchIndex) -> FacetIndex:
+        """Bitmaps de facetas da base do índice (construídos no primeiro uso)."""
+        return self._per_base(
+            self._facets, index, lambda: FacetIndex(index.items, self.get_classificacao_didatica)
+        )
+
+    def code_graph(self, items: List[Dict]) -> CodeGraph:
+        """Grafo de códigos da base (montado no primeiro uso; listas sem índice, na hora)."""
+        index = self.get_index(items)
+        if index is None:
+            return CodeGraph(items)
+        return self._per_base(self._graphs, index, lambda: CodeGraph(items))
+
+    def related_codes(self, items: List[Dict], kind: str, code: str) -> Dict[str, List[str]]:
+        """
+        Códigos que aparecem junto com um código nas entradas NBS da base, por tipo.
+
+        Args:
+            items: Itens da base
+            kind: Tipo do código ('lc116', 'nbs', 'cclass' ou 'indop')
+            code: Código procurado
+
+        Returns:
+            Tipo -> códigos relacionados, ex.: related_codes(items, 'nbs', '1.1502.10.00')['lc116']
+        """
+        return self.code_graph(items).related(kind, code)
+
+    def items_with_code(self, items: List[Dict], kind: str, code: str) -> List[Dict]:
+        """Itens da base em que o código aparece (no item ou em alguma entrada NBS), na ordem da base."""
+        return [items[pos] for pos in self.code_graph(items).item_positions(kind, code).tolist()]
+
+    def plan_query(
+        self,
+        items: List[Dict],
+        query: str,
+        search_type: str = "contains",
+        use_synonyms: bool = True,
+        filters: Optional[Dict[str, Optional[str]]] = None,
+        search_fields: List[str] = None,
+        candidates: Optional[Sequence[int]] = None
+    ) -> QueryPlan:
+        """
+        Planeja busca + filtros (mesmos argumentos de search_items e filter_items).
+        Sem índice para a lista de itens, o plano executa busca e filtros em sequência.
+
+        Args:
+            candidates: Posições que contêm todo o resultado (ver `can_refine`); só elas são pontuadas
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        query = query if query and len(query) >= 2 else ''
+        plan = QueryPlan(items, query, search_type, use_synonyms, filters, search_fields, candidates)
+        if self._backend_covers(items, search_type):
+            # Busca e filtros pelo backend, sem montar os índices em memória da base
+            return plan
+        index = self.get_index(items)
+        if index is None:
+            return plan
+
+        literals = None
+        if query and search_type == "boolean":
+            try:
+                plan.terms = {term.describe() for term in parse_query(query).terms()}
+            except QuerySyntaxError:
+                pass
+        elif query and search_type != "regex":
+            # Mesma resolução de search_items: código, termo normalizado e sinônimos
+            is_code, _ = self.is_code_query(query)
+            if is_code:
+                plan.kind = 'code'
+                literals = {self.normalize_text(query)}
+            else:
+                normalized_query = self.normalize_text(query)
+                plan.terms = {normalized_query}
+                if search_type in ("tokens", "phonetic", "ngram", "nbs"):
+                    plan.terms = set(tokenize(normalized_query))
+                elif use_synonyms and search_type != "exact":
+                    plan.terms = self.expand_query_with_synonyms(query)
+                if search_type in ("contains", "exact"):
+                    # Todo resultado contém algum dos termos em um campo indexado
+                    literals = plan.terms
+            fields = search_fields or ['descricao_item', 'item_lc116']
+            if any(field not in index.trigram_fields for field in fields):
+                literals = None
+        return QueryPlanner(index, self._facet_index(index)).plan(plan, literals)
+
+    def can_refine(self, previous_query: str, query: str, search_type: str, use_synonyms: bool) -> bool:
+        """
+        Indica se o resultado de `query` está contido no de `previous_query` (mesmo tipo,
+        sinônimos e filtros), permitindo pontuar apenas os resultados anteriores.
+        Vale para a busca "contém" quando cada termo novo contém algum termo anterior.
+        """
+        if search_type != "contains" or len(previous_query or '') < 2 or len(query or '') < 2:
+            return False
+        previous_normalized = self.normalize_text(previous_query)
+        normalized = self.normalize_text(query)
+        if previous_normalized not in normalized:
+            return False
+        previous_is_code, _ = self.is_code_query(previous_query)
+        is_code, _ = self.is_code_query(query)
+        if previous_is_code != is_code:
+            return False
+        if is_code:
+            return True
+        if not use_synonyms:
+            return True
+        # Com sinônimos a consulta maior pode ativar outro grupo (ex.: "ti" dentro de "consultoria")
+        previous_terms = self.expand_query_with_synonyms(previous_query)
+        return all(
+            any(old in term for old in previous_terms)
+            for term in self.expand_query_with_synonyms(query)
+        )
+
+    def execute_plan(
+        self,
+        plan: QueryPlan,
+        cancel: Optional[threading.Event] = None,
+        scanner: Optional[ParallelScanExecutor] = None
+    ) -> List[Dict]:
+        """
+        Executa um plano; o resultado é o mesmo de search_items seguido de filter_items.
+        `plan.truncated` indica uma busca regex interrompida pelo orçamento de tempo, e
+        `scanner` é repassado a search_items.
+        """
+        if plan.strategy == UNPLANNED:
+            results = plan.items
+            if plan.query:
+                results = self._execute_search(plan, results, cancel, scanner)
+            if self._backend_covers(plan.items, plan.search_type):
+                results = self._backend.filter_items(results, **plan.filters)
+            else:
+                results = self.filter_items(results, **plan.filters)
+            plan.scored = len(plan.items) if plan.query else 0
+            plan.result_count = len(results)
+            return results
+
+        index = plan.planner.index
+        positions = plan.planner.positions(plan)
+        subset = plan.items if positions is None else [index.items[pos] for pos in positions]
+        if plan.strategy == FILTERS_ONLY:
+            results = subset
+        else:
+            results = self._execute_search(plan, subset, cancel, scanner)
+            if plan.strategy == SEARCH_FIRST and plan.facet_bitmap is not None:
+                bitmap = plan.facet_bitmap
+                results = [item for item, pos in zip(results, index.positions_of(results)) if bitmap[pos]]
+        plan.scored = len(subset) if plan.query else 0
+        plan.result_count = len(results)
+        return results
+
+    def _execute_search(
+        self,
+        plan: QueryPlan,
+        items: List[Dict],
+        cancel: Optional[threading.Event],
+        scanner: Optional[ParallelScanExecutor]
+    ) -> List[Dict]:
+        """Busca do plano sobre os itens (regex: guarda no plano se a varredura foi interrompida)."""
+        if plan.search_type == "regex":
+            results, plan.truncated = self.search_regex(
+                items, plan.query, plan.search_fields or ['descricao_item', 'item_lc116'], scanner, cancel
+            )
+            return results
+        return self.search_items(
+            items, plan.query, plan.search_type, plan.search_fields, plan.use_synonyms, cancel, scanner
+        )
+
+    def search_and_filter(
+        self,
+        items: List[Dict],
+        query: str,
+        search_type: str = "contains",
+        use_synonyms: bool = True,
+        filters: Optional[Dict[str, Optional[str]]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> List[Dict]:
+        """Busca e filtra na ordem escolhida pelo planejador."""
+        return self.execute_plan(self.plan_query(items, query, search_type, use_synonyms, filters), cancel)
+
+    def _search_fuzzy(
+        self,
+        items: List[Dict],
+        search_terms: Set[str],
+        normalized_query: str,
+        search_fields: List[str],
+        cancel: Optional[threading.Event] = None
+    ) -> List[Dict]:
+        """Busca aproximada com comparações em lote sobre o corpus normalizado."""
+        index, positions = self._index_for(items)
+        if positions is None:
+            positions = range(len(index))
+        if self._parallel is not None and self._parallel.should_parallelize(index, positions, search_fields):
+            matches = self._parallel.fuzzy(
+                index, search_terms, normalized_query, search_fields, self.fuzzy_threshold, positions,
+                cancel=cancel,
+            )
+        else:
+            engine = FuzzyEngine(index, self.fuzzy_threshold)
+            matches = engine.search(search_terms, normalized_query, search_fields, positions, cancel)
+        return [index.items[pos] for pos, score in matches]
+
+    def search_regex(
+        self,
+        items: List[Dict],
+        pattern: str,
+        search_fields: List[str],
+        scanner: Optional[ParallelScanExecutor] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Busca por expressão regular usando o índice de trigramas (varredura no `scanner`,
+        ou no pool da instância, quando a carga justifica).
+
+        Returns:
+            (itens por relevância, True se o orçamento de tempo interrompeu a varredura:
+            o resultado pode estar incompleto)
+        """
+        index, positions = self._index_for(items)
+        engine = RegexEngine(index, time_budget_ms=self.regex_time_budget_ms)
+        try:
+            # Padrão inválido: busca o texto como literal
+            query, item_score, nbs_score = engine.resolve(pattern)
+        except RegexQueryError:
+            return [], False
+
+        planned = engine.plan_positions(query, search_fields, positions)
+        parallel = scanner or self._parallel
+        if parallel is not None and parallel.should_parallelize(index, planned, search_fields):
+            # Já vem ordenado por score, com empates na ordem original
+            matches, truncated = parallel.regex(
+                index, query.pattern, search_fields, planned, item_score, nbs_score, self.regex_time_budget_ms,
+                cancel=cancel,
+            )
+        else:
+            matches, truncated = engine.scan(query, search_fields, planned, item_score, nbs_score)
+            # Ordenar por relevância (score) decrescente, mantendo a ordem original nos empates
+            matches.sort(key=lambda x: x[1], reverse=True)
+        return [index.items[pos] for pos, score in matches], truncated
+
+    @staticmethod
+    def validate_regex(pattern: str) -> Optional[str]:
+        """Retorna a mensagem de erro de um padrão regex, ou None se for válido."""
+        try:
+            compile_query(pattern)
+        except RegexQueryError as e:
+            return str(e)
+        return None
+
     def _search_by_code(self, items: List[Dict], query: str, code_type: str) -> List[Dict]:
         """Busca específica por código."""
         normalized_query = self.normalize_text(query)
+        if code_type == "nbs":
+            indexed = self._graph_search(items, normalized_query)
+            if indexed is not None:
+                return indexed
         results = []
 
         for item in items:
@@ -336,6 +1141,28 @@ class SearchServiceEnhanced:
 
         return results
 
+    def _graph_search(self, items: List[Dict], nbs_code: str) -> Optional[List[Dict]]:
+        """
+        Código NBS completo pelo grafo de códigos (mesmo resultado da varredura). Vale quando
+        todos os códigos NBS da base têm o comprimento do código e os LC116 são menores: aí
+        "contém o código" equivale a "é o código". None quando não vale ou a base não tem grafo.
+        """
+        indexed = self._known_index(items)
+        if indexed is None:
+            return None
+        index, positions = indexed
+        if not self._is_registered(index):
+            return None
+        graph = self.code_graph(index.items)
+        if graph.code_lengths['nbs'] != (len(nbs_code), len(nbs_code)) or graph.code_lengths['lc116'][1] >= len(nbs_code):
+            return None
+        found = graph.item_positions('nbs', nbs_code)
+        if positions is None:
+            return [index.items[pos] for pos in found.tolist()]
+        selected = np.zeros(len(index), dtype=bool)
+        selected[found] = True
+        return [index.items[pos] for pos in positions if selected[pos]]
+
     def _calculate_match_score(
         self,
         item: Dict,
@@ -371,22 +1198,6 @@ class SearchServiceEnhanced:
                 elif search_type == "exact":
                     if term == normalized_value:
                         score = 100.0
-                        
-                elif search_type == "fuzzy":
-                    ratio = fuzz.partial_ratio(term, normalized_value)
-                    if ratio >= self.fuzzy_threshold:
-                        score = ratio
-                        # Bonus para match com termo original
-                        if term == original_query:
-                            score += 10.0
-                            
-                elif search_type == "regex":
-                    try:
-                        if re.search(term, normalized_value, re.IGNORECASE):
-                            score = 80.0
-                    except re.error:
-                        if term in normalized_value:
-                            score = 70.0
 
                 max_score = max(max_score, score)
 
@@ -404,11 +1215,6 @@ class SearchServiceEnhanced:
                         max_score = max(max_score, score)
                     if term in nbs_code:
                         max_score = max(max_score, 90.0)  # Score alto para código
-                        
-                elif search_type == "fuzzy":
-                    ratio = fuzz.partial_ratio(term, nbs_desc)
-                    if ratio >= self.fuzzy_threshold:
-                        max_score = max(max_score, ratio * 0.7)  # Peso menor
 
         return max_score
 
@@ -434,6 +1240,16 @@ class SearchServiceEnhanced:
         # Verificar se parece código
         is_code, _ = self.is_code_query(partial_query)
 
+        # Consulta com erro de digitação: sugere a correção e busca também por ela
+        corrected = self.correct_query(items, partial_query, partial=True)
+        if corrected:
+            suggestions.append({
+                'texto': f"Você quis dizer: {corrected}",
+                'tipo': 'Correção',
+                'codigo': corrected,
+                'score': 85
+            })
+
         for item in items:
             # Sugestões por código LC116
             item_code = item.get('item_lc116', '')
@@ -452,14 +1268,18 @@ class SearchServiceEnhanced:
             # Sugestões por descrição do serviço
             desc = item.get('descricao_item', '')
             normalized_desc = self.normalize_text(desc)
-            if normalized_query in normalized_desc:
+            if normalized_query in normalized_desc or (corrected and corrected in normalized_desc):
                 key = f"desc_{item.get('item_lc116', '')}"
                 if key not in seen:
+                    if normalized_query in normalized_desc:
+                        score = 90 if normalized_desc.startswith(normalized_query) else 70
+                    else:
+                        score = 60
                     suggestions.append({
                         'texto': f"{desc[:60]}... ({item.get('item_lc116', '')})",
                         'tipo': 'Serviço',
                         'codigo': item.get('item_lc116', ''),
-                        'score': 90 if normalized_desc.startswith(normalized_query) else 70
+                        'score': score
                     })
                     seen.add(key)
 
@@ -527,7 +1347,7 @@ class SearchServiceEnhanced:
             ]
 
         if cclasstrib_filter:
-            codigo_filter = cclasstrib_filter.split(' - ')[0] if ' - ' in cclasstrib_filter else cclasstrib_filter
+            codigo_filter = cclasstrib_code(cclasstrib_filter)
             results = [
                 i for i in results
                 if any(
@@ -565,7 +1385,7 @@ class SearchServiceEnhanced:
     def _filter_by_grupo_lc116(self, items: List[Dict], grupo: str) -> List[Dict]:
         """Filtra itens pelo grupo da LC116."""
         # Extrair número do grupo se vier com descrição
-        grupo_num = grupo.split(' ')[0].replace('.', '') if ' ' in grupo else grupo
+        grupo_num = grupo_number(grupo)
         
         def item_in_grupo(item: Dict) -> bool:
             item_code = item.get('item_lc116', '')
@@ -675,22 +1495,30 @@ class SearchServiceEnhanced:
         text: str,
         query: str,
         highlight_color: str = "#FFEB3B",
-        highlight_class: str = "search-highlight"
+        highlight_class: str = "search-highlight",
+        positions: Optional[List[int]] = None
     ) -> str:
-        """Destaca o termo de busca no texto com suporte a múltiplas ocorrências."""
+        """
+        Destaca o termo de busca no texto com suporte a múltiplas ocorrências.
+        `positions` são as ocorrências no texto normalizado, se já conhecidas (ver match_positions).
+        """
         if not query or not text:
             return text
 
-        normalized_query = self.normalize_text(query)
-        normalized_text = self.normalize_text(text)
+        if positions is None:
+            # Encontrar todas as posições
+            normalized_query = self.normalize_text(query)
+            normalized_text = self.normalize_text(text)
+            positions = []
+            pos = normalized_text.find(normalized_query)
+            while pos != -1:
+                positions.append(pos)
+                pos = normalized_text.find(normalized_query, pos + 1)
 
-        # Encontrar todas as posições
         highlighted = text
         offset = 0
-        
-        # Buscar todas as ocorrências
-        pos = normalized_text.find(normalized_query)
-        while pos != -1:
+
+        for pos in positions:
             # Calcular posição ajustada no texto original
             actual_pos = pos + offset
             match_text = text[actual_pos:actual_pos + len(query)]
@@ -709,17 +1537,16 @@ class SearchServiceEnhanced:
                 highlighted[actual_pos + len(query):]
             )
             
-            # Ajustar offset para próxima busca
+            # Ajustar offset para próxima ocorrência
             offset += len(highlight_html) - len(query)
-            
-            # Buscar próxima ocorrência
-            pos = normalized_text.find(normalized_query, pos + 1)
 
         return highlighted
 
-    def get_filter_counts(self, items: List[Dict]) -> Dict[str, Dict]:
-        """Retorna contagem de itens para cada opção de filtro."""
-        counts = {
+    @staticmethod
+    def empty_filter_counts() -> Dict[str, Dict]:
+        """Contadores de facetas zerados (preenchidos por `count_item`)."""
+        return {
+            'filtros_principais': {},
             'tipos_tributacao': {},
             'grupos_lc116': {},
             'locais_incidencia': {},
@@ -727,34 +1554,45 @@ class SearchServiceEnhanced:
             'adq_exterior': {'S': 0, 'N': 0},
         }
 
-        for item in items:
-            # Contagem por grupo LC116
-            item_code = item.get('item_lc116', '')
-            if item_code:
-                grupo = item_code.split('.')[0]
-                counts['grupos_lc116'][grupo] = counts['grupos_lc116'].get(grupo, 0) + 1
+    def count_item(self, counts: Dict[str, Dict], item: Dict):
+        """Acumula um item nos contadores de facetas (permite contar durante outra passada)."""
+        # Contagem por categoria principal
+        categoria_item = item.get('filtro_principal', '')
+        if categoria_item:
+            counts['filtros_principais'][categoria_item] = counts['filtros_principais'].get(categoria_item, 0) + 1
 
-            for nbs in item.get('nbs_entries', []):
-                # Prestação onerosa
-                ps = nbs.get('ps_onerosa', '')
-                if ps in counts['ps_onerosa']:
-                    counts['ps_onerosa'][ps] += 1
-
-                # Aquisição exterior
-                adq = nbs.get('adq_exterior', '')
-                if adq in counts['adq_exterior']:
-                    counts['adq_exterior'][adq] += 1
-
-                # Local de incidência
-                local = nbs.get('local_incidencia_ibs', '')
-                if local:
-                    counts['locais_incidencia'][local] = counts['locais_incidencia'].get(local, 0) + 1
-
-                # Tipo de tributação
-                for cc in nbs.get('cclasstrib', []):
-                    codigo = cc.get('codigo', '')
-                    info = self.get_classificacao_didatica(codigo)
-                    categoria = info['categoria']
-                    counts['tipos_tributacao'][categoria] = counts['tipos_tributacao'].get(categoria, 0) + 1
+        # Contagem por grupo LC116
+        item_code = item.get('item_lc116', '')
+        if item_code:
+            grupo = item_code.split('.')[0]
+            counts['grupos_lc116'][grupo] = counts['grupos_lc116'].get(grupo, 0) + 1
 
+        for nbs in item.get('nbs_entries', []):
+            # Prestação onerosa
+            ps = nbs.get('ps_onerosa', '')
+            if ps in counts['ps_onerosa']:
+                counts['ps_onerosa'][ps] += 1
+
+            # Aquisição exterior
+            adq = nbs.get('adq_exterior', '')
+            if adq in counts['adq_exterior']:
+                counts['adq_exterior'][adq] += 1
+
+            # Local de incidência
+            local = nbs.get('local_incidencia_ibs', '')
+            if local:
+                counts['locais_incidencia'][local] = counts['locais_incidencia'].get(local, 0) + 1
+
+            # Tipo de tributação
+            for cc in nbs.get('cclasstrib', []):
+                codigo = cc.get('codigo', '')
+                info = self.get_classificacao_didatica(codigo)
+                categoria = info['categoria']
+                counts['tipos_tributacao'][categoria] = counts['tipos_tributacao'].get(categoria, 0) + 1
+
+    def get_filter_counts(self, items: List[Dict]) -> Dict[str, Dict]:
+        """Retorna contagem de itens para cada opção de filtro."""
+        counts = self.empty_filter_counts()
+        for item in items:
+            self.count_item(counts, item)
         return counts
@@ -0,0 +1,60 @@
+"""
+Montagem do conjunto de serviços (versões da base + busca) a partir dos arquivos.
+Usada pelo app Streamlit, pela API e pelos processos de trabalho.
+"""
+from pathlib import Path
+from typing import Optional, Tuple
+
+from services.dataset_registry import DatasetRegistry
+from services.search_service import SearchServiceEnhanced
+from services.sqlite_backend import open_sqlite_backend
+
+
+def build_services(
+    data_file: Path,
+    versions_dir: Optional[Path] = None,
+    fuzzy_threshold: int = 60,
+    regex_time_budget_ms: int = 250,
+    parallel_workers: int = 0,
+    backend: str = "memory"
+) -> Tuple[DatasetRegistry, SearchServiceEnhanced]:
+    """
+    Carrega a base principal (e as versões adicionais) e registra os índices de busca.
+
+    Args:
+        backend: "memory" (índices em memória) ou "sqlite": busca contém/exata da base principal
+            pelo arquivo *.search.sqlite (build_dataset.py --sqlite); sem o arquivo atualizado,
+            a busca continua em memória
+
+    Raises:
+        DatasetLoadError: Falha ao carregar a base principal
+    """
+    registry = DatasetRegistry()
+    registry.load(data_file)
+    if versions_dir is not None:
+        registry.load_directory(versions_dir)
+
+    search_service = SearchServiceEnhanced(
+        fuzzy_threshold=fuzzy_threshold,
+        regex_time_budget_ms=regex_time_budget_ms,
+        parallel_workers=parallel_workers,
+    )
+    # Cada versão fica registrada pela versão (sem descarte); o índice de quem não veio do
+    # cache em disco e os índices auxiliares são montados no primeiro uso
+    for version in registry.versions:
+        data_service = registry.get(version)
+        if data_service.cached_index is not None:
+            search_service.register_index(data_service.cached_index, version)
+        else:
+            search_service.defer_index(data_service.items, version)
+
+    sqlite_backend = None
+    if backend == "sqlite":
+        sqlite_backend = open_sqlite_backend(data_file, search_service, registry.get().items)
+        if sqlite_backend is not None:
+            search_service.attach_backend(sqlite_backend)
+    if sqlite_backend is None:
+        # A versão principal atende a maior parte das buscas: já sai pronta. Com o SQLite,
+        # os índices dela só são montados quando um tipo de busca fora dele precisar
+        search_service.warm_up(registry.get().items)
+    return registry, search_service
@@ -0,0 +1,100 @@
+"""
+Correção ortográfica por dicionário de remoções simétricas (estilo SymSpell). Cada
+palavra do vocabulário é indexada pelas variantes obtidas removendo até N letras do
+seu início; para corrigir um termo, basta gerar as mesmas remoções dele e conferir
+a distância só das poucas palavras encontradas, sem comparar com o vocabulário todo.
+"""
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from rapidfuzz.distance import OSA
+
+
+# Distância máxima de edição indexada e tamanho do início de palavra usado nas remoções
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7
+
+
+def max_distance_for(term: str) -> int:
+    """Erros tolerados por tamanho do termo (palavras curtas não são corrigidas)."""
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 7 else MAX_EDIT_DISTANCE
+
+
+class SpellingCorrector:
+    """
+    Dicionário de remoções sobre um vocabulário com frequências.
+
+    Attributes:
+        frequencies: Ocorrências de cada palavra (desempate entre correções)
+        deletes: Variante com letras removidas -> palavras que a geram
+    """
+
+    def __init__(self, words: Iterable[str], max_distance: int = MAX_EDIT_DISTANCE,
+                 prefix_length: int = PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.frequencies = Counter(word for word in words if word.isalpha())
+        self.vocabulary = sorted(self.frequencies)
+        self.deletes: Dict[str, List[str]] = {}
+        for word in self.vocabulary:
+            for variant in self._variants(word[:prefix_length]):
+                self.deletes.setdefault(variant, []).append(word)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.frequencies
+
+    def _variants(self, text: str) -> Set[str]:
+        """O texto e todas as variantes com até `max_distance` letras removidas."""
+        variants = {text}
+        frontier = {text}
+        for _ in range(self.max_distance):
+            frontier = {
+                variant[:i] + variant[i + 1:]
+                for variant in frontier if len(variant) > 1 for i in range(len(variant))
+            } - variants
+            variants |= frontier
+        return variants
+
+    def is_prefix(self, text: str) -> bool:
+        """Indica se alguma palavra do vocabulário começa com o texto."""
+        i = bisect_left(self.vocabulary, text)
+        return i < len(self.vocabulary) and self.vocabulary[i].startswith(text)
+
+    def lookup(self, term: str, max_distance: Optional[int] = None,
+               prefix: bool = False) -> List[Tuple[str, int]]:
+        """
+        Palavras a até `max_distance` edições do termo (distância, depois frequência).
+        Com `prefix`, o termo é um início de palavra e é comparado com o início de cada uma.
+        """
+        if max_distance is None:
+            max_distance = max_distance_for(term)
+        max_distance = min(max_distance, self.max_distance)
+        if term in self.frequencies:
+            return [(term, 0)]
+        if max_distance == 0 or not term.isalpha():
+            return []
+        found: Dict[str, int] = {}
+        for variant in self._variants(term[:self.prefix_length]):
+            for word in self.deletes.get(variant, ()):
+                if word in found:
+                    continue
+                target = word[:len(term)] if prefix else word
+                if abs(len(target) - len(term)) > max_distance:
+                    continue
+                distance = OSA.distance(term, target, score_cutoff=max_distance)
+                if distance <= max_distance:
+                    found[word] = distance
+        return sorted(found.items(), key=lambda kv: (kv[1], -self.frequencies[kv[0]], kv[0]))
+
+    def correct(self, term: str, prefix: bool = False) -> str:
+        """
+        Melhor correção do termo; o próprio termo se nenhuma correção for encontrada ou se
+        ele já for uma palavra ou início de palavra conhecido (as buscas casam trechos).
+        Com `prefix`, um início de palavra com erro é completado com a palavra corrigida.
+        """
+        if self.is_prefix(term):
+            return term
+        matches = self.lookup(term, prefix=prefix)
+        return matches[0][0] if matches else term
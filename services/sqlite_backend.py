@@ -0,0 +1,342 @@
+"""
+Backend de busca em SQLite, alternativo aos índices em memória, para implantações com
+muitas instâncias pequenas do app. A base é gravada uma vez em um arquivo local
+(base.json -> base.search.sqlite) e cada processo apenas o abre, somente leitura e
+mapeado em memória (mmap), sem reconstruir índices em Python.
+
+- Códigos e facetas: colunas com índices B-tree (filtros da sidebar e busca exata)
+- Busca "contém": tabela FTS5 de trigramas sobre os textos já normalizados, que acha
+  qualquer trecho de 3+ caracteres (termos menores são procurados com `instr`), com a
+  mesma pontuação da busca em memória
+
+A interface é a mesma do SearchServiceEnhanced (`search_items` e `filter_items`); os
+tipos de busca sem equivalente exato em SQL (fuzzy, regex, palavras, fonética...) usam o
+serviço em memória. Com SEARCH_CONFIG["backend"] = "sqlite", build_services liga o backend
+ao serviço de busca da base principal (`SearchServiceEnhanced.attach_backend`).
+"""
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.facet_index import cclasstrib_code, grupo_number
+from services.index_cache import file_sha256
+from services.search_service import SearchServiceEnhanced
+
+
+SQLITE_SUFFIX = '.search.sqlite'
+SQLITE_FORMAT = 2
+# Tipos de busca respondidos pelo SQLite (mesmos resultados da busca em memória; a busca por
+# palavras do FTS5 casa e ordena de outro jeito e fica com o serviço em memória)
+SQLITE_SEARCH_TYPES = ('contains', 'exact')
+# Origem de cada texto normalizado (campos de item pesquisáveis no SQLite e textos NBS)
+SQLITE_FIELDS = ('descricao_item', 'item_lc116')
+NBS_DESCRIPTION = 'descricao_nbs'
+NBS_CODE = 'nbs_code'
+CODE_KINDS = ('item_lc116', NBS_CODE)
+# Menor termo atendido pelo índice de trigramas
+MIN_TRIGRAM_TERM = 3
+# Tamanho máximo do mapeamento em memória do arquivo (por conexão)
+MMAP_SIZE = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE items (
+    pos INTEGER PRIMARY KEY,
+    item_lc116 TEXT, grupo TEXT, filtro_principal TEXT, subcategoria TEXT,
+    payload TEXT NOT NULL
+);
+CREATE TABLE nbs (
+    item_pos INTEGER NOT NULL, nbs_index INTEGER NOT NULL,
+    ps_onerosa TEXT, adq_exterior TEXT, local_incidencia TEXT
+);
+CREATE TABLE cclass (item_pos INTEGER NOT NULL, codigo TEXT, categoria TEXT);
+CREATE TABLE texts (id INTEGER PRIMARY KEY, item_pos INTEGER NOT NULL, kind TEXT NOT NULL, norm TEXT NOT NULL);
+CREATE VIRTUAL TABLE texts_trigram USING fts5(
+    norm, content = 'texts', content_rowid = 'id', tokenize = 'trigram'
+);
+CREATE INDEX items_filtro ON items (filtro_principal);
+CREATE INDEX items_subcategoria ON items (subcategoria);
+CREATE INDEX items_grupo ON items (grupo);
+CREATE INDEX texts_exact ON texts (kind, norm, item_pos);
+CREATE INDEX nbs_onerosa ON nbs (ps_onerosa, item_pos);
+CREATE INDEX nbs_exterior ON nbs (adq_exterior, item_pos);
+CREATE INDEX nbs_local ON nbs (local_incidencia, item_pos);
+CREATE INDEX cclass_codigo ON cclass (codigo, item_pos);
+CREATE INDEX cclass_categoria ON cclass (categoria, item_pos);
+"""
+
+# Filtros de filter_items -> (subconsulta com as posições dos itens, transformação do valor)
+FILTER_QUERIES = {
+    'filtro_principal': ("SELECT pos FROM items WHERE filtro_principal = ?", None),
+    'subcategoria': ("SELECT pos FROM items WHERE subcategoria = ?", None),
+    'ps_onerosa': ("SELECT item_pos FROM nbs WHERE ps_onerosa = ?", None),
+    'adq_exterior': ("SELECT item_pos FROM nbs WHERE adq_exterior = ?", None),
+    'local_incidencia': ("SELECT item_pos FROM nbs WHERE local_incidencia = ?", None),
+    'cclasstrib_filter': ("SELECT item_pos FROM cclass WHERE codigo = ?", cclasstrib_code),
+    'tipo_tributacao': ("SELECT item_pos FROM cclass WHERE instr(categoria, ?) > 0", str.lower),
+    'grupo_lc116': ("SELECT pos FROM items WHERE grupo = ?", grupo_number),
+}
+
+
+def sqlite_database_path(data_file: Path) -> Path:
+    """Caminho do arquivo SQLite associado a um arquivo de dados."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + SQLITE_SUFFIX)
+
+
+def build_sqlite_database(data_file: Path, items: List[Dict], search_service: SearchServiceEnhanced) -> Path:
+    """Grava a base no arquivo SQLite (vinculado ao hash atual do arquivo de dados)."""
+    normalize = search_service.normalize_text
+    db_path = sqlite_database_path(data_file)
+    tmp_path = db_path.with_name(db_path.name + '.tmp')
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('format', str(SQLITE_FORMAT)), ('source_sha256', file_sha256(data_file)),
+        ])
+        for pos, item in enumerate(items):
+            item_code = item.get('item_lc116', '')
+            nbs_entries = item.get('nbs_entries', [])
+            conn.execute(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?)",
+                (pos, item_code, item_code.split('.')[0] if item_code else None,
+                 item.get('filtro_principal'), item.get('subcategoria'), json.dumps(item, ensure_ascii=False)),
+            )
+            conn.executemany("INSERT INTO nbs VALUES (?, ?, ?, ?, ?)", [
+                (pos, i, nbs.get('ps_onerosa'), nbs.get('adq_exterior'), nbs.get('local_incidencia_ibs'))
+                for i, nbs in enumerate(nbs_entries)
+            ])
+            # Campo vazio no item não é pesquisado (mesma regra da busca em memória)
+            texts = [(field, item.get(field, '')) for field in SQLITE_FIELDS if item.get(field, '')]
+            texts += [(NBS_DESCRIPTION, nbs.get('descricao_nbs', '')) for nbs in nbs_entries]
+            texts += [(NBS_CODE, nbs.get('nbs_code', '')) for nbs in nbs_entries]
+            conn.executemany(
+                "INSERT INTO texts (item_pos, kind, norm) VALUES (?, ?, ?)",
+                [(pos, kind, normalize(str(text))) for kind, text in texts],
+            )
+            conn.executemany("INSERT INTO cclass VALUES (?, ?, ?)", [
+                (pos, cc.get('codigo'),
+                 search_service.get_classificacao_didatica(cc.get('codigo', ''))['categoria'].lower())
+                for nbs in nbs_entries for cc in nbs.get('cclasstrib', [])
+            ])
+        conn.execute("INSERT INTO texts_trigram (rowid, norm) SELECT id, norm FROM texts")
+        conn.execute("INSERT INTO texts_trigram (texts_trigram) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return db_path
+
+
+def is_sqlite_database_current(data_file: Path) -> bool:
+    """Indica se o arquivo SQLite existe e corresponde ao conteúdo atual da base."""
+    db_path = sqlite_database_path(data_file)
+    if not db_path.exists() or not Path(data_file).exists():
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+    return meta.get('format') == str(SQLITE_FORMAT) and meta.get('source_sha256') == file_sha256(data_file)
+
+
+class SqliteSearchBackend:
+    """Busca e filtros sobre o arquivo SQLite, com uma conexão somente leitura por thread."""
+
+    search_types = SQLITE_SEARCH_TYPES
+
+    def __init__(
+        self,
+        db_path: Path,
+        search_service: Optional[SearchServiceEnhanced] = None,
+        items: Optional[List[Dict]] = None
+    ):
+        """
+        Args:
+            db_path: Arquivo gerado por build_sqlite_database
+            search_service: Normalização, sinônimos e tipos de busca sem SQL (sem índices registrados)
+            items: Itens já carregados da mesma base (na ordem do arquivo); sem eles, vêm do SQLite
+        """
+        self.db_path = Path(db_path)
+        self.search_service = search_service or SearchServiceEnhanced()
+        self._local = threading.local()
+        if items is None:
+            rows = self._connection().execute("SELECT payload FROM items ORDER BY pos")
+            items = [json.loads(payload) for payload, in rows]
+        self.items: List[Dict] = items
+        self._position_by_id = {id(item): pos for pos, item in enumerate(self.items)}
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            conn.execute("PRAGMA query_only = 1")
+            self._local.conn = conn
+        return conn
+
+    def positions_of(self, items: List[Dict]) -> Optional[List[int]]:
+        """Posições dos itens no arquivo (None se algum item não veio deste backend)."""
+        if items is self.items:
+            return list(range(len(self.items)))
+        positions = []
+        for item in items:
+            pos = self._position_by_id.get(id(item))
+            if pos is None:
+                return None
+            positions.append(pos)
+        return positions
+
+    # ------------------------------------------------------------------
+    # Busca
+    # ------------------------------------------------------------------
+
+    def search_items(
+        self,
+        items: List[Dict],
+        query: str,
+        search_type: str = "contains",
+        search_fields: List[str] = None,
+        use_synonyms: bool = True
+    ) -> List[Dict]:
+        """Mesmo contrato de SearchServiceEnhanced.search_items (itens deste backend)."""
+        if not query or len(query) < 2:
+            return items
+        if search_fields is None:
+            search_fields = ['descricao_item', 'item_lc116']
+        results = self.search_covered(items, query, search_type, search_fields, use_synonyms)
+        if results is None:
+            return self.search_service.search_items(items, query, search_type, search_fields, use_synonyms)
+        return results
+
+    def search_covered(
+        self,
+        items: List[Dict],
+        query: str,
+        search_type: str,
+        search_fields: List[str],
+        use_synonyms: bool = True
+    ) -> Optional[List[Dict]]:
+        """
+        Busca no SQLite (consulta já validada), ou None se o tipo, os campos ou os itens
+        não são atendidos por este backend (quem chama usa a busca em memória).
+        """
+        if search_type not in SQLITE_SEARCH_TYPES or any(field not in SQLITE_FIELDS for field in search_fields):
+            return None
+        positions = self.positions_of(items)
+        if positions is None:
+            return None
+
+        service = self.search_service
+        is_code, _ = service.is_code_query(query)
+        if is_code:
+            matched = self._code_matches(service.normalize_text(query))
+            return [item for item, pos in zip(items, positions) if pos in matched]
+
+        normalized_query = service.normalize_text(query)
+        search_terms = {normalized_query}
+        if use_synonyms and search_type != "exact":
+            search_terms = service.expand_query_with_synonyms(query)
+        if search_type == "exact":
+            scores = self._exact_scores(search_terms, search_fields)
+        else:
+            scores = self._contains_scores(search_terms, search_fields, normalized_query)
+        results = [(item, scores[pos]) for item, pos in zip(items, positions) if pos in scores]
+        results.sort(key=lambda x: x[1], reverse=True)
+        return [item for item, score in results]
+
+    def _occurrences(self, term: str, kinds: Tuple[str, ...]) -> List[Tuple[int, str, int]]:
+        """(item, origem, posição 1-based) dos textos das origens `kinds` que contêm o termo."""
+        placeholders = ', '.join('?' * len(kinds))
+        if len(term) >= MIN_TRIGRAM_TERM:
+            sql = (
+                "SELECT t.item_pos, t.kind, instr(t.norm, ?) FROM texts_trigram "
+                "JOIN texts t ON t.id = texts_trigram.rowid "
+                f"WHERE texts_trigram MATCH ? AND t.kind IN ({placeholders})"
+            )
+            params = (term, '"' + term.replace('"', '""') + '"', *kinds)
+        else:
+            sql = (
+                "SELECT item_pos, kind, instr(norm, ?1) FROM texts "
+                f"WHERE instr(norm, ?1) > 0 AND kind IN ({', '.join(f'?{i + 2}' for i in range(len(kinds)))})"
+            )
+            params = (term, *kinds)
+        return self._connection().execute(sql, params).fetchall()
+
+    def _code_matches(self, code: str) -> set:
+        """Itens cujo código LC116 ou algum código NBS contém o código (como _search_by_code)."""
+        return {pos for pos, kind, start in self._occurrences(code, CODE_KINDS)}
+
+    def _contains_scores(self, terms, search_fields: List[str], original_query: str) -> Dict[int, float]:
+        """Pontuação da busca "contém" (mesmos pesos da busca em memória)."""
+        kinds = (*search_fields, NBS_DESCRIPTION, NBS_CODE)
+        scores: Dict[int, float] = {}
+        for term in terms:
+            is_original = term == original_query
+            for pos, kind, start in self._occurrences(term, kinds):
+                if kind == NBS_DESCRIPTION:
+                    score = 70.0 if is_original else 60.0
+                elif kind == NBS_CODE:
+                    score = 90.0
+                else:
+                    score = (100.0 if start == 1 else 80.0) + (20.0 if is_original else 0.0)
+                if score > scores.get(pos, 0.0):
+                    scores[pos] = score
+        return scores
+
+    def _exact_scores(self, terms, search_fields: List[str]) -> Dict[int, float]:
+        """Busca exata: algum campo igual a um dos termos (pelo índice B-tree dos textos)."""
+        scores: Dict[int, float] = {}
+        conn = self._connection()
+        for term in terms:
+            for field in search_fields:
+                for pos, in conn.execute("SELECT item_pos FROM texts WHERE kind = ? AND norm = ?", (field, term)):
+                    scores[pos] = 100.0
+        return scores
+
+    # ------------------------------------------------------------------
+    # Filtros
+    # ------------------------------------------------------------------
+
+    def filter_items(self, items: List[Dict], **filters: Optional[str]) -> List[Dict]:
+        """Mesmo contrato de SearchServiceEnhanced.filter_items (filtros pelos índices B-tree)."""
+        active = {key: value for key, value in filters.items() if value}
+        unknown = set(active) - set(FILTER_QUERIES)
+        if unknown:
+            raise TypeError(f"Filtros desconhecidos: {', '.join(sorted(unknown))}")
+        if not active:
+            return items.copy()
+        positions = self.positions_of(items)
+        if positions is None:
+            return self.search_service.filter_items(items, **active)
+        clauses, params = [], []
+        for key, value in active.items():
+            sql, transform = FILTER_QUERIES[key]
+            clauses.append(f"pos IN ({sql})")
+            params.append(transform(value) if transform else value)
+        rows = self._connection().execute(f"SELECT pos FROM items WHERE {' AND '.join(clauses)}", params)
+        matched = {pos for pos, in rows}
+        return [item for item, pos in zip(items, positions) if pos in matched]
+
+
+def open_sqlite_backend(
+    data_file: Path,
+    search_service: Optional[SearchServiceEnhanced] = None,
+    items: Optional[List[Dict]] = None
+) -> Optional[SqliteSearchBackend]:
+    """Abre o backend SQLite da base, se o arquivo existir e estiver atualizado (None caso contrário)."""
+    if not is_sqlite_database_current(data_file):
+        return None
+    return SqliteSearchBackend(sqlite_database_path(data_file), search_service, items)
@@ -0,0 +1,69 @@
+"""
+Redutor de palavras (stemmer) leve para o português, no estilo do RSLP: remove o plural,
+o advérbio em "-mente", sufixos de substantivos e adjetivos ou, se nenhum casar, de
+verbos, e por fim a vogal temática. Trabalha sobre texto já normalizado (sem acentos),
+de modo que "contábil"/"contabilidade", "consultor"/"consultoria" e
+"transporte"/"transportes" chegam ao mesmo radical.
+"""
+from functools import lru_cache
+from typing import Tuple
+
+
+# Regras: (sufixo, substituição, tamanho mínimo do radical que sobra)
+Rule = Tuple[str, str, int]
+
+PLURAL_RULES: Tuple[Rule, ...] = (
+    ('oes', 'ao', 2), ('aes', 'ao', 2), ('ais', 'al', 2), ('ois', 'ol', 2),
+    # "-eis" vem de "-vel", "-til", "-bil" (imóveis, têxteis, contábeis) ou de "-el" (hotéis)
+    ('veis', 'vel', 2), ('teis', 'til', 3), ('beis', 'bil', 2), ('eis', 'el', 2),
+    ('ns', 'm', 2), ('res', 'r', 2), ('zes', 'z', 2), ('les', 'l', 2), ('s', '', 3),
+)
+
+ADVERB_RULES: Tuple[Rule, ...] = (('mente', '', 4),)
+
+NOUN_RULES: Tuple[Rule, ...] = (
+    ('idade', '', 4),
+    ('amento', '', 3), ('imento', '', 3), ('mento', '', 4),
+    ('acao', '', 3), ('icao', '', 3), ('cao', '', 4),
+    ('adora', '', 3), ('edora', '', 3), ('idora', '', 3),
+    ('ador', '', 3), ('edor', '', 3), ('idor', '', 3), ('oria', '', 3), ('or', '', 4),
+    ('ativo', '', 4), ('ativa', '', 4), ('ivo', '', 4), ('iva', '', 4),
+    ('encia', '', 3), ('ancia', '', 3), ('ente', '', 4), ('ante', '', 4),
+    ('eiro', '', 3), ('eira', '', 3), ('ario', '', 3), ('aria', '', 3),
+    ('agem', '', 3), ('ista', '', 4), ('ismo', '', 3),
+    ('avel', '', 3), ('ivel', '', 3), ('ico', '', 4), ('ica', '', 4), ('al', '', 4),
+    ('oso', '', 3), ('osa', '', 3), ('ia', '', 4),
+)
+
+VERB_RULES: Tuple[Rule, ...] = (
+    ('ando', '', 3), ('endo', '', 3), ('indo', '', 3),
+    ('ado', '', 3), ('ada', '', 3), ('ido', '', 3), ('ida', '', 3),
+    ('ar', '', 3), ('er', '', 3), ('ir', '', 3),
+)
+
+VOWEL_RULES: Tuple[Rule, ...] = (('a', '', 3), ('e', '', 3), ('o', '', 3))
+
+# Palavras mais curtas que isto (e códigos) não são reduzidas
+MIN_STEM_WORD = 4
+
+
+def _apply(word: str, rules: Tuple[Rule, ...]) -> Tuple[str, bool]:
+    """Aplica a primeira regra cujo sufixo casa e deixa um radical grande o bastante."""
+    for suffix, replacement, min_stem in rules:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_stem:
+            return word[:len(word) - len(suffix)] + replacement, True
+    return word, False
+
+
+@lru_cache(maxsize=16384)
+def stem(word: str) -> str:
+    """Radical de uma palavra normalizada (minúsculas, sem acentos)."""
+    if len(word) < MIN_STEM_WORD or not word.isalpha():
+        return word
+    word, _ = _apply(word, PLURAL_RULES)
+    word, _ = _apply(word, ADVERB_RULES)
+    word, changed = _apply(word, NOUN_RULES)
+    if not changed:
+        word, _ = _apply(word, VERB_RULES)
+    word, _ = _apply(word, VOWEL_RULES)
+    return word
@@ -0,0 +1,156 @@
+"""
+Array de sufixos (com LCP) para a busca "contém". Todos os textos normalizados
+pesquisáveis (campos do item, descrições e códigos NBS) são concatenados em um único
+buffer, separados por sentinelas; os sufixos do buffer ficam em ordem lexicográfica e
+qualquer trecho (inclusive entre palavras, como "processamento de d") é encontrado por
+busca binária em O(m log n), com os mesmos resultados do operador `in`. As posições
+das ocorrências saem junto (usadas no destaque dos resultados).
+"""
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+from services.search_index import SearchIndex
+
+
+# Separador entre textos: a normalização nunca o produz, então nenhuma consulta o atravessa
+SENTINEL = '\x00'
+# Origens de trecho que não são campos do item
+NBS_DESCRIPTION = 'descricao_nbs'
+NBS_CODE = 'nbs_code'
+
+
+class SuffixArrayIndex:
+    """
+    Buffer concatenado, array de sufixos e LCP, com o mapa deslocamento -> (item, NBS, campo).
+
+    Attributes:
+        buffer: Textos normalizados, cada um seguido de SENTINEL
+        suffixes: Início dos sufixos do buffer em ordem lexicográfica
+        lcp: lcp[i] = prefixo comum entre os sufixos suffixes[i - 1] e suffixes[i]
+        segment_starts: Deslocamento de cada texto no buffer
+        segment_items: Posição do item de cada texto
+        segment_nbs: Índice da entrada NBS de cada texto (-1 nos campos do item)
+        segment_fields: Campo de cada texto (campo do item, NBS_DESCRIPTION ou NBS_CODE)
+    """
+
+    def __init__(self, index: SearchIndex, fields: Sequence[str]):
+        self.index = index
+        self.fields = tuple(fields)
+        field_values = [(field, index.field_values(field)) for field in self.fields]
+
+        texts: List[str] = []
+        items: List[int] = []
+        nbs: List[int] = []
+        fields_of: List[str] = []
+        for pos, item in enumerate(index.items):
+            for field, values in field_values:
+                # Mesma regra da pontuação: campo vazio no item não é pesquisado
+                if item.get(field, ''):
+                    texts.append(values[pos])
+                    items.append(pos)
+                    nbs.append(-1)
+                    fields_of.append(field)
+            for kind, entries in ((NBS_DESCRIPTION, index.nbs_descriptions[pos]), (NBS_CODE, index.nbs_codes[pos])):
+                for i, text in enumerate(entries):
+                    texts.append(text)
+                    items.append(pos)
+                    nbs.append(i)
+                    fields_of.append(kind)
+
+        lengths = np.asarray([len(text) + 1 for text in texts], dtype=np.int64)
+        self.segment_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        self.segment_items = np.asarray(items, dtype=np.int64)
+        self.segment_nbs = np.asarray(nbs, dtype=np.int64)
+        self.segment_fields = np.asarray(fields_of)
+        self.buffer = ''.join(text + SENTINEL for text in texts)
+        self.suffixes, self.lcp = _build_suffix_array(self.buffer, self.segment_starts + lengths - 1)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _range(self, literal: str) -> Tuple[int, int]:
+        """Faixa [início, fim) do array de sufixos com os sufixos que começam com o literal."""
+        size = len(literal)
+        buffer = self.buffer
+        start = bisect_left(self.suffixes, literal, key=lambda offset: buffer[offset:offset + size])
+        if start == len(self.suffixes) or buffer[self.suffixes[start]:self.suffixes[start] + size] != literal:
+            return start, start
+        # Os sufixos seguintes continuam na faixa enquanto o prefixo comum com o anterior
+        # cobre o literal: o fim é achado pelo LCP, em blocos crescentes
+        end, block = start + 1, 64
+        while end < len(self.lcp):
+            short = np.flatnonzero(self.lcp[end:end + block] < size)
+            if short.size:
+                return start, end + int(short[0])
+            end += block
+            block *= 2
+        return start, len(self.lcp)
+
+    def find(self, literal: str) -> np.ndarray:
+        """Deslocamentos (no buffer) de todas as ocorrências do literal, em ordem crescente."""
+        if not literal or SENTINEL in literal:
+            return np.zeros(0, dtype=np.int64)
+        start, end = self._range(literal)
+        return np.sort(self.suffixes[start:end])
+
+    def occurrences(self, literal: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(texto, posição dentro do texto) de cada ocorrência do literal."""
+        offsets = self.find(literal)
+        segments = np.searchsorted(self.segment_starts, offsets, side='right') - 1
+        return segments, offsets - self.segment_starts[segments]
+
+    def match_positions(self, literal: str) -> Dict[int, Dict[Tuple[str, int], List[int]]]:
+        """Item -> {(campo, índice NBS ou -1): posições do literal no texto normalizado}."""
+        found: Dict[int, Dict[Tuple[str, int], List[int]]] = {}
+        segments, starts = self.occurrences(literal)
+        for segment, start in zip(segments.tolist(), starts.tolist()):
+            key = (str(self.segment_fields[segment]), int(self.segment_nbs[segment]))
+            found.setdefault(int(self.segment_items[segment]), {}).setdefault(key, []).append(start)
+        return found
+
+
+def _build_suffix_array(buffer: str, sentinels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Array de sufixos por duplicação de prefixos (ordenações do numpy, O(n log n)) e LCP
+    pelas ordens de cada rodada. Cada sentinela recebe um código próprio, menor que
+    qualquer caractere, para que nenhum prefixo comum atravesse o fim de um texto.
+    """
+    size = len(buffer)
+    if size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    codes = np.frombuffer(buffer.encode('utf-32-le'), dtype=np.uint32).astype(np.int64) + len(sentinels)
+    codes[sentinels] = np.arange(len(sentinels))
+    # Códigos densos (0..n-1), para as chaves combinadas abaixo caberem em int64
+    codes = np.unique(codes, return_inverse=True)[1].astype(np.int64)
+
+    # ranks[j]: ordem dos sufixos pelos primeiros 2**j caracteres
+    ranks = [codes]
+    rank = codes
+    step = 1
+    while True:
+        following = np.full(size, -1, dtype=np.int64)
+        following[:size - step] = rank[step:]
+        # Chave (ordem atual, ordem do sufixo `step` adiante) em um único inteiro
+        key = rank * (size + 1) + following + 1
+        order = np.argsort(key)
+        sorted_key = key[order]
+        rank = np.empty(size, dtype=np.int64)
+        rank[order] = np.concatenate(([0], np.cumsum(sorted_key[1:] != sorted_key[:-1])))
+        ranks.append(rank)
+        if rank[order[-1]] == size - 1:
+            break
+        step *= 2
+
+    # LCP entre vizinhos: maior avanço com blocos iguais, do maior bloco para o menor
+    left = np.concatenate(([0], order[:-1]))
+    right = order.copy()
+    lcp = np.zeros(size, dtype=np.int64)
+    for level in range(len(ranks) - 1, -1, -1):
+        block = 1 << level
+        equal = ranks[level][left] == ranks[level][right]
+        lcp += block * equal
+        left = np.minimum(left + block * equal, size - 1)
+        right = np.minimum(right + block * equal, size - 1)
+    lcp[0] = 0
+    return order, lcp
@@ -0,0 +1,302 @@
+"""
+Índice de palavras com posições, para a busca por palavras. Cada palavra da consulta
+casa com palavras inteiras ou com palavras do mesmo radical ("contábil" e
+"contabilidade"); só a última digitada casa também com o início de palavras (a que
+ainda pode estar incompleta), e palavras curtas ("ti") só casam inteiras. As listas
+de itens das palavras são intersectadas (todas precisam aparecer no item) e as
+posições guardadas pontuam frases e proximidade.
+"""
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from services.search_index import SearchIndex
+from services.stemmer import stem
+
+
+# Palavras que sozinhas não restringem a busca (continuam valendo para a pontuação de frase)
+STOPWORDS = frozenset({
+    'a', 'o', 'as', 'os', 'e', 'ou', 'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no', 'nas', 'nos',
+    'ao', 'aos', 'um', 'uma', 'para', 'por', 'com', 'sem', 'que', 'se',
+})
+
+# Origem dos textos de um item além dos campos (descrições e códigos NBS)
+NBS_DESCRIPTION = 'descricao_nbs'
+NBS_CODE = 'nbs_code'
+
+# Peso de cada origem na pontuação (campos do item valem 1.0)
+ORIGIN_WEIGHTS = {NBS_CODE: 0.9, NBS_DESCRIPTION: 0.6}
+PREFIX_MIN_WEIGHT = 0.5  # casou só o início da palavra: cresce com a parte digitada
+STEM_WEIGHT = 0.7        # casou só pelo radical
+SYNONYM_WEIGHT = 0.8     # casou só por sinônimo
+PHRASE_BONUS = 20.0      # palavras da consulta em sequência, na mesma ordem
+PROXIMITY_BONUS = 10.0   # todas no mesmo texto; perde 1 ponto por palavra entre elas
+
+# Palavras mais curtas que isto só casam inteiras (sem prefixo nem radical: "ti" não é "titulos")
+PREFIX_MIN_LENGTH = 3
+
+# Palavras da consulta com o casamento guardado (por índice, as usadas mais recentemente)
+MATCH_CACHE_SIZE = 4096
+
+
+def tokenize(text: str) -> List[str]:
+    """Palavras de um texto já normalizado (pontos só ficam dentro de códigos, ex.: "1.01")."""
+    return [word for word in (raw.strip('.') for raw in text.split()) if word]
+
+
+class TokenClause:
+    """
+    Parte da consulta: casa se alguma alternativa casar no item.
+
+    Attributes:
+        words: Palavras digitadas; todas precisam aparecer, exceto stopwords
+        synonyms: Frases de sinônimos (palavras inteiras e adjacentes)
+        prefix: A última palavra também casa com o início de palavras (é a última da consulta)
+    """
+
+    def __init__(self, words: List[str], synonyms: Sequence[Tuple[str, ...]] = (), prefix: bool = False):
+        self.words = words
+        self.synonyms = list(synonyms)
+        self.prefix = prefix
+
+    def is_prefix(self, word: str) -> bool:
+        """A palavra casa também com o início de palavras."""
+        return self.prefix and word == self.words[-1]
+
+    @property
+    def required_words(self) -> List[str]:
+        return [word for word in self.words if word not in STOPWORDS] or self.words
+
+
+class TokenIndex:
+    """
+    Listas invertidas palavra -> itens, radical -> itens e palavra -> ocorrências
+    (texto, posição) por item.
+    """
+
+    def __init__(self, index: SearchIndex, fields: Sequence[str]):
+        self.index = index
+        self.fields = tuple(fields)
+        # Textos de cada item, como (origem, palavras)
+        self.texts: List[List[Tuple[str, List[str]]]] = []
+        self.postings: Dict[str, List[int]] = {}
+        self.occurrences: Dict[str, Dict[int, List[Tuple[int, int]]]] = {}
+
+        field_values = [(field, index.field_values(field)) for field in self.fields]
+        for pos in range(len(index)):
+            texts = [(field, tokenize(values[pos])) for field, values in field_values]
+            texts += [(NBS_DESCRIPTION, tokenize(text)) for text in index.nbs_descriptions[pos]]
+            texts += [(NBS_CODE, tokenize(text)) for text in index.nbs_codes[pos]]
+            self.texts.append(texts)
+            for text_no, (_, words) in enumerate(texts):
+                for offset, word in enumerate(words):
+                    by_item = self.occurrences.setdefault(word, {})
+                    if pos not in by_item:
+                        by_item[pos] = []
+                        self.postings.setdefault(word, []).append(pos)
+                    by_item[pos].append((text_no, offset))
+        self.vocabulary = sorted(self.postings)
+
+        # Radicais: calculados uma vez por palavra do vocabulário
+        self.stem_words: Dict[str, List[str]] = {}
+        self.stem_postings: Dict[str, List[int]] = {}
+        for word in self.vocabulary:
+            self.stem_words.setdefault(stem(word), []).append(word)
+        for word_stem, words in self.stem_words.items():
+            items: Set[int] = set()
+            for word in words:
+                items.update(self.postings[word])
+            self.stem_postings[word_stem] = sorted(items)
+        # Cache LRU por índice: palavras digitadas (e prefixos parciais) não acumulam sem limite
+        self.matches = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._matches)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def expand(self, prefix: str) -> List[str]:
+        """Palavras do vocabulário que começam com o prefixo."""
+        words = []
+        for i in range(bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            word = self.vocabulary[i]
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    def _matches(self, term: str, prefix: bool = True) -> Dict[str, float]:
+        """
+        Palavras do vocabulário que casam com uma palavra da consulta, com o peso de cada
+        uma: a própria palavra, mesmo radical ou, com `prefix`, início da palavra (cresce
+        com a parte digitada). Palavras curtas só casam inteiras. Use `matches` (mesmo
+        resultado, com cache).
+        """
+        if len(term) < PREFIX_MIN_LENGTH:
+            return {term: 1.0} if term in self.postings else {}
+        found = {word: STEM_WEIGHT for word in self.stem_words.get(stem(term), ())}
+        for word in (self.expand(term) if prefix else [term] if term in self.postings else []):
+            found[word] = PREFIX_MIN_WEIGHT + (1.0 - PREFIX_MIN_WEIGHT) * len(term) / len(word)
+        return found
+
+    def items_with_term(self, term: str, prefix: bool = True) -> Set[int]:
+        """Itens com a palavra ou uma do mesmo radical (com `prefix`, também começando com ela)."""
+        if len(term) < PREFIX_MIN_LENGTH:
+            return set(self.postings.get(term, ()))
+        result = set(self.stem_postings.get(stem(term), ()))
+        if prefix:
+            for word in self.expand(term):
+                result.update(self.postings[word])
+        else:
+            result.update(self.postings.get(term, ()))
+        return result
+
+    def items_with_words(self, words: Iterable[str]) -> Set[int]:
+        """Itens com todas as palavras (por prefixo ou radical), da menor lista para a maior."""
+        return _intersect(self.items_with_term(word) for word in words)
+
+    def clause_items(self, clause: TokenClause) -> Set[int]:
+        result = _intersect(self.items_with_term(word, clause.is_prefix(word)) for word in clause.required_words)
+        for phrase in clause.synonyms:
+            result |= self.items_with_phrase(phrase)
+        return result
+
+    def items_with_phrase(self, phrase: Sequence[str]) -> Set[int]:
+        """Itens com a frase (palavras inteiras, adjacentes e na ordem) em algum texto."""
+        if any(word not in self.postings for word in phrase):
+            return set()
+        candidates = set(self.postings[phrase[0]])
+        for word in phrase[1:]:
+            candidates &= set(self.postings[word])
+        if len(phrase) == 1:
+            return candidates
+        return {pos for pos in candidates if self._phrase_starts(pos, phrase)}
+
+    def _phrase_starts(self, pos: int, phrase: Sequence[str]) -> List[Tuple[int, int]]:
+        following = [set(self.occurrences[word][pos]) for word in phrase[1:]]
+        return [
+            (text_no, offset) for text_no, offset in self.occurrences[phrase[0]][pos]
+            if all((text_no, offset + i) in occ for i, occ in enumerate(following, 1))
+        ]
+
+    def search(
+        self,
+        clauses: List[TokenClause],
+        phrase: List[str],
+        positions: Optional[Iterable[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Itens em que todas as partes da consulta casam, por pontuação decrescente
+        (empates na ordem de `positions`, ou da base).
+
+        Args:
+            clauses: Partes da consulta (E entre elas)
+            phrase: Palavras digitadas, na ordem (para a pontuação de frase e proximidade)
+            positions: Restringe a busca a estas posições
+        """
+        sets = sorted((self.clause_items(clause) for clause in clauses), key=len)
+        matched = sets[0] if sets else set()
+        for other in sets[1:]:
+            if not matched:
+                break
+            matched = matched & other
+        if not matched:
+            return []
+        order = sorted(matched) if positions is None else [pos for pos in positions if pos in matched]
+        results = [(pos, self.score(pos, clauses, phrase)) for pos in order]
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+    # =========================================================================
+    # PONTUAÇÃO
+    # =========================================================================
+
+    def _weight(self, pos: int, text_no: int) -> float:
+        return ORIGIN_WEIGHTS.get(self.texts[pos][text_no][0], 1.0)
+
+    def _hits(self, pos: int, term: str, prefix: bool) -> List[Tuple[int, int, float]]:
+        """Ocorrências (texto, posição, peso) das palavras que casam com o termo no item."""
+        hits = []
+        for word, weight in self.matches(term, prefix).items():
+            for text_no, offset in self.occurrences[word].get(pos, ()):
+                hits.append((text_no, offset, weight))
+        return hits
+
+    def _word_weight(self, pos: int, term: str, prefix: bool) -> float:
+        return max(
+            (self._weight(pos, text_no) * weight for text_no, _, weight in self._hits(pos, term, prefix)),
+            default=0.0,
+        )
+
+    def _clause_weight(self, pos: int, clause: TokenClause) -> float:
+        best = min(
+            (self._word_weight(pos, word, clause.is_prefix(word)) for word in clause.required_words), default=0.0
+        )
+        for phrase in clause.synonyms:
+            if any(pos not in self.occurrences.get(word, {}) for word in phrase):
+                continue
+            starts = self._phrase_starts(pos, phrase) if len(phrase) > 1 else self.occurrences[phrase[0]][pos]
+            for text_no, _ in starts:
+                best = max(best, self._weight(pos, text_no) * SYNONYM_WEIGHT)
+        return best
+
+    def score(self, pos: int, clauses: List[TokenClause], phrase: List[str]) -> float:
+        """Média dos pesos das partes (0-100) mais o bônus de frase ou de proximidade."""
+        if not clauses:
+            return 0.0
+        score = 100.0 * sum(self._clause_weight(pos, clause) for clause in clauses) / len(clauses)
+        if len(phrase) > 1:
+            score += self._proximity_bonus(pos, phrase, any(clause.prefix for clause in clauses))
+        return score
+
+    def _proximity_bonus(self, pos: int, phrase: List[str], prefix: bool) -> float:
+        by_text: Dict[int, List[List[int]]] = {}
+        for i, word in enumerate(phrase):
+            for text_no, offset, _ in self._hits(pos, word, prefix and i == len(phrase) - 1):
+                by_text.setdefault(text_no, [[] for _ in phrase])[i].append(offset)
+
+        best = 0.0
+        required = [i for i, word in enumerate(phrase) if word not in STOPWORDS] or list(range(len(phrase)))
+        for offsets in by_text.values():
+            # Frase exata: cada palavra logo após a anterior
+            if all(offsets):
+                following = [set(o) for o in offsets[1:]]
+                if any(all(start + i in occ for i, occ in enumerate(following, 1)) for start in offsets[0]):
+                    return PHRASE_BONUS
+            if all(offsets[i] for i in required):
+                window = _min_window([offsets[i] for i in required])
+                best = max(best, PROXIMITY_BONUS - (window - len(required)))
+        return max(best, 0.0)
+
+
+def _intersect(sets: Iterable[Set[int]]) -> Set[int]:
+    """Interseção dos conjuntos, da menor lista para a maior."""
+    sets = sorted(sets, key=len)
+    if not sets:
+        return set()
+    result = sets[0]
+    for other in sets[1:]:
+        result = result & other
+        if not result:
+            break
+    return result
+
+
+def _min_window(offsets: List[List[int]]) -> int:
+    """Menor trecho (em palavras) que contém uma ocorrência de cada lista."""
+    events = sorted((offset, i) for i, group in enumerate(offsets) for offset in group)
+    counts = [0] * len(offsets)
+    covered = 0
+    best = None
+    left = 0
+    for offset, i in events:
+        if counts[i] == 0:
+            covered += 1
+        counts[i] += 1
+        while covered == len(offsets):
+            left_offset, j = events[left]
+            span = offset - left_offset + 1
+            best = span if best is None else min(best, span)
+            counts[j] -= 1
+            if counts[j] == 0:
+                covered -= 1
+            left += 1
+    return best if best is not None else 0
@@ -0,0 +1,28 @@
+"""
+Fixtures compartilhadas: a base de dados do repositório carregada uma vez por sessão,
+com os índices de busca registrados (como no app e na API).
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config.settings import DATA_FILE  # noqa: E402
+from services.service_factory import build_services  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def services():
+    return build_services(DATA_FILE)
+
+
+@pytest.fixture(scope="session")
+def search_service(services):
+    return services[1]
+
+
+@pytest.fixture(scope="session")
+def items(services):
+    return services[0].get().items
@@ -0,0 +1,34 @@
+"""
+Varreduras exata e regex no pool de processos da camada assíncrona: o corpus vem do
+índice do próprio snapshot (memória compartilhada) e o resultado é o mesmo da thread.
+"""
+import pytest
+
+from services.async_service import run_query
+from services.parallel_scan import ParallelScanExecutor
+
+
+@pytest.fixture(scope="module")
+def scanner():
+    executor = ParallelScanExecutor(2, min_texts=0)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("search_type, query", [
+    ('exact', None),
+    ('regex', 'assessoria|consultoria'),
+    ('regex', 'tr[aeiou]n'),
+])
+def test_process_scan_matches_thread(services, items, scanner, search_type, query):
+    query = query or items[40]['descricao_item']
+    categoria = items[5]['filtro_principal']
+    for filters in ({}, {'filtro_principal': categoria}):
+        expected = run_query(services, None, query, search_type, False, filters)
+        assert run_query(services, None, query, search_type, False, filters, None, scanner) == expected
+
+
+def test_exact_scan_finds_every_description(services, items, scanner):
+    for pos in (3, 40, 120):
+        positions, _ = run_query(services, None, items[pos]['descricao_item'], 'exact', False, {}, None, scanner)
+        assert pos in positions
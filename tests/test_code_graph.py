@@ -0,0 +1,103 @@
+"""
+Grafo de códigos: vizinhos e itens de cada código (LC116, NBS, cClassTrib e INDOP)
+iguais aos de uma varredura das entradas NBS da base, sem arestas repetidas.
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from services.code_graph import KINDS, CodeGraph
+
+
+def _entry_codes(item, nbs):
+    """(tipo, código) de uma entrada NBS, na ordem em que o grafo os visita."""
+    codes = [('lc116', item['item_lc116'])] if item.get('item_lc116') else []
+    if nbs.get('nbs_code'):
+        codes.append(('nbs', nbs['nbs_code']))
+    if nbs.get('indop'):
+        codes.append(('indop', nbs['indop']))
+    codes += [('cclass', cc['codigo']) for cc in nbs.get('cclasstrib', []) if cc.get('codigo')]
+    return codes
+
+
+def _brute_force(items, kind, code):
+    """Vizinhos (por tipo e primeira aparição na base) e posições dos itens do código."""
+    first_seen = {}
+    neighbors = set()
+    positions = []
+    for pos, item in enumerate(items):
+        if kind == 'lc116' and item.get('item_lc116') == code:
+            positions.append(pos)
+        for nbs in item.get('nbs_entries', []):
+            codes = _entry_codes(item, nbs)
+            for found in codes:
+                first_seen.setdefault(found, len(first_seen))
+            if (kind, code) in codes:
+                neighbors.update(found for found in codes if found != (kind, code))
+                if not positions or positions[-1] != pos:
+                    positions.append(pos)
+    ordered = sorted(neighbors, key=lambda found: (KINDS.index(found[0]), first_seen[found]))
+    return ordered, positions
+
+
+def _sample_codes(items, seed=7):
+    """Os códigos mais frequentes de cada tipo (com arestas repetidas) e alguns sorteados."""
+    counts = {kind: Counter() for kind in KINDS}
+    for item in items:
+        for nbs in item['nbs_entries']:
+            for kind, code in _entry_codes(item, nbs):
+                counts[kind][code] += 1
+    rng = random.Random(seed)
+    sample = []
+    for kind in KINDS:
+        codes = sorted(counts[kind])
+        chosen = [code for code, _ in counts[kind].most_common(2)] + rng.sample(codes, min(3, len(codes)))
+        sample += [(kind, code) for code in dict.fromkeys(chosen)]
+    return sample
+
+
+@pytest.fixture(scope="module")
+def graph(items):
+    return CodeGraph(items)
+
+
+def test_neighbors_and_items_match_brute_force(graph, items):
+    for kind, code in _sample_codes(items):
+        neighbors, positions = _brute_force(items, kind, code)
+        assert graph.neighbors(kind, code) == [found for _, found in neighbors], (kind, code)
+        assert graph.item_positions(kind, code).tolist() == positions, (kind, code)
+        assert graph.degree(kind, code) == len(neighbors)
+        for neighbor_kind in KINDS:
+            expected = [found for other, found in neighbors if other == neighbor_kind]
+            assert graph.neighbors(kind, code, neighbor_kind) == expected
+            assert graph.degree(kind, code, neighbor_kind) == len(expected)
+            assert graph.related(kind, code).get(neighbor_kind, []) == expected
+
+
+def test_repeated_pairs_are_a_single_edge(graph, items):
+    # Um cClassTrib comum aparece em muitas entradas com o mesmo item: uma aresta só
+    for kind, code in _sample_codes(items):
+        neighbors = graph.neighbors(kind, code)
+        assert len(neighbors) == len(set(neighbors)), (kind, code)
+    lc116_cclass = Counter(
+        (item['item_lc116'], cc['codigo']) for item in items for nbs in item['nbs_entries'] for cc in nbs['cclasstrib']
+    )
+    (lc116, codigo), repeats = lc116_cclass.most_common(1)[0]
+    assert repeats > 1
+    assert graph.neighbors('lc116', lc116, 'cclass').count(codigo) == 1
+    assert graph.neighbors('cclass', codigo, 'lc116').count(lc116) == 1
+
+
+def test_edges_are_symmetric(graph):
+    for node in range(len(graph)):
+        kind, code = KINDS[graph.node_kind[node]], graph.node_code[node]
+        for neighbor in graph.indices[graph.indptr[node]:graph.indptr[node + 1]].tolist():
+            other_kind, other_code = KINDS[graph.node_kind[neighbor]], graph.node_code[neighbor]
+            assert code in graph.neighbors(other_kind, other_code, kind)
+
+
+def test_unknown_codes(graph):
+    assert graph.neighbors('nbs', '9.9999.99.99') == []
+    assert graph.item_positions('cclass', '999999').tolist() == []
+    assert graph.related('indop', 'xyz') == {}
@@ -0,0 +1,59 @@
+"""
+Índices por versão no SearchServiceEnhanced: as versões do registro não são descartadas
+(mesmo acima de MAX_CACHED_INDEXES) e os índices auxiliares são montados no primeiro uso.
+"""
+import copy
+
+from services.search_index import SearchIndex
+from services.search_service import SearchServiceEnhanced
+
+
+def _versions(items, count):
+    return {f"V{number}": copy.deepcopy(items[:50]) for number in range(count)}
+
+
+def test_registry_versions_are_not_evicted(items):
+    service = SearchServiceEnhanced()
+    versions = _versions(items, SearchServiceEnhanced.MAX_CACHED_INDEXES + 2)
+    for version, base in versions.items():
+        service.register_index(SearchIndex(base, service.normalize_text), version)
+    indexes = {version: service.get_index(base) for version, base in versions.items()}
+    assert all(index is not None for index in indexes.values())
+
+    # Bases avulsas (sem versão) não tiram as versões do lugar
+    for _ in range(SearchServiceEnhanced.MAX_CACHED_INDEXES + 1):
+        service.build_index(copy.deepcopy(items[:10]))
+    for version, base in versions.items():
+        assert service.search_items(base, 'consultoria', 'tokens') is not None
+        assert service.get_index(base) is indexes[version]
+
+
+def test_auxiliary_indexes_are_built_on_first_use(items):
+    service = SearchServiceEnhanced()
+    base = copy.deepcopy(items[:50])
+    service.defer_index(base, 'V1')
+    assert not service._indexes and not service._tokens and not service._ngrams
+
+    results = service.search_items(base, 'consultoria', 'tokens')
+    index = service.get_index(base)
+    assert index is not None and results
+    assert id(base) in service._tokens
+    assert id(base) not in service._ngrams and id(base) not in service._suffixes
+
+    # Um subconjunto da versão reaproveita o mesmo índice
+    subset = base[10:30]
+    assert service.search_items(subset, 'consultoria', 'tokens') == [
+        item for item in results if any(item is other for other in subset)
+    ]
+    assert len(service._indexes) == 1
+
+
+def test_replacing_a_version_releases_the_old_index(items):
+    service = SearchServiceEnhanced()
+    old, new = copy.deepcopy(items[:20]), copy.deepcopy(items[:20])
+    service.register_index(SearchIndex(old, service.normalize_text), 'V1')
+    service.search_items(old, 'consultoria', 'tokens')
+    service.defer_index(new, 'V1')
+    assert service.get_index(old) is None
+    assert id(old) not in service._tokens
+    assert service.get_index(new) is not None
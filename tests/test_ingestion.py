@@ -0,0 +1,52 @@
+"""
+Ingestão incremental: sem alteração na planilha a base é mantida, mas um cache de
+índice apagado ou desatualizado é regravado.
+"""
+import pytest
+from openpyxl import Workbook
+
+from services.index_cache import index_cache_path, load_index_cache
+from services.ingestion import DEFAULT_SHEET, AnexoIngestor
+
+HEADER = ["Item LC 116", "Descrição Item LC 116", "NBS", "Descrição NBS", "cClassTrib", "Nome cClassTrib"]
+ROWS = [
+    ["01.01", "Análise e desenvolvimento de sistemas.", "1.1502.10.00", "Desenvolvimento de software", 1, "Integral"],
+    ["17.01", "Assessoria ou consultoria.", "1.1401.10.00", "Consultoria empresarial", 1, "Integral"],
+]
+
+
+@pytest.fixture
+def ingestor(tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = DEFAULT_SHEET
+    sheet.append(HEADER)
+    for row in ROWS:
+        sheet.append(row)
+    xlsx_file = tmp_path / "anexo.xlsx"
+    workbook.save(xlsx_file)
+    return AnexoIngestor(xlsx_file, tmp_path / "base.json")
+
+
+def test_unchanged_sheet_keeps_the_base(ingestor):
+    assert ingestor.run()['gravado'] == 1
+    summary = ingestor.run()
+    assert summary['gravado'] == 0 and summary['indice'] == 0
+    assert load_index_cache(ingestor.output_file) is not None
+
+
+@pytest.mark.parametrize("damage", ["delete", "corrupt"])
+def test_missing_or_stale_index_cache_is_rewritten(ingestor, damage):
+    ingestor.run()
+    cache_path = index_cache_path(ingestor.output_file)
+    if damage == "delete":
+        cache_path.unlink()
+    else:
+        cache_path.write_bytes(b"cache antigo")
+    assert load_index_cache(ingestor.output_file) is None
+
+    summary = ingestor.run()
+    assert summary['gravado'] == 0 and summary['indice'] == 1
+    cached = load_index_cache(ingestor.output_file)
+    assert cached is not None
+    assert [item['item_lc116'] for item in cached['index'].items] == ['01.01', '17.01']
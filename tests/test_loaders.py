@@ -0,0 +1,77 @@
+"""
+Carregadores: o JSON em streaming (com blocos pequenos, que cortam chaves e textos ao
+meio), o JSONL e o Parquet produzem a mesma base do json.load; entrada truncada ou
+malformada vira DatasetLoadError.
+"""
+import json
+
+import pytest
+
+from services.loaders import (
+    DatasetLoadError, JsonLoader, JsonlLoader, StreamingJsonLoader, flat_rows, get_loader,
+)
+
+METADATA = {'fonte': 'Anexo VIII "teste".xlsx', 'sheet': 'tabela geral'}
+
+
+@pytest.fixture
+def json_file(tmp_path, items):
+    path = tmp_path / "base.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'fonte': METADATA['fonte'], 'itens': items[:5], 'sheet': METADATA['sheet']},
+                  f, ensure_ascii=False, indent=1)
+    return path
+
+
+@pytest.fixture
+def expected(json_file):
+    return JsonLoader().load(json_file)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 4096])
+def test_streaming_matches_json_load(json_file, expected, chunk_size):
+    assert StreamingJsonLoader(chunk_size).load(json_file) == expected
+
+
+def test_jsonl_matches_json_load(tmp_path, items, expected):
+    path = tmp_path / "base.jsonl"
+    lines = [METADATA] + items[:5]
+    path.write_text("\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + "\n", encoding='utf-8')
+    assert get_loader(path).load(path) == expected
+    assert isinstance(get_loader(path), JsonlLoader)
+
+
+def test_parquet_with_upper_case_suffix_matches_json_load(tmp_path, items, expected):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "base.PARQUET"
+    table = pa.Table.from_pylist(list(flat_rows(items[:5])))
+    pq.write_table(table.replace_schema_metadata(METADATA), path)
+    assert get_loader(path).load(path) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_truncated_json_is_a_load_error(json_file, chunk_size):
+    text = json_file.read_text(encoding='utf-8')
+    for cut in (1, len(text) // 3, len(text) // 2, len(text) - 2):
+        json_file.write_text(text[:cut], encoding='utf-8')
+        with pytest.raises(DatasetLoadError):
+            StreamingJsonLoader(chunk_size).load(json_file)
+
+
+@pytest.mark.parametrize("content", [
+    '{"fonte": "a" "sheet": "b", "itens": []}',
+    '{"fonte": "a"; "itens": []}',
+    '{"itens": [] "fonte": "a"}',
+    '{1: "a", "itens": []}',
+    '{"itens": [{"item_lc116": "01.01"} {"item_lc116": "01.02"}]}',
+    '{"itens": []} x',
+])
+@pytest.mark.parametrize("chunk_size", [2, 4096])
+def test_malformed_json_is_a_load_error(tmp_path, content, chunk_size):
+    path = tmp_path / "base.json"
+    path.write_text(content, encoding='utf-8')
+    with pytest.raises(DatasetLoadError):
+        StreamingJsonLoader(chunk_size).load(path)
+    with pytest.raises(DatasetLoadError):
+        JsonLoader().load(path)
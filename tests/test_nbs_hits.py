@@ -0,0 +1,158 @@
+"""
+Busca por entrada NBS: os acertos do NbsHitIndex são os de uma varredura entrada a
+entrada (palavras, códigos e filtros), e os itens reduzidos por narrow_item exportam
+exatamente as entradas encontradas.
+"""
+import random
+
+import pytest
+
+from services.export_service import iter_export_records
+from services.nbs_hits import (
+    CODE_CONTAINS_SCORE, CODE_PREFIX_SCORE, CODE_WEIGHT, DESCRIPTION_WEIGHT, ITEM_CODE_SCORE,
+    ITEM_FIELD_WEIGHT, narrow_item,
+)
+from services.nbs_table import NbsTable
+from services.search_index import DEFAULT_INDEXED_FIELDS
+from services.token_index import SYNONYM_WEIGHT, tokenize
+
+WORD_QUERIES = ["consultoria", "servicos de ti", "engenharia civil", "transporte", "manuten", "saude", "xyzw"]
+CODE_QUERIES = ["1.1502", "01.05", "1.15", "17.01", "1.1401.10.00", "9.99"]
+
+
+def _filter_options(items):
+    entries = [nbs for item in items for nbs in item['nbs_entries']]
+    return {
+        'filtro_principal': sorted({item['filtro_principal'] for item in items}),
+        'ps_onerosa': ['S', 'N'],
+        'adq_exterior': ['S', 'N'],
+        'local_incidencia': sorted({nbs['local_incidencia_ibs'] for nbs in entries}),
+        'cclasstrib_filter': sorted({cc['codigo'] for nbs in entries for cc in nbs['cclasstrib']})[:6],
+        'tipo_tributacao': ['Tributação Integral', 'Redução', 'Isenção'],
+        'grupo_lc116': ['1', '14', '17'],
+    }
+
+
+def _sampled_filters(items, count=6, seed=3):
+    rng = random.Random(seed)
+    options = _filter_options(items)
+    samples = [{}]
+    for _ in range(count):
+        samples.append({key: rng.choice(values + [None] * 3) for key, values in options.items()})
+    return samples
+
+
+def _entry_words(normalize, item, nbs):
+    """Palavras da entrada por origem, com o peso de cada origem."""
+    fields = {word for field in DEFAULT_INDEXED_FIELDS for word in tokenize(normalize(item.get(field, '')))}
+    return (
+        (set(tokenize(normalize(nbs['descricao_nbs']))), DESCRIPTION_WEIGHT),
+        (set(tokenize(normalize(nbs['nbs_code']))), CODE_WEIGHT),
+        (fields, ITEM_FIELD_WEIGHT),
+    )
+
+
+def _word_weight(origins, matches):
+    """Maior peso (casamento x origem) entre as palavras casadas presentes na entrada."""
+    return max((weight * origin for word, weight in matches.items()
+                for words, origin in origins if word in words), default=0.0)
+
+
+def _brute_word_score(service, tokens, clauses, item, nbs):
+    origins = _entry_words(service.normalize_text, item, nbs)
+    weights = []
+    for clause in clauses:
+        weight = min(_word_weight(origins, tokens.matches(word, clause.is_prefix(word)))
+                     for word in clause.required_words)
+        # Termos de sinônimo: palavras inteiras
+        for phrase in clause.synonyms:
+            exact = min(_word_weight(origins, {word: 1.0}) for word in phrase)
+            weight = max(weight, SYNONYM_WEIGHT * exact)
+        weights.append(weight)
+    if not weights or min(weights) <= 0:
+        return 0.0
+    return 100.0 * sum(weights) / len(weights)
+
+
+def _brute_code_score(service, code, item, nbs):
+    nbs_code = service.normalize_text(nbs['nbs_code'])
+    if nbs_code.startswith(code):
+        return CODE_PREFIX_SCORE
+    if code in nbs_code:
+        return CODE_CONTAINS_SCORE
+    if code in service.normalize_text(item['item_lc116']):
+        return ITEM_CODE_SCORE
+    return 0.0
+
+
+def _brute_force(service, items, query, use_synonyms, filters):
+    """Varredura entrada a entrada: (posição do item, índice da entrada, pontuação) ordenados."""
+    normalized = service.normalize_text(query)
+    is_code, _ = service.is_code_query(query)
+    tokens = service._token_index(service.get_index(items), list(DEFAULT_INDEXED_FIELDS))
+    clauses, _ = service.token_clauses(query, use_synonyms)
+    hits = []
+    for pos, item in enumerate(items):
+        for n, nbs in enumerate(item['nbs_entries']):
+            # Um item reduzido à entrada passa nos filtros exatamente quando a entrada passa
+            if not service.filter_items([narrow_item(item, n)], **filters):
+                continue
+            if is_code:
+                score = _brute_code_score(service, normalized, item, nbs)
+            else:
+                score = _brute_word_score(service, tokens, clauses, item, nbs)
+            if score > 0:
+                hits.append((pos, n, score))
+    hits.sort(key=lambda hit: (-hit[2], hit[0], hit[1]))
+    return hits
+
+
+def _hits(service, items, query, use_synonyms, filters):
+    position = {id(item): pos for pos, item in enumerate(items)}
+    return [(position[id(item)], nbs, score)
+            for item, nbs, score in service.search_nbs(items, query, use_synonyms, filters)]
+
+
+@pytest.mark.parametrize("use_synonyms", [True, False])
+@pytest.mark.parametrize("query", WORD_QUERIES + CODE_QUERIES)
+def test_hits_match_brute_force(search_service, items, query, use_synonyms):
+    for filters in _sampled_filters(items):
+        found = _hits(search_service, items, query, use_synonyms, filters)
+        expected = _brute_force(search_service, items, query, use_synonyms, filters)
+        assert [hit[:2] for hit in found] == [hit[:2] for hit in expected], (query, filters)
+        assert [hit[2] for hit in found] == pytest.approx([hit[2] for hit in expected]), (query, filters)
+
+
+def test_filters_without_query_match_brute_force(search_service, items):
+    for filters in _sampled_filters(items, count=30, seed=11):
+        found = [(pos, nbs) for pos, nbs, _ in _hits(search_service, items, '', True, filters)]
+        expected = [(pos, n) for pos, item in enumerate(items) for n in range(len(item['nbs_entries']))
+                    if search_service.filter_items([narrow_item(item, n)], **filters)]
+        assert found == expected, filters
+
+
+@pytest.mark.parametrize("query, filters", [
+    ("consultoria", {}),
+    ("1.1502", {'ps_onerosa': 'S'}),
+    ("", {'local_incidencia': 'local do imóvel'}),
+])
+def test_narrowed_items_export_only_the_hits(search_service, items, query, filters):
+    hits = search_service.search_nbs(items, query, filters=filters)
+    assert hits
+    narrowed = [narrow_item(item, nbs) for item, nbs, _ in hits]
+    expected = []
+    for item, nbs, _ in hits:
+        # Os registros da entrada dentro da exportação do item completo (um por cClassTrib)
+        sizes = [max(1, len(entry['cclasstrib'])) for entry in item['nbs_entries']]
+        start = sum(sizes[:nbs])
+        expected += list(iter_export_records([item], search_service))[start:start + sizes[nbs]]
+    assert list(iter_export_records(narrowed, search_service)) == expected
+    assert [item['nbs_entries'] for item in narrowed] == [[item['nbs_entries'][nbs]] for item, nbs, _ in hits]
+
+
+def test_table_rows_of_hits_match_narrowed_items(search_service, items):
+    table = NbsTable(items)
+    hits = search_service.search_nbs(items, "consultoria")
+    expected = NbsTable([narrow_item(item, nbs) for item, nbs, _ in hits]).frame
+    # Mesmos valores (as categorias das colunas dependem da tabela de origem)
+    assert table.take_hits(hits).astype(str).equals(expected.astype(str))
@@ -0,0 +1,54 @@
+"""
+Busca por n-gramas: a similaridade combina o texto do item com a descrição NBS mais
+parecida, e descrições NBS curtas não passam à frente do texto do próprio item.
+"""
+import numpy as np
+import pytest
+
+from services.ngram_index import NBS_WEIGHT
+from services.search_index import DEFAULT_INDEXED_FIELDS
+
+
+def _codes(results):
+    return [item['item_lc116'] for item in results]
+
+
+def test_consultoria_ranks_consulting_items_first(search_service, items):
+    codes = _codes(search_service.search_items(items, 'consultoria', 'ngram'))
+    top = codes[:3]
+    assert {'17.01', '01.06'} <= set(top)
+    for other in ('07.01', '07.03', '15.08', '11.02'):
+        if other in codes:
+            assert codes.index(other) > max(codes.index('17.01'), codes.index('01.06'))
+
+
+def test_transportes_ranks_transport_items_first(search_service, items):
+    codes = _codes(search_service.search_items(items, 'transportes', 'ngram'))
+    assert set(codes[:2]) == {'16.01', '16.02'}
+    assert codes.index('10.06') > 1
+
+
+def test_classification_prefers_the_item_description(search_service, items):
+    ranked = search_service.classify_descriptions(items, ['desenvolvimento de software sob encomenda'], 3)[0]
+    codes = [item['item_lc116'] for item, _ in ranked]
+    assert codes[0] == '01.01'
+    scores = [score for _, score in ranked]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("query", ['transportes', 'consultoria', 'limpeza'])
+def test_scores_match_a_per_row_scan(search_service, items, query):
+    ngrams = search_service._ngram_index(search_service.get_index(items), list(DEFAULT_INDEXED_FIELDS))
+    normalized = search_service.normalize_text(query)
+    rows = (ngrams.matrix @ ngrams.vectorize([normalized]).T).toarray().ravel()
+    ends = np.append(ngrams.item_starts[1:], len(rows))
+    expected = {}
+    for pos, (start, end) in enumerate(zip(ngrams.item_starts, ends)):
+        own, nbs = rows[start], max(rows[start + 1:end], default=0.0)
+        # O mínimo de similaridade vale para o texto mais parecido do item (campos ou NBS)
+        if max(own, nbs) >= search_service.ngram_min_similarity:
+            expected[pos] = (1.0 - NBS_WEIGHT) * own + NBS_WEIGHT * nbs
+    found = dict(ngrams.search(normalized))
+    assert found.keys() == expected.keys()
+    for pos, score in found.items():
+        assert score == pytest.approx(expected[pos])
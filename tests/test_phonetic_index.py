@@ -0,0 +1,18 @@
+"""Busca fonética: grafias "como se fala" e palavras digitadas sem acento."""
+import pytest
+
+
+@pytest.mark.parametrize("typed, accented", [
+    ("servico", "serviço"),
+    ("licenca", "licença"),
+    ("seguranca", "segurança"),
+])
+def test_sem_cedilha_encontra_o_mesmo_que_com_cedilha(search_service, items, typed, accented):
+    expected = search_service.search_items(items, accented, "phonetic")
+    assert expected
+    assert search_service.search_items(items, typed, "phonetic") == expected
+
+
+def test_grafia_fonetica(search_service, items):
+    assert search_service.search_items(items, "servisso", "phonetic")
+    assert search_service.search_items(items, "asesoria", "phonetic")
@@ -0,0 +1,66 @@
+"""
+Consulta avançada: termos de campos da entrada NBS ligados por E casam com a mesma
+entrada, e os demais termos continuam valendo para o item inteiro. Termos e frases
+vazios são erros de sintaxe (não casam com a base inteira).
+"""
+import pytest
+
+from services.query_language import QuerySyntaxError, parse_query
+
+
+def _entry_matches(entry, nbs_prefix=None, local=None, cclass_prefix=None):
+    if nbs_prefix and not entry.get('nbs_code', '').startswith(nbs_prefix):
+        return False
+    if local and entry.get('local_incidencia_ibs', '').lower() != local:
+        return False
+    if cclass_prefix and not any(cc.get('codigo', '').startswith(cclass_prefix)
+                                 for cc in entry.get('cclasstrib', [])):
+        return False
+    return True
+
+
+def _codes(results):
+    return sorted(item['item_lc116'] for item in results)
+
+
+def test_entry_fields_match_the_same_entry(search_service, items):
+    results = search_service.search_items(items, 'nbs:1.1502* E local:"local da prestação"', 'boolean')
+    expected = [item for item in items
+                if any(_entry_matches(entry, '1.1502', 'local da prestação') for entry in item['nbs_entries'])]
+    assert _codes(results) == _codes(expected)
+    assert '01.07' not in _codes(results)
+
+
+@pytest.mark.parametrize("query, nbs_prefix, local, cclass_prefix", [
+    ('nbs:1.15* local:"domicílio principal do adquirente"', '1.15', 'domicílio principal do adquirente', None),
+    ('nbs:1.1* E cclass:200*', '1.1', None, '200'),
+    ('cclass:000* E local:"local da prestação"', None, 'local da prestação', '000'),
+])
+def test_conjunction_of_entry_fields(search_service, items, query, nbs_prefix, local, cclass_prefix):
+    results = search_service.search_items(items, query, 'boolean')
+    expected = [item for item in items
+                if any(_entry_matches(entry, nbs_prefix, local, cclass_prefix) for entry in item['nbs_entries'])]
+    assert _codes(results) == _codes(expected)
+
+
+def test_item_fields_and_negation_stay_item_level(search_service, items):
+    results = search_service.search_items(items, 'nbs:1.15* E -local:"local da prestação"', 'boolean')
+    expected = [item for item in items
+                if any(_entry_matches(entry, '1.15') for entry in item['nbs_entries'])
+                and not any(_entry_matches(entry, local='local da prestação') for entry in item['nbs_entries'])]
+    assert _codes(results) == _codes(expected)
+
+
+@pytest.mark.parametrize("query", [
+    'consultoria -', '- consultoria', '""', '" "', 'consultoria "', 'lc:""', '. ', '**', 'nbs:*',
+])
+def test_empty_terms_are_syntax_errors(search_service, items, query):
+    with pytest.raises(QuerySyntaxError):
+        parse_query(query)
+    assert search_service.validate_boolean(query)
+    assert search_service.search_items(items, query, 'boolean') == []
+
+
+@pytest.mark.parametrize("query", ['consultoria -locação', '"de"', 'cclass:200* saúde', '*a'])
+def test_valid_queries_still_parse(search_service, query):
+    assert search_service.validate_boolean(query) is None
@@ -0,0 +1,45 @@
+"""Planejador de consultas: o plano escolhido devolve o mesmo que busca seguida de filtros."""
+import random
+
+import pytest
+
+QUERIES = [
+    "processamento de d", "servicos de", "ti", "01.0", "1.1502", "manutencao ar condicionado",
+    "desenvolvimento software", "limpeza predio", "consultoria contabil", "frete", "servicos medicos",
+]
+SEARCH_TYPES = ["contains", "exact", "tokens", "nbs", "phonetic", "ngram", "fuzzy"]
+
+
+def filter_options(items):
+    nbs_entries = [nbs for item in items for nbs in item.get('nbs_entries', [])]
+    return {
+        'filtro_principal': sorted({item['filtro_principal'] for item in items})[:4],
+        'subcategoria': sorted({item['subcategoria'] for item in items})[:4],
+        'ps_onerosa': ['S', 'N'],
+        'local_incidencia': sorted({nbs['local_incidencia_ibs'] for nbs in nbs_entries})[:3],
+        'tipo_tributacao': ['Tributação Integral', 'Redução'],
+        'grupo_lc116': ['1', '7', '14'],
+    }
+
+
+@pytest.mark.parametrize("search_type", SEARCH_TYPES)
+def test_plano_igual_a_busca_sem_plano(search_service, items, search_type):
+    rng = random.Random(search_type)
+    options = filter_options(items)
+    for _ in range(25):
+        query = rng.choice(QUERIES)
+        filters = {key: rng.choice(values + [None, None]) for key, values in options.items()}
+        plan = search_service.plan_query(items, query, search_type, True, filters)
+        expected = search_service.filter_items(
+            search_service.search_items(items, query, search_type),
+            **{key: value for key, value in filters.items() if value}
+        )
+        assert search_service.execute_plan(plan) == expected, (query, filters, plan.strategy)
+
+
+def test_refinamento_igual_a_busca_completa(search_service, items):
+    previous = search_service.search_items(items, "consult", "contains")
+    positions = search_service.get_index(items).positions_of(previous)
+    assert search_service.can_refine("consult", "consultoria", "contains", True)
+    plan = search_service.plan_query(items, "consultoria", "contains", True, {}, candidates=positions)
+    assert search_service.execute_plan(plan) == search_service.search_items(items, "consultoria", "contains")
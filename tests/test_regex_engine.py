@@ -0,0 +1,95 @@
+"""
+Busca regex: padrões com risco de backtracking catastrófico são rejeitados, e o
+pré-filtro pelos literais obrigatórios (trigramas) dá o mesmo resultado da varredura
+completa da base.
+"""
+import pytest
+
+from services.regex_engine import (
+    MAX_PATTERN_LENGTH, MAX_UNBOUNDED_REPEATS, SCORE_ITEM_FIELD, SCORE_NBS_FIELD, RegexEngine,
+    RegexQueryError, compile_query,
+)
+from services.search_index import DEFAULT_INDEXED_FIELDS
+
+FIELDS = list(DEFAULT_INDEXED_FIELDS)
+
+
+@pytest.mark.parametrize("pattern", ['(a+)+', '(ab*)*c', '(x+y?)+z', '(?:a{2,3})+', '(?:a*){2,5}'])
+def test_nested_quantifiers_are_rejected(pattern):
+    with pytest.raises(RegexQueryError, match="aninhados"):
+        compile_query(pattern)
+
+
+@pytest.mark.parametrize("pattern", ['(ab|cd)+', '(?:consultoria|assessoria)*', '(x(ab|cd))+', '(a|aa){2,4}'])
+def test_alternation_inside_repeats_is_rejected(pattern):
+    with pytest.raises(RegexQueryError, match="Alternativas"):
+        compile_query(pattern)
+
+
+def test_too_many_unbounded_repeats_are_rejected():
+    allowed = '.*'.join(['a'] * (MAX_UNBOUNDED_REPEATS + 1))
+    compile_query(allowed)
+    with pytest.raises(RegexQueryError, match="ilimitados"):
+        compile_query(allowed + '.+b')
+    with pytest.raises(RegexQueryError, match="ilimitados"):
+        compile_query('a+b*c+')
+
+
+@pytest.mark.parametrize("pattern", [r'(a)\1', r'(?P<x>ab)(?P=x)', r'(a)?(?(1)b|c)'])
+def test_backreferences_are_rejected(pattern):
+    with pytest.raises(RegexQueryError, match="Referências"):
+        compile_query(pattern)
+
+
+@pytest.mark.parametrize("pattern", ['a{1,500}', 'x' * (MAX_PATTERN_LENGTH + 1), '(consult', '[a-'])
+def test_long_and_invalid_patterns_are_rejected(pattern):
+    with pytest.raises(RegexQueryError):
+        compile_query(pattern)
+
+
+@pytest.mark.parametrize("pattern", [
+    'consult.*ria', '(assessoria|consultoria)', 'a{2,5}', '(ab)?c', 'tr[aeiou]n',
+    # Alternativas de um caractere viram uma classe ([ab]), sem retrocesso
+    '(a|b)+',
+])
+def test_safe_patterns_are_accepted(pattern):
+    assert compile_query(pattern).compiled is not None
+
+
+PATTERNS = [
+    'consultoria', 'assessoria|consultoria', r'desenvolv\w+ de (programas|sistemas)', 'tr[aeiou]n',
+    'engenharia.*civil', '^(servicos|servico) de', '(ab)?consult', 'cons?ultoria', r'1\.15', 'Saúde',
+    'x{0,3}informatica', 'TRANSPORTE', '(?=consul)cons', 'manuten(cao|coes)', 'l[io]mpeza|conserva',
+    r'\bti\b', '(?:processamento){1,2} de dados', 'xyzw',
+]
+
+
+@pytest.fixture(scope="module")
+def engine(search_service, items):
+    return RegexEngine(search_service.get_index(items), time_budget_ms=60_000)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_prefilter_matches_full_scan(engine, pattern):
+    query = compile_query(pattern)
+    full, truncated = engine.scan(query, FIELDS, range(len(engine.index)), SCORE_ITEM_FIELD, SCORE_NBS_FIELD)
+    assert not truncated
+    assert engine.search(pattern, FIELDS) == (full, False)
+
+    candidates = engine.candidate_positions(query, FIELDS)
+    if candidates is not None:
+        assert {pos for pos, _ in full} <= candidates
+
+
+def test_prefilter_narrows_the_scan(engine):
+    for pattern in ('consultoria', 'assessoria|consultoria', 'manuten(cao|coes)'):
+        candidates = engine.candidate_positions(compile_query(pattern), FIELDS)
+        assert candidates is not None and len(candidates) < len(engine.index)
+
+
+@pytest.mark.parametrize("pattern", ['consultoria', 'tr[aeiou]n', 'engenharia.*civil'])
+def test_prefilter_matches_full_scan_on_subsets(engine, pattern):
+    positions = list(range(len(engine.index)))[::-3]
+    query = compile_query(pattern)
+    full, _ = engine.scan(query, FIELDS, positions, SCORE_ITEM_FIELD, SCORE_NBS_FIELD)
+    assert engine.search(pattern, FIELDS, positions) == (full, False)
@@ -0,0 +1,89 @@
+"""Backend SQLite: os tipos de busca que ele atende dão os mesmos resultados da busca em memória."""
+import random
+import shutil
+
+import pytest
+
+from config.settings import DATA_FILE
+from services.service_factory import build_services
+from services.sqlite_backend import SQLITE_SEARCH_TYPES, build_sqlite_database, open_sqlite_backend
+
+QUERIES = [
+    "consultoria", "processamento de d", "saude", "ti", "01.05", "1.1502", "servicos de",
+    "engenharia", "xyzw", "Manutenção",
+]
+
+
+@pytest.fixture(scope="module")
+def data_file(tmp_path_factory, search_service, items):
+    path = tmp_path_factory.mktemp("sqlite") / DATA_FILE.name
+    shutil.copy(DATA_FILE, path)
+    build_sqlite_database(path, items, search_service)
+    return path
+
+
+@pytest.fixture(scope="module")
+def backend(data_file, search_service, items):
+    opened = open_sqlite_backend(data_file, search_service, items)
+    assert opened is not None
+    return opened
+
+
+def sampled_queries(search_service, items, count=40, seed=2):
+    rng = random.Random(seed)
+    words = [word for item in items for word in search_service.normalize_text(item['descricao_item']).split()]
+    return [" ".join(rng.sample(words, 2))[:rng.randint(3, 12)] for _ in range(count)]
+
+
+@pytest.mark.parametrize("search_type", SQLITE_SEARCH_TYPES)
+@pytest.mark.parametrize("use_synonyms", [True, False])
+def test_busca_igual_a_em_memoria(backend, search_service, items, search_type, use_synonyms):
+    for query in QUERIES + sampled_queries(search_service, items):
+        expected = search_service.search_items(items, query, search_type, use_synonyms=use_synonyms)
+        found = backend.search_items(items, query, search_type, use_synonyms=use_synonyms)
+        assert found == expected, query
+
+
+@pytest.mark.parametrize("search_type", SQLITE_SEARCH_TYPES)
+def test_busca_em_subconjunto(backend, search_service, items, search_type):
+    subset = items[::3]
+    for query in QUERIES:
+        expected = search_service.search_items(subset, query, search_type)
+        assert backend.search_items(subset, query, search_type) == expected, query
+
+
+def test_filtros_iguais_aos_em_memoria(backend, search_service, items):
+    rng = random.Random(5)
+    nbs_entries = [nbs for item in items for nbs in item.get('nbs_entries', [])]
+    options = {
+        'filtro_principal': sorted({item['filtro_principal'] for item in items}),
+        'ps_onerosa': ['S', 'N'],
+        'local_incidencia': sorted({nbs['local_incidencia_ibs'] for nbs in nbs_entries}),
+        'cclasstrib_filter': sorted({cc['codigo'] for nbs in nbs_entries for cc in nbs['cclasstrib']})[:8],
+        'tipo_tributacao': ['Tributação Integral', 'Redução', 'Isenção'],
+        'grupo_lc116': ['1', '14', '17'],
+    }
+    for _ in range(100):
+        filters = {key: rng.choice(values + [None, None]) for key, values in options.items()}
+        assert backend.filter_items(items, **filters) == search_service.filter_items(items, **filters), filters
+
+
+def test_build_services_adia_os_indices_em_memoria(data_file, search_service, items):
+    registry, service = build_services(data_file, backend="sqlite")
+    base = registry.get().items
+    assert service._backend is not None and not service._indexes
+
+    def codes(service, base, query, search_type, filters):
+        plan = service.plan_query(base, query, search_type, filters=filters)
+        return [item['item_lc116'] for item in service.execute_plan(plan)]
+
+    for search_type in SQLITE_SEARCH_TYPES:
+        for filters in ({}, {'ps_onerosa': 'S'}, {'grupo_lc116': '17'}):
+            for query in QUERIES:
+                expected = codes(search_service, items, query, search_type, filters)
+                assert codes(service, base, query, search_type, filters) == expected, (query, filters)
+    assert not service._indexes and not service._tokens
+
+    # Tipo fora do SQLite: os índices da base são montados no primeiro uso
+    assert service.search_items(base, 'consultoria', 'tokens')
+    assert service.get_index(base) is not None and id(base) in service._tokens
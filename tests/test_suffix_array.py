@@ -0,0 +1,65 @@
+"""Array de sufixos: mesmas ocorrências de uma varredura com str.find e mesma busca "contém"."""
+import random
+
+import pytest
+
+from services.search_index import DEFAULT_INDEXED_FIELDS
+from services.search_service import SearchServiceEnhanced
+from services.suffix_array import SuffixArrayIndex
+
+QUERIES = ["processamento de d", "de ", "a", "consult", "ao de servi", "1.0", "01.0", "xyz", "manutencao e", "s d"]
+
+
+@pytest.fixture(scope="module")
+def suffixes(search_service, items):
+    return SuffixArrayIndex(search_service.get_index(items), DEFAULT_INDEXED_FIELDS)
+
+
+def sampled_queries(buffer, count=200, seed=3):
+    """Trechos (de 1 a 12 caracteres) tirados dos próprios textos, inclusive entre palavras."""
+    rng = random.Random(seed)
+    texts = [text for text in buffer.split('\x00') if len(text) > 5]
+    queries = []
+    for _ in range(count):
+        text = rng.choice(texts)
+        start = rng.randrange(len(text) - 3)
+        queries.append(text[start:start + rng.randint(1, 12)])
+    return queries
+
+
+def find_all(buffer, literal):
+    offsets = []
+    offset = buffer.find(literal)
+    while offset != -1:
+        offsets.append(offset)
+        offset = buffer.find(literal, offset + 1)
+    return offsets
+
+
+def test_ocorrencias_iguais_as_de_str_find(suffixes):
+    for literal in QUERIES + sampled_queries(suffixes.buffer):
+        assert suffixes.find(literal).tolist() == find_all(suffixes.buffer, literal), literal
+
+
+def test_lcp_dos_sufixos_vizinhos(suffixes):
+    buffer, order = suffixes.buffer, suffixes.suffixes
+    for i in random.Random(1).sample(range(1, len(order)), 2000):
+        previous, current = buffer[order[i - 1]:], buffer[order[i]:]
+        common = 0
+        while (common < min(len(previous), len(current)) and previous[common] == current[common]
+               and previous[common] != '\x00'):
+            common += 1
+        assert suffixes.lcp[i] == common
+        # Até a sentinela (cada sentinela ordena como um caractere distinto)
+        assert previous.split('\x00', 1)[0] <= current.split('\x00', 1)[0]
+
+
+@pytest.mark.parametrize("use_synonyms", [True, False])
+def test_busca_contem_igual_a_varredura(search_service, items, suffixes, use_synonyms):
+    # Sem índice registrado, a busca "contém" percorre os itens testando `in` campo a campo
+    scan = SearchServiceEnhanced()
+    for query in QUERIES + sampled_queries(suffixes.buffer, count=60, seed=7):
+        if len(query.strip()) < 2:
+            continue
+        expected = scan.search_items(items, query, "contains", use_synonyms=use_synonyms)
+        assert search_service.search_items(items, query, "contains", use_synonyms=use_synonyms) == expected, query
@@ -0,0 +1,43 @@
+"""
+Busca por palavras: palavras curtas e termos de sinônimo casam inteiros, e só a última
+palavra digitada casa também com o início de palavras.
+"""
+import pytest
+
+from services.token_index import PREFIX_MIN_LENGTH, tokenize
+
+
+def _codes(results):
+    return [item['item_lc116'] for item in results]
+
+
+@pytest.mark.parametrize("use_synonyms", [True, False])
+def test_short_token_is_not_expanded(search_service, items, use_synonyms):
+    results = search_service.search_items(items, 'ti', 'tokens', use_synonyms=use_synonyms)
+    literal = search_service.search_items(items, 'ti', 'tokens', use_synonyms=False)
+    for item in literal:
+        words = [w for text in [item['descricao_item']] + [n['descricao_nbs'] for n in item['nbs_entries']]
+                 for w in tokenize(search_service.normalize_text(text))]
+        assert 'ti' in words
+    assert not {'15.11', '15.15', '14.10', '19.01'} & set(_codes(results))
+
+
+@pytest.mark.parametrize("use_synonyms", [True, False])
+def test_servicos_de_ti_ranks_information_technology_first(search_service, items, use_synonyms):
+    codes = _codes(search_service.search_items(items, 'servicos de ti', 'tokens', use_synonyms=use_synonyms))
+    assert codes[:2] == ['01.06', '01.07']
+    assert not {'15.11', '15.15', '14.10', '19.01'} & set(codes)
+
+
+def test_only_last_token_is_a_prefix(search_service, items):
+    # "engen" incompleta no fim casa com "engenharia"; no meio, só inteira ou pelo radical
+    assert _codes(search_service.search_items(items, 'agronomia engen', 'tokens', use_synonyms=False)) == ['07.01']
+    assert search_service.search_items(items, 'engen agronomia', 'tokens', use_synonyms=False) == []
+
+
+def test_short_tokens_match_whole_words_in_nbs_search(search_service, items):
+    for item, nbs, _ in search_service.search_nbs(items, 'ti', use_synonyms=False):
+        entry = item['nbs_entries'][nbs]
+        words = tokenize(search_service.normalize_text(entry['descricao_nbs'] + ' ' + item['descricao_item']))
+        assert 'ti' in words
+    assert PREFIX_MIN_LENGTH == 3